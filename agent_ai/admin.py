@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib import messages
-from .models import Manual, Resposta
+from .models import AudioGerado, Manual, Resposta, Tarefa, TurnoTicket
 from .embedding import gerar_embeddings
 import json
 
@@ -28,3 +28,21 @@ class RespostaAdmin(admin.ModelAdmin):
                 resposta.save(update_fields=["embedding"])  # Evita chamar `save()` completo
                 count += 1
         self.message_user(request, f"{count} embeddings gerados com sucesso.", messages.SUCCESS)
+
+@admin.register(Tarefa)
+class TarefaAdmin(admin.ModelAdmin):
+    list_display = ["id", "tipo", "manual", "status", "tentativas", "created_at", "concluida_em"]
+    list_filter = ["status", "tipo"]
+    readonly_fields = ["resultado", "erro", "worker", "iniciada_em", "concluida_em"]
+
+@admin.register(TurnoTicket)
+class TurnoTicketAdmin(admin.ModelAdmin):
+    list_display = ["id_ticket", "ordem", "assunto", "pergunta", "canonico", "updated_at"]
+    search_fields = ["assunto", "pergunta", "resposta"]
+    list_filter = ["updated_at"]
+
+@admin.register(AudioGerado)
+class AudioGeradoAdmin(admin.ModelAdmin):
+    list_display = ["nome_arquivo", "idioma", "lento", "caracteres", "tamanho_bytes", "created_at", "ultimo_acesso"]
+    list_filter = ["idioma", "lento"]
+    readonly_fields = ["hash_texto", "nome_arquivo"]
@@ -1,6 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .api_views import ManualViewSet, RespostaViewSet, AgenteAIViewSet, ManualProcessadoViewSet, ImagemManualViewSet
+from .api_views import ManualViewSet, RespostaViewSet, AgenteAIViewSet, ManualProcessadoViewSet, ImagemManualViewSet, TarefaViewSet
+from .views import audio_mensagem, retomar_stream
 
 # Router para as ViewSets
 router = DefaultRouter()
@@ -9,6 +10,7 @@ router.register(r'respostas', RespostaViewSet, basename='resposta')
 router.register(r'agente', AgenteAIViewSet, basename='agente')
 router.register(r'manuais-processados', ManualProcessadoViewSet, basename='manual-processado')
 router.register(r'imagens-manual', ImagemManualViewSet, basename='imagem-manual')
+router.register(r'tarefas', TarefaViewSet, basename='tarefa')
 
 # URLs da API
 api_urlpatterns = [
@@ -20,6 +22,8 @@ compat_urlpatterns = [
     # Mantém endpoints existentes para compatibilidade
     path('perguntar/', AgenteAIViewSet.as_view({'post': 'perguntar'}), name='api_perguntar'),
     path('perguntar/stream/', AgenteAIViewSet.as_view({'post': 'perguntar_stream'}), name='api_perguntar_stream'),
+    path('perguntar/stream/retomar/', retomar_stream, name='api_retomar_stream'),
+    path('mensagens/<int:mensagem_id>/audio/', audio_mensagem, name='api_audio_mensagem'),
 ]
 
 urlpatterns = api_urlpatterns + compat_urlpatterns
\ No newline at end of file
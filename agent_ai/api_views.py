@@ -1,19 +1,20 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.http import StreamingHttpResponse
+from rest_framework.reverse import reverse
 from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiExample
 from drf_spectacular.openapi import AutoSchema
-from .models import Manual, Resposta, ManualProcessado, ImagemManual
+from .models import Manual, Resposta, ManualProcessado, ImagemManual, Tarefa
 from .serializers import (
     ManualSerializer, RespostaSerializer, PerguntaSerializer,
     RespostaAgentSerializer, StreamResponseSerializer,
-    BuscarManualSerializer, BuscarRespostaSerializer
-)
-from .views import (
-    buscar_manual, buscar_resposta, perguntar_spart, 
-    perguntar_spart_stream
+    BuscarManualSerializer, BuscarRespostaSerializer, TarefaSerializer,
+    TarefaEnfileiradaSerializer
 )
+from .views import buscar_resposta, retomar_stream
+from .tarefas import TIPOS, enfileirar
+from .pipeline import CENTRAL_AJUDA, PipelinePergunta, pipeline_padrao
+from .sse import resposta_sse
 import json
 
 class ManualViewSet(viewsets.ReadOnlyModelViewSet):
@@ -27,34 +28,38 @@ class ManualViewSet(viewsets.ReadOnlyModelViewSet):
     
     @extend_schema(
         summary="Buscar conteúdo do manual",
-        description="Extrai o conteúdo de um manual específico e gera embeddings para busca vetorial.",
-        responses={200: BuscarManualSerializer, 404: 'Manual não encontrado', 500: 'Erro ao processar manual'},
+        description=(
+            "Enfileira a extração do conteúdo do manual e a geração de embeddings. "
+            "Retorna imediatamente (202) com o id da tarefa; o andamento é consultado em /api/tarefas/{id}/. "
+            "Use `tipo='processar_manual'` para gerar também o manual processado com imagens."
+        ),
+        request=None,
+        responses={202: TarefaEnfileiradaSerializer, 400: 'Tipo de tarefa inválido', 404: 'Manual não encontrado'},
         examples=[
             OpenApiExample(
-                'Sucesso',
+                'Tarefa enfileirada',
                 value={
-                    'mensagem': 'Resposta gerada com sucesso!',
-                    'content': 'Conteúdo extraído do manual...',
-                    'embeddings': [0.1, 0.2, 0.3, '...']
+                    'tarefa_id': 42,
+                    'status': 'pendente',
+                    'status_url': '/api/tarefas/42/'
                 }
             )
         ]
     )
     @action(detail=True, methods=['post'])
     def buscar_conteudo(self, request, pk=None):
-        """Busca e processa o conteúdo de um manual específico."""
-        try:
-            # Reutiliza a função existente
-            response = buscar_manual(request, pk)
-            if hasattr(response, 'content'):
-                data = json.loads(response.content)
-                return Response(data, status=response.status_code)
-            return response
-        except Exception as e:
-            return Response(
-                {'erro': f'Erro interno: {str(e)}'}, 
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+        """Enfileira a busca e o processamento do conteúdo de um manual."""
+        manual = self.get_object()
+        tipo = request.data.get('tipo', 'buscar_manual')
+        if tipo not in TIPOS:
+            return Response({'erro': f'Tipo de tarefa inválido: {tipo}'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        tarefa = enfileirar(tipo, manual=manual)
+        return Response({
+            'tarefa_id': tarefa.id,
+            'status': tarefa.status,
+            'status_url': reverse('tarefa-detail', args=[tarefa.id], request=request)
+        }, status=status.HTTP_202_ACCEPTED)
     
     @extend_schema(
         summary="Buscar resposta por query",
@@ -119,7 +124,7 @@ class AgenteAIViewSet(viewsets.ViewSet):
         
         O agente utiliza:
         - Busca vetorial para encontrar contexto relevante
-        - GPT-3.5-turbo para gerar respostas contextualizadas
+        - GPT (gpt-4o-mini) para gerar respostas contextualizadas
         - Geração automática de áudio (quando possível)
         
         **Fluxo de processamento:**
@@ -172,134 +177,17 @@ class AgenteAIViewSet(viewsets.ViewSet):
         serializer = PerguntaSerializer(data=request.data)
         if serializer.is_valid():
             try:
-                from .views import (
-                    buscar_contexto_relevante, obter_ou_criar_conversa, 
-                    salvar_mensagem, client
-                )
-                from .utils import criar_audio, validar_texto_audio
-                
-                pergunta = serializer.validated_data['pergunta']
-                session_id = serializer.validated_data.get('session_id')
-                
-                # Obtém ou cria conversa
-                conversa = obter_ou_criar_conversa(session_id)
-                
-                # Salva a pergunta do usuário
-                salvar_mensagem(conversa, 'pergunta', pergunta)
-                
-                # Busca contexto relevante
-                contexto, similaridade = buscar_contexto_relevante(pergunta)
-                
-                # Obtém contexto de memória da conversa
-                contexto_memoria = conversa.get_contexto_memoria(limite=6)
-                
-                if contexto and similaridade > 0.4:
-                    # Obtém o conteúdo do contexto (pode ser ManualProcessado ou Resposta)
-                    if hasattr(contexto, 'conteudo_markdown'):
-                        # É um ManualProcessado
-                        conteudo_contexto = contexto.conteudo_markdown[:1500]
-                        fonte_contexto = f"Manual: {contexto.titulo}"
-                        url_manual = contexto.url_original
-                        # Obtém imagens relacionadas ao manual
-                        imagens_relacionadas = list(contexto.imagens.all()[:5])  # Máximo 5 imagens
-                    else:
-                        # É uma Resposta
-                        conteudo_contexto = contexto.content[:1500]
-                        fonte_contexto = f"Manual: {contexto.manual.title}"
-                        url_manual = contexto.manual.url
-                        imagens_relacionadas = []
-                    
-                    # Verifica se há imagens disponíveis para mencionar na resposta
-                    tem_imagens = len(imagens_relacionadas) > 0
-                    instrucao_imagens = "- Se houver referências a imagens no contexto (<!-- image:id -->), mencione que existem imagens ilustrativas disponíveis" if not tem_imagens else "- Mencione que há imagens ilustrativas disponíveis que complementam a explicação"
-                    
-                    prompt = f"""Você é o Spartacus AI, assistente especializado no sistema Spartacus ERP.
-                    
-INSTRUÇÕES:
-                    - Use APENAS as informações do contexto fornecido
-                    - Seja claro, objetivo e didático
-                    - Organize a resposta em passos numerados quando apropriado
-                    - Não repita informações desnecessariamente
-                    - Mantenha um tom profissional e amigável
-                    - Considere o histórico da conversa para dar continuidade
-                    {instrucao_imagens}
-                    
-                    CONTEXTO DO SISTEMA ({fonte_contexto}): {conteudo_contexto}
-                    
-                    HISTÓRICO DA CONVERSA:
-                    {contexto_memoria}
-                    
-                    PERGUNTA ATUAL: {pergunta}
-                    
-                    RESPOSTA (seja conciso e direto):"""
-                else:
-                    url_manual = None
-                    prompt = f"""Você é o Spartacus AI, assistente do sistema Spartacus ERP.
-                    
-                    HISTÓRICO DA CONVERSA:
-                    {contexto_memoria}
-                    
-                    O usuário perguntou: "{pergunta}"
-                    
-                    Responda de forma educada que você não encontrou informações específicas sobre essa pergunta na base de conhecimento atual. Sugira que consulte a central de ajuda oficial do Spartacus.
-                    
-                    Seja breve e direto:"""
-                
-                response = client.chat.completions.create(
-                    model="gpt-3.5-turbo",
-                    messages=[
-                        {"role": "system", "content": "Você é um assistente especializado em ERP Spartacus. Seja sempre conciso, claro e evite repetições."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    max_tokens=400,
-                    temperature=0.3
+                payload = pipeline_padrao.responder(
+                    serializer.validated_data['pergunta'],
+                    serializer.validated_data.get('session_id')
                 )
-                
-                resposta_gpt = response.choices[0].message.content.strip()
-                
-                # Salva a resposta na conversa
-                salvar_mensagem(
-                    conversa, 
-                    'resposta', 
-                    resposta_gpt, 
-                    resposta_relacionada=contexto,
-                    similaridade=similaridade
-                )
-                
-                # Gera áudio da resposta (TEMPORARIAMENTE DESABILITADO PARA PERFORMANCE)
-                audio_url = None
-                # if resposta_gpt:
-                #     valido, texto_limpo = validar_texto_audio(resposta_gpt)
-                #     if valido:
-                #         audio_url = criar_audio(texto_limpo)
-                
-                # Prepara informações das imagens para o frontend
-                imagens_info = []
-                if contexto and hasattr(contexto, 'conteudo_markdown') and imagens_relacionadas:
-                    for imagem in imagens_relacionadas:
-                        imagens_info.append({
-                            'url': imagem.get_url_servida(),
-                            'alt_text': imagem.alt_text,
-                            'nome_arquivo': imagem.nome_arquivo,
-                            'ordem': imagem.ordem
-                        })
-                
-                return JsonResponse({
-                    'resposta': resposta_gpt,
-                    'similaridade': float(similaridade),
-                    'manual': url_manual if contexto else None,
-                    'feedback': 'Resposta gerada com IA baseada no conhecimento do sistema.',
-                    'audio_url': audio_url,
-                    'session_id': str(conversa.session_id),
-                    'imagens': imagens_info
-                })
-                
+                return Response(payload)
             except Exception as e:
                 return Response(
                     {
                         'resposta': 'Desculpe, ocorreu um erro ao processar sua pergunta.',
                         'erro': str(e),
-                        'central': 'Caso precise de ajuda, consulte: https://spartacus.movidesk.com/kb/'
+                        'central': f'Caso precise de ajuda, consulte: {CENTRAL_AJUDA}'
                     },
                     status=status.HTTP_500_INTERNAL_SERVER_ERROR
                 )
@@ -317,21 +205,30 @@ INSTRUÇÕES:
         - Ideal para interfaces interativas
         
         **Formato da resposta:**
-        - Content-Type: text/plain
-        - Formato: Server-Sent Events (SSE)
-        - Cada chunk contém JSON com 'content' ou 'done'
+        - Content-Type: text/event-stream
+        - Formato: Server-Sent Events (SSE), com `id` sequencial por evento
+        - Tokens agrupados em frames curtos; cada evento contém JSON com 'content' ou 'done'
+        - Comentários `: keep-alive` periódicos enquanto o modelo não responde
+        - Reconexão: reenviar o `session_id` com o header `Last-Event-ID` retoma a
+          resposta do ponto em que parou, sem nova chamada ao modelo
         
         **Exemplo de stream:**
         ```
-        data: {"content": "Para fazer"}
-        data: {"content": " backup no"}
+        retry: 3000
+        
+        id: 1
+        data: {"content": "Para fazer backup no"}
+        
+        id: 2
         data: {"content": " sistema..."}
+        
+        id: 3
         data: {"done": true, "similaridade": 0.85}
         ```
         """,
         request=PerguntaSerializer,
         responses={
-            200: 'Stream de dados (text/plain)',
+            200: 'Stream de dados (text/event-stream)',
             400: 'Pergunta inválida',
             500: 'Erro interno do servidor'
         },
@@ -346,11 +243,19 @@ INSTRUÇÕES:
     @action(detail=False, methods=['post'])
     def perguntar_stream(self, request):
         """Endpoint com streaming para respostas em tempo real."""
+        # Reconexão de um cliente que já recebeu parte da resposta (mesmo fluxo da view simples)
+        if request.headers.get('Last-Event-ID'):
+            return retomar_stream(request._request)
+
         serializer = PerguntaSerializer(data=request.data)
         if serializer.is_valid():
             try:
-                # Reutiliza a função existente de streaming
-                return perguntar_spart_stream(request)
+                canal = pipeline_padrao.responder_stream(
+                    serializer.validated_data['pergunta'],
+                    serializer.validated_data.get('session_id'),
+                    audio_em_frases=serializer.validated_data.get('audio_frases', False)
+                )
+                return resposta_sse(canal.iterar())
             except Exception as e:
                 return Response(
                     {'error': f'Erro no streaming: {str(e)}'}, 
@@ -398,14 +303,14 @@ INSTRUÇÕES:
             },
             'features': [
                 'Busca vetorial com embeddings',
-                'Integração GPT-3.5-turbo',
+                f'Integração {PipelinePergunta.modelo}',
                 'Geração de áudio automática',
                 'Streaming de respostas em tempo real',
                 'Processamento de manuais web'
             ],
             'models': {
                 'embedding': 'text-embedding-ada-002',
-                'chat': 'gpt-3.5-turbo'
+                'chat': PipelinePergunta.modelo
             }
         })
 
@@ -534,16 +439,21 @@ class ImagemManualViewSet(viewsets.ReadOnlyModelViewSet):
         
         class ImagemManualSerializer(serializers.ModelSerializer):
             url_servida = serializers.SerializerMethodField()
+            url_miniatura = serializers.SerializerMethodField()
             manual_titulo = serializers.CharField(source='manual_processado.titulo', read_only=True)
             
             def get_url_servida(self, obj):
                 return obj.get_url_servida()
             
+            def get_url_miniatura(self, obj):
+                return obj.get_url_miniatura()
+            
             class Meta:
                 model = ImagemManual
                 fields = ['id', 'manual_processado', 'manual_titulo', 'url_original', 
                          'nome_arquivo', 'alt_text', 'ordem', 'tamanho_bytes',
-                         'url_servida', 'created_at']
+                         'largura', 'altura', 'variantes',
+                         'url_servida', 'url_miniatura', 'created_at']
         
         return ImagemManualSerializer
     
@@ -592,4 +502,45 @@ class ImagemManualViewSet(viewsets.ReadOnlyModelViewSet):
             })
             
         except ManualProcessado.DoesNotExist:
-            return Response({'erro': 'Manual não encontrado'}, status=404)
\ No newline at end of file
+            return Response({'erro': 'Manual não encontrado'}, status=404)
+
+class TarefaViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    ViewSet para acompanhar as tarefas em segundo plano.
+    
+    Tarefas são criadas ao cadastrar manuais ou via `buscar_conteudo` e
+    executadas pelo comando `worker_tarefas`.
+    """
+    queryset = Tarefa.objects.all().order_by('-created_at')
+    serializer_class = TarefaSerializer
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        for campo in ('status', 'tipo', 'manual'):
+            valor = self.request.query_params.get(campo)
+            if valor:
+                queryset = queryset.filter(**{campo: valor})
+        return queryset
+    
+    @extend_schema(
+        summary="Listar tarefas",
+        description="Lista as tarefas em segundo plano. Aceita os filtros `status`, `tipo` e `manual`.",
+        parameters=[
+            OpenApiParameter(name='status', description='pendente, executando, concluida ou falhou', required=False, type=str),
+            OpenApiParameter(name='tipo', description='buscar_manual ou processar_manual', required=False, type=str),
+            OpenApiParameter(name='manual', description='ID do manual', required=False, type=int),
+        ]
+    )
+    def list(self, request, *args, **kwargs):
+        manual = request.query_params.get('manual')
+        if manual and not manual.isdigit():
+            return Response({'erro': 'Parâmetro manual deve ser o ID numérico do manual'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return super().list(request, *args, **kwargs)
+    
+    @extend_schema(
+        summary="Status da tarefa",
+        description="Retorna o status, tentativas, resultado e erro de uma tarefa."
+    )
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
@@ -0,0 +1,22 @@
+"""Utilitários para arquivos gravados por temporário + rename atômico."""
+import os
+
+from django.conf import settings
+
+# Lida uma única vez: os.umask() só consulta alterando, o que não é seguro entre threads
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def permissoes_padrao(caminho):
+    """Aplica ao arquivo as permissões de um arquivo comum.
+
+    Temporários (tempfile) nascem com 0600, e o rename mantém o modo: sem
+    isso, um servidor separado (ex.: nginx servindo /media/) não consegue ler
+    o arquivo final. Usa FILE_UPLOAD_PERMISSIONS, como o default_storage, ou
+    a umask do processo quando não há configuração.
+    """
+    modo = getattr(settings, 'FILE_UPLOAD_PERMISSIONS', None) if settings.configured else None
+    if modo is None:
+        modo = 0o666 & ~_UMASK
+    os.chmod(caminho, modo)
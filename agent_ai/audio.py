@@ -0,0 +1,415 @@
+"""Áudios das respostas (gTTS) endereçados pelo texto.
+
+O arquivo de um texto é `audio/<sha256(idioma, lento, texto)>.mp3`: a mesma
+resposta falada duas vezes usa o mesmo arquivo, sem nova síntese. Cada
+arquivo gerado fica registrado em AudioGerado, e os acessos aos já existentes
+vão para `acessos_audio`, base da retenção (agent_ai.retencao).
+
+As sínteses das respostas rodam na `fila_audio`: poucas threads fixas
+consumindo uma fila limitada, com o status de cada trabalho gravado na
+Mensagem correspondente. Em respostas com streaming, AudioEmFrases pede o
+áudio de cada frase assim que ela termina de chegar.
+"""
+import hashlib
+import logging
+import os
+import queue
+import tempfile
+import threading
+import unicodedata
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.utils import timezone
+from gtts import gTTS
+
+from agent_ai.arquivos import permissoes_padrao
+from agent_ai.frases import SegmentadorFrases, texto_falavel
+from agent_ai.models import AudioGerado, Mensagem
+from agent_ai.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Diretório (relativo ao MEDIA_ROOT) dos áudios
+DIRETORIO_AUDIO = 'audio'
+IDIOMA_PADRAO = 'pt-br'
+# Textos maiores não são sintetizados (o gTTS faz uma requisição a cada ~100 caracteres)
+MAX_CARACTERES_AUDIO = 5000
+# Sínteses simultâneas e trabalhos aguardando na fila; acima disso o pedido é recusado
+MAX_WORKERS_AUDIO = 2
+MAX_FILA_AUDIO = 100
+# Tempo máximo que um stream fica aberto, depois do texto, esperando os áudios das frases
+TIMEOUT_AUDIO_FRASES = 60
+
+# Pedidos simultâneos do mesmo texto esperam uma única síntese
+_sinteses_em_voo = SingleFlight()
+
+
+def normalizar_texto_audio(texto):
+    """Forma canônica do texto falado: Unicode NFC e espaços colapsados."""
+    return ' '.join(unicodedata.normalize('NFC', texto or '').split())
+
+
+def chave_audio(texto, lang=IDIOMA_PADRAO, slow=False):
+    """Hash que identifica o áudio de (texto, idioma, velocidade); o texto já deve estar normalizado."""
+    return hashlib.sha256(f"{lang}\0{int(bool(slow))}\0{texto}".encode('utf-8')).hexdigest()
+
+
+class RegistroAcessos:
+    """Chaves dos áudios acessados desde a última gravação do índice.
+
+    Um acesso não custa uma escrita no banco: a limpeza grava todos de uma
+    vez (agent_ai.retencao.registrar_acessos).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._chaves = set()
+
+    def registrar(self, chave):
+        with self._lock:
+            primeiro = not self._chaves
+            self._chaves.add(chave)
+        if primeiro:
+            _agendar_limpeza()
+
+    def retirar(self):
+        """Devolve as chaves acumuladas e começa um novo registro."""
+        with self._lock:
+            chaves, self._chaves = self._chaves, set()
+        return chaves
+
+
+acessos_audio = RegistroAcessos()
+
+
+def _agendar_limpeza():
+    # Import tardio: agent_ai.retencao depende deste módulo
+    from agent_ai.retencao import agendador_limpeza
+    agendador_limpeza.iniciar()
+
+
+def nome_audio(chave):
+    return f"{DIRETORIO_AUDIO}/{chave}.mp3"
+
+
+def caminho_audio(nome):
+    return os.path.join(settings.MEDIA_ROOT, nome)
+
+
+def url_audio(nome):
+    return f"{settings.MEDIA_URL}{nome}"
+
+
+def _sintetizar(texto, lang, slow, chave):
+    nome = nome_audio(chave)
+    destino = caminho_audio(nome)
+    # Outra execução pode ter gerado o arquivo enquanto esta aguardava
+    if os.path.exists(destino):
+        acessos_audio.registrar(chave)
+        return url_audio(nome)
+
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    tmp = tempfile.NamedTemporaryFile(dir=os.path.dirname(destino), prefix='.gerando-', suffix='.mp3', delete=False)
+    try:
+        with tmp:
+            gTTS(text=texto, lang=lang, slow=slow).write_to_fp(tmp)
+        permissoes_padrao(tmp.name)
+        # 🔹 Rename atômico: quem vê o arquivo vê o MP3 completo
+        os.replace(tmp.name, destino)
+    finally:
+        if os.path.exists(tmp.name):
+            os.remove(tmp.name)
+    # O processo que gera áudios também limpa os antigos
+    _agendar_limpeza()
+
+    # O arquivo já está pronto: falha no registro (ex.: SQLite bloqueado por
+    # outra síntese) não invalida o áudio
+    try:
+        AudioGerado.objects.update_or_create(
+            hash_texto=chave,
+            defaults={
+                'nome_arquivo': nome,
+                'idioma': lang,
+                'lento': bool(slow),
+                'caracteres': len(texto),
+                'tamanho_bytes': os.path.getsize(destino),
+                'ultimo_acesso': timezone.now(),
+            },
+        )
+    except DatabaseError as e:
+        # Registrado na próxima gravação dos acessos
+        logger.warning(f"Áudio {nome} gerado, mas não registrado: {e}")
+        acessos_audio.registrar(chave)
+    return url_audio(nome)
+
+
+def obter_audio(texto, lang=IDIOMA_PADRAO, slow=False):
+    """URL do áudio do texto, sintetizando só se ainda não existir. None para texto vazio."""
+    texto = normalizar_texto_audio(texto)
+    if not texto:
+        return None
+    chave = chave_audio(texto, lang, slow)
+    nome = nome_audio(chave)
+    if os.path.exists(caminho_audio(nome)):
+        acessos_audio.registrar(chave)
+        return url_audio(nome)
+    return _sinteses_em_voo.executar(chave, lambda: _sintetizar(texto, lang, slow, chave))
+
+
+class FilaAudioCheia(Exception):
+    """A fila de síntese atingiu o limite; o pedido não foi aceito."""
+
+
+class TrabalhoAudio:
+    """Síntese de um texto, compartilhada por todas as mensagens com esse texto."""
+
+    def __init__(self, chave, texto, lang, slow):
+        self.chave = chave
+        self.texto = texto
+        self.lang = lang
+        self.slow = slow
+        self.status = Mensagem.AUDIO_PENDENTE
+        self.url = None
+        self.erro = ''
+        self.mensagens = set()
+        self.callbacks = []
+        self._concluido = threading.Event()
+
+    @property
+    def concluido(self):
+        return self._concluido.is_set()
+
+    def aguardar(self, timeout=None):
+        """Espera o fim da síntese; True se terminou dentro do timeout."""
+        return self._concluido.wait(timeout)
+
+    def _concluir(self, url, erro=''):
+        self.url = url
+        self.erro = erro
+        self.status = Mensagem.AUDIO_PRONTO if url else Mensagem.AUDIO_FALHOU
+        self._concluido.set()
+
+
+class FilaAudio:
+    """Pool limitado de threads de síntese alimentado por uma fila.
+
+    Pedidos do mesmo texto (mesma chave) enquanto a síntese está na fila ou
+    em andamento recebem o mesmo TrabalhoAudio. Textos que já têm arquivo
+    são concluídos na hora, sem passar pela fila.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS_AUDIO, max_fila=MAX_FILA_AUDIO):
+        self.max_workers = max_workers
+        self._fila = queue.Queue(maxsize=max_fila)
+        self._lock = threading.Lock()
+        self._trabalhos = {}
+        self._workers = []
+
+    def _iniciar_workers(self):
+        """Sobe as threads na primeira síntese. Requer o lock."""
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(target=self._executar, name=f"audio-{len(self._workers) + 1}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def trabalho(self, chave):
+        """Trabalho na fila ou em andamento para a chave, ou None."""
+        with self._lock:
+            return self._trabalhos.get(chave)
+
+    def enfileirar(self, texto, lang=IDIOMA_PADRAO, slow=False, mensagem_id=None, callback=None):
+        """Pede o áudio do texto. Retorna o TrabalhoAudio, ou None se o texto não pode ser falado.
+
+        `callback(url)` é chamado ao fim da síntese (url None em caso de falha).
+        Levanta FilaAudioCheia se a fila estiver no limite.
+        """
+        texto = normalizar_texto_audio(texto)
+        if not texto or len(texto) > MAX_CARACTERES_AUDIO:
+            return None
+        chave = chave_audio(texto, lang, slow)
+
+        nome = nome_audio(chave)
+        if os.path.exists(caminho_audio(nome)):
+            acessos_audio.registrar(chave)
+            trabalho = TrabalhoAudio(chave, texto, lang, slow)
+            if mensagem_id is not None:
+                trabalho.mensagens.add(mensagem_id)
+            self._concluir(trabalho, url_audio(nome), '', [callback] if callback else [])
+            return trabalho
+
+        with self._lock:
+            trabalho = self._trabalhos.get(chave)
+            if trabalho is None:
+                trabalho = TrabalhoAudio(chave, texto, lang, slow)
+                try:
+                    self._fila.put_nowait(trabalho)
+                except queue.Full:
+                    raise FilaAudioCheia(f"Fila de áudio cheia ({self._fila.maxsize} trabalhos)")
+                self._trabalhos[chave] = trabalho
+                self._iniciar_workers()
+            if mensagem_id is not None:
+                trabalho.mensagens.add(mensagem_id)
+            if callback:
+                trabalho.callbacks.append(callback)
+        return trabalho
+
+    def _executar(self):
+        while True:
+            trabalho = self._fila.get()
+            try:
+                trabalho.status = Mensagem.AUDIO_GERANDO
+                with self._lock:
+                    mensagens = list(trabalho.mensagens)
+                Mensagem.objects.filter(id__in=mensagens).update(audio_status=Mensagem.AUDIO_GERANDO)
+                try:
+                    url, erro = obter_audio(trabalho.texto, trabalho.lang, trabalho.slow), ''
+                except Exception as e:
+                    logger.error(f"Erro ao sintetizar áudio: {e}")
+                    url, erro = None, str(e)
+                # Pedidos que chegarem depois daqui já encontram o arquivo pronto
+                with self._lock:
+                    del self._trabalhos[trabalho.chave]
+                    callbacks = list(trabalho.callbacks)
+                self._concluir(trabalho, url, erro, callbacks)
+            except Exception as e:
+                logger.error(f"Erro no worker de áudio: {e}")
+            finally:
+                self._fila.task_done()
+                connections.close_all()
+
+    def _concluir(self, trabalho, url, erro, callbacks):
+        """Grava o resultado nas mensagens, libera quem aguarda o trabalho e chama os callbacks."""
+        if trabalho.mensagens:
+            # Antes de liberar os leitores: quem acordar já encontra a mensagem atualizada
+            Mensagem.objects.filter(id__in=trabalho.mensagens).update(
+                audio_status=Mensagem.AUDIO_PRONTO if url else Mensagem.AUDIO_FALHOU, audio_url=url or ''
+            )
+        trabalho._concluir(url, erro)
+        for callback in callbacks:
+            try:
+                callback(trabalho.url)
+            except Exception as e:
+                logger.error(f"Erro no callback de áudio: {e}")
+
+    def pedir_para_mensagem(self, mensagem, lang=IDIOMA_PADRAO, slow=False):
+        """Enfileira o áudio da mensagem e grava o status inicial nela. Retorna o trabalho ou None."""
+        try:
+            trabalho = self.enfileirar(mensagem.conteudo, lang, slow, mensagem_id=mensagem.id)
+        except FilaAudioCheia as e:
+            logger.warning(f"Áudio da mensagem {mensagem.id} não foi pedido: {e}")
+            trabalho = None
+        if trabalho is None:
+            mensagem.audio_status, mensagem.audio_url = Mensagem.AUDIO_INDISPONIVEL, ''
+        else:
+            mensagem.audio_status, mensagem.audio_url = trabalho.status, trabalho.url or ''
+        if not trabalho or not trabalho.concluido:
+            # Concluídos já foram gravados por _concluir
+            Mensagem.objects.filter(id=mensagem.id, audio_status='').update(audio_status=mensagem.audio_status)
+        return trabalho
+
+    def trabalho_da_mensagem(self, mensagem, lang=IDIOMA_PADRAO, slow=False):
+        """Trabalho em andamento da mensagem; reenfileira pedidos perdidos (ex.: reinício do processo).
+
+        Mensagens que nunca tiveram o áudio pedido (respostas faladas frase a
+        frase no streaming) são sintetizadas inteiras aqui, sob demanda.
+        """
+        texto = normalizar_texto_audio(mensagem.conteudo)
+        trabalho = self.trabalho(chave_audio(texto, lang, slow))
+        if trabalho is None and mensagem.audio_status in ('', Mensagem.AUDIO_PENDENTE, Mensagem.AUDIO_GERANDO):
+            trabalho = self.pedir_para_mensagem(mensagem, lang, slow)
+        return trabalho
+
+
+fila_audio = FilaAudio()
+
+
+class AudioEmFrases:
+    """Áudio de uma resposta em streaming, frase a frase.
+
+    Cada frase completa vai para a fila de síntese na hora, então a frase
+    N+1 é sintetizada enquanto a N toca. `publicar` recebe um evento
+    `{'audio': {'ordem', 'url', 'status'}}` por frase, assim que o áudio dela
+    fica pronto (fora de ordem se for o caso; o cliente toca pela `ordem`).
+    """
+
+    def __init__(self, publicar, fila=None, lang=IDIOMA_PADRAO, slow=False, timeout=TIMEOUT_AUDIO_FRASES):
+        self.publicar = publicar
+        self.fila = fila or fila_audio
+        self.lang = lang
+        self.slow = slow
+        self.timeout = timeout
+        self.segmentador = SegmentadorFrases()
+        self.total = 0
+        self._lock = threading.Lock()
+        self._pendentes = 0
+        self._texto_encerrado = False
+        self._ao_concluir = None
+
+    def adicionar(self, texto):
+        """Recebe mais um pedaço da resposta; frases completas são pedidas à fila."""
+        for frase in self.segmentador.adicionar(texto):
+            self._pedir(frase)
+
+    def encerrar_texto(self):
+        """Fim da resposta: pede o áudio do texto restante. Retorna o total de frases com áudio."""
+        with self._lock:
+            if self._texto_encerrado:
+                return self.total
+            self._texto_encerrado = True
+        for frase in self.segmentador.finalizar():
+            self._pedir(frase)
+        return self.total
+
+    def quando_concluir(self, callback):
+        """Chama `callback` uma vez, quando todos os áudios tiverem saído (ou no timeout)."""
+        self.encerrar_texto()
+        with self._lock:
+            if self._ao_concluir is not None:
+                return
+            self._ao_concluir = callback
+            concluido = self._pendentes == 0
+        if concluido:
+            self._concluir()
+        else:
+            temporizador = threading.Timer(self.timeout, self._concluir)
+            temporizador.daemon = True
+            temporizador.start()
+
+    def _concluir(self):
+        with self._lock:
+            callback, self._ao_concluir = self._ao_concluir, False
+        if callback:
+            callback()
+
+    def _publicar_audio(self, ordem, url, status):
+        with self._lock:
+            # Áudio que chegou depois do timeout: o stream já foi encerrado
+            encerrado = self._ao_concluir is False
+        if not encerrado:
+            self.publicar({'audio': {'ordem': ordem, 'url': url, 'status': status}})
+        with self._lock:
+            self._pendentes -= 1
+            concluido = self._pendentes == 0 and self._ao_concluir
+        if concluido:
+            self._concluir()
+
+    def _pedir(self, frase):
+        texto = texto_falavel(frase)
+        if not texto:
+            return
+        with self._lock:
+            ordem = self.total
+            self.total += 1
+            self._pendentes += 1
+
+        def pronto(url):
+            self._publicar_audio(ordem, url, Mensagem.AUDIO_PRONTO if url else Mensagem.AUDIO_FALHOU)
+
+        try:
+            trabalho = self.fila.enfileirar(texto, self.lang, self.slow, callback=pronto)
+        except FilaAudioCheia as e:
+            logger.warning(f"Áudio da frase {ordem} não foi pedido: {e}")
+            trabalho = None
+        if trabalho is None:
+            self._publicar_audio(ordem, None, Mensagem.AUDIO_INDISPONIVEL)
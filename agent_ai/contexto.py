@@ -0,0 +1,59 @@
+import re
+
+# Tamanho do texto de contexto enviado ao modelo e quantidade de imagens
+# guardadas por manual para acompanhar a resposta
+MAX_CHARS_CONTEXTO = 1500
+MAX_IMAGENS_CONTEXTO = 10
+
+INSTRUCAO_COM_IMAGENS = "- Mencione que há imagens ilustrativas disponíveis que complementam a explicação"
+INSTRUCAO_SEM_IMAGENS = "- Se houver referências a imagens no contexto (<!-- image:N -->, com N a ordem da imagem no manual), mencione que existem imagens ilustrativas disponíveis"
+
+# Seção "## Imagens do Manual" adicionada pelo manual_converter ao fim do markdown
+_RE_SECAO_IMAGENS = re.compile(r'\n+## Imagens do Manual\n.*\Z', re.S)
+_RE_IMAGEM_MARKDOWN = re.compile(r'!\[([^\]]*)\]\([^)]*\)')
+_RE_ESPACOS = re.compile(r'[ \t\r\f\v]+')
+_RE_QUEBRAS = re.compile(r'\s*\n\s*\n\s*')
+
+
+def limpar_texto_contexto(texto, max_chars=MAX_CHARS_CONTEXTO):
+    """Compacta o texto do manual para o prompt: sem lista de imagens, URLs ou espaços repetidos."""
+    texto = _RE_SECAO_IMAGENS.sub('', texto or '')
+    texto = _RE_IMAGEM_MARKDOWN.sub(lambda m: f"[imagem: {m.group(1) or 'Imagem'}]", texto)
+    texto = _RE_ESPACOS.sub(' ', texto)
+    texto = _RE_QUEBRAS.sub('\n\n', texto).strip()
+    if len(texto) > max_chars:
+        # Corta no último espaço para não partir palavras
+        texto = texto[:max_chars].rsplit(' ', 1)[0]
+    return texto
+
+
+def montar_bloco_contexto(fonte, texto):
+    """Bloco pronto para entrar no prompt, com a fonte e o texto já limpo."""
+    return f"CONTEXTO DO SISTEMA ({fonte}): {limpar_texto_contexto(texto)}"
+
+
+def descrever_imagem(imagem):
+    """Descritor de uma ImagemManual enviado ao frontend junto com a resposta.
+
+    `url` é a imagem original (usada ao ampliar); `thumbnail` e `srcset`
+    apontam para as variantes WebP, bem menores, exibidas no chat.
+    """
+    from agent_ai.miniaturas import srcset, url_variante
+
+    url = imagem.arquivo_imagem.url if imagem.arquivo_imagem else None
+    variantes = imagem.variantes or []
+    return {
+        'url': url,
+        'thumbnail': url_variante(variantes[0]) if variantes else url,
+        'srcset': srcset(variantes),
+        'largura': imagem.largura,
+        'altura': imagem.altura,
+        'alt_text': imagem.alt_text,
+        'nome_arquivo': imagem.nome_arquivo,
+        'ordem': imagem.ordem
+    }
+
+
+def instrucao_imagens(imagens):
+    """Instrução do prompt sobre as imagens disponíveis."""
+    return INSTRUCAO_COM_IMAGENS if imagens else INSTRUCAO_SEM_IMAGENS
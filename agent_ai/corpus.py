@@ -0,0 +1,305 @@
+"""Corpus de conversas em JSON Lines: um registro por linha, só acrescentado.
+
+O arquivo pode ser texto puro (.jsonl) ou comprimido (.jsonl.gz / .jsonl.zst).
+Nos comprimidos, cada registro é um membro gzip (ou frame zstd) independente:
+o arquivo continua válido para `zcat`/`zstdcat` e um registro pode ser lido
+sozinho a partir do seu offset.
+
+Ao lado do corpus fica um índice pequeno (`<arquivo>.idx`, linhas
+"<id>\\t<offset>") com o offset da versão mais recente de cada registro.
+Registros atualizados são acrescentados de novo; a última versão vale.
+"""
+import gzip
+import json
+import os
+import tempfile
+import zlib
+
+from agent_ai.arquivos import permissoes_padrao
+
+# zstd é opcional; sem o pacote, só .jsonl e .jsonl.gz
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CHAVE_PADRAO = 'id_ticket'
+TAMANHO_BLOCO = 64 * 1024
+
+
+class ErroCorpus(Exception):
+    """Arquivo de corpus inválido ou formato não suportado."""
+
+
+def compressao(caminho):
+    """'gzip', 'zstd' ou None, pela extensão do arquivo."""
+    if caminho.endswith('.gz'):
+        return 'gzip'
+    if caminho.endswith('.zst'):
+        if zstandard is None:
+            raise ErroCorpus("Arquivos .zst precisam do pacote zstandard (pip install zstandard)")
+        return 'zstd'
+    return None
+
+
+def caminho_indice(caminho):
+    return f"{caminho}.idx"
+
+
+def _codificar(registro):
+    return (json.dumps(registro, ensure_ascii=False) + '\n').encode('utf-8')
+
+
+def _novo_descompressor(tipo):
+    if tipo == 'gzip':
+        return zlib.decompressobj(wbits=31)
+    return zstandard.ZstdDecompressor().decompressobj()
+
+
+def _membros(arquivo, tipo):
+    """(offset, bytes) de cada membro gzip / frame zstd, lendo o arquivo em blocos."""
+    descompressor = _novo_descompressor(tipo)
+    saida = []
+    inicio = posicao = 0
+    pendente = b''
+    while True:
+        if not pendente:
+            pendente = arquivo.read(TAMANHO_BLOCO)
+            if not pendente:
+                break
+        saida.append(descompressor.decompress(pendente))
+        if descompressor.eof:
+            resto = descompressor.unused_data
+            posicao += len(pendente) - len(resto)
+            yield inicio, b''.join(saida)
+            inicio, pendente, saida = posicao, resto, []
+            descompressor = _novo_descompressor(tipo)
+        else:
+            posicao += len(pendente)
+            pendente = b''
+    if posicao > inicio:
+        raise ErroCorpus("Corpus comprimido truncado (último registro incompleto)")
+
+
+def _linhas(caminho):
+    """(offset, linha em bytes) de cada registro do corpus, em ordem."""
+    tipo = compressao(caminho)
+    with open(caminho, 'rb') as arquivo:
+        if tipo is None:
+            offset = 0
+            for linha in arquivo:
+                if linha.strip():
+                    yield offset, linha
+                offset += len(linha)
+            return
+        for offset, dados in _membros(arquivo, tipo):
+            for linha in dados.splitlines():
+                if linha.strip():
+                    yield offset, linha
+
+
+def formato_legado(caminho):
+    """True se o arquivo é o array JSON antigo (primeiro caractere útil é '[')."""
+    if compressao(caminho) is not None:
+        return False
+    with open(caminho, 'rb') as arquivo:
+        for linha in arquivo:
+            if linha.strip():
+                return linha.lstrip().startswith(b'[')
+    return False
+
+
+def ler_json_legado(caminho):
+    """Lê o formato antigo (um array JSON indentado). Carrega o arquivo inteiro."""
+    with open(caminho, encoding='utf-8') as f:
+        yield from json.load(f)
+
+
+def ler(caminho):
+    """Todos os registros do corpus, em streaming (inclui versões antigas de registros atualizados).
+
+    O array JSON legado também é aceito.
+    """
+    if formato_legado(caminho):
+        yield from ler_json_legado(caminho)
+        return
+    for _, linha in _linhas(caminho):
+        yield json.loads(linha)
+
+
+def ler_atuais(caminho, chave=CHAVE_PADRAO):
+    """Só a versão mais recente de cada registro, na ordem em que aparecem pela última vez.
+
+    Duas passadas em streaming: a primeira guarda apenas a posição da última
+    versão de cada chave; a segunda devolve esses registros.
+    """
+    if formato_legado(caminho):
+        yield from {registro[chave]: registro for registro in ler_json_legado(caminho)}.values()
+        return
+    ultima = {}
+    for posicao, registro in enumerate(ler(caminho)):
+        ultima[registro[chave]] = posicao
+    for posicao, registro in enumerate(ler(caminho)):
+        if ultima[registro[chave]] == posicao:
+            yield registro
+
+
+class Indice:
+    """Offset da versão mais recente de cada registro (chave -> offset no arquivo)."""
+
+    def __init__(self, caminho, chave=CHAVE_PADRAO):
+        self.caminho = caminho
+        self.chave = chave
+        self.offsets = {}
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __contains__(self, valor):
+        return str(valor) in self.offsets
+
+    def desatualizado(self):
+        indice = caminho_indice(self.caminho)
+        if not os.path.exists(self.caminho):
+            return False
+        return not os.path.exists(indice) or os.path.getmtime(indice) < os.path.getmtime(self.caminho)
+
+    def carregar(self):
+        """Lê o índice do disco, reconstruindo-o se estiver ausente ou mais antigo que o corpus."""
+        if self.desatualizado():
+            return self.reconstruir()
+        self.offsets = {}
+        if os.path.exists(caminho_indice(self.caminho)):
+            with open(caminho_indice(self.caminho), encoding='utf-8') as f:
+                for linha in f:
+                    valor, _, offset = linha.rstrip('\n').rpartition('\t')
+                    if valor:
+                        self.offsets[valor] = int(offset)
+        return self
+
+    def reconstruir(self):
+        """Refaz o índice percorrendo o corpus."""
+        self.offsets = {}
+        if os.path.exists(self.caminho):
+            for offset, linha in _linhas(self.caminho):
+                self.offsets[str(json.loads(linha)[self.chave])] = offset
+        self.salvar()
+        return self
+
+    def salvar(self):
+        diretorio = os.path.dirname(os.path.abspath(self.caminho))
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=diretorio, delete=False, suffix='.tmp') as tmp:
+            tmp.writelines(f"{valor}\t{offset}\n" for valor, offset in self.offsets.items())
+        permissoes_padrao(tmp.name)
+        os.replace(tmp.name, caminho_indice(self.caminho))
+
+    def offset(self, valor):
+        return self.offsets.get(str(valor))
+
+
+def buscar(caminho, valor, chave=CHAVE_PADRAO, indice=None):
+    """Registro com a chave `valor` lido direto do seu offset, sem percorrer o corpus. None se não existe."""
+    if indice is None:
+        indice = Indice(caminho, chave).carregar()
+    offset = indice.offset(valor)
+    if offset is None:
+        return None
+    tipo = compressao(caminho)
+    with open(caminho, 'rb') as arquivo:
+        arquivo.seek(offset)
+        if tipo is None:
+            return json.loads(arquivo.readline())
+        for _, dados in _membros(arquivo, tipo):
+            registros = [json.loads(linha) for linha in dados.splitlines() if linha.strip()]
+            # O membro pode ter mais de um registro: vale o último com a chave
+            return next((r for r in reversed(registros) if str(r[chave]) == str(valor)), None)
+    return None
+
+
+class EscritorCorpus:
+    """Acrescenta registros ao corpus e mantém o índice em dia.
+
+    Uso:
+        with EscritorCorpus('conversas_movidesk.jsonl.gz') as escritor:
+            escritor.gravar({'id_ticket': 1, ...})
+    """
+
+    def __init__(self, caminho, chave=CHAVE_PADRAO):
+        self.caminho = caminho
+        self.chave = chave
+        self.tipo = compressao(caminho)
+        self._compressor = zstandard.ZstdCompressor(level=3) if self.tipo == 'zstd' else None
+        self.indice = None
+        self._arquivo = None
+        self._arquivo_indice = None
+        self._novos_no_indice = []
+
+    def __enter__(self):
+        self.indice = Indice(self.caminho, self.chave).carregar()
+        self._arquivo = open(self.caminho, 'ab')
+        self._arquivo_indice = open(caminho_indice(self.caminho), 'a', encoding='utf-8')
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+    def _comprimir(self, dados):
+        if self.tipo == 'gzip':
+            return gzip.compress(dados, mtime=0)
+        if self.tipo == 'zstd':
+            return self._compressor.compress(dados)
+        return dados
+
+    def gravar(self, registro):
+        offset = self._arquivo.tell()
+        self._arquivo.write(self._comprimir(_codificar(registro)))
+        valor = str(registro[self.chave])
+        self.indice.offsets[valor] = offset
+        self._novos_no_indice.append(f"{valor}\t{offset}\n")
+
+    def gravar_varios(self, registros):
+        total = 0
+        for registro in registros:
+            self.gravar(registro)
+            total += 1
+        return total
+
+    def descarregar(self):
+        """Garante no disco o que foi gravado (corpus antes do índice)."""
+        self._arquivo.flush()
+        os.fsync(self._arquivo.fileno())
+        self._arquivo_indice.writelines(self._novos_no_indice)
+        self._arquivo_indice.flush()
+        self._novos_no_indice = []
+
+    def fechar(self):
+        if self._arquivo is None:
+            return
+        self.descarregar()
+        self._arquivo.close()
+        self._arquivo_indice.close()
+        self._arquivo = None
+
+
+def gravar_corpus(caminho, registros, chave=CHAVE_PADRAO):
+    """Substitui o corpus pelos registros (escrita num temporário + rename atômico). Retorna o total."""
+    diretorio = os.path.dirname(os.path.abspath(caminho))
+    # Mesmo sufixo do destino, para usar a mesma compressão
+    fd, temporario = tempfile.mkstemp(dir=diretorio, prefix='.gravando-', suffix=os.path.basename(caminho))
+    os.close(fd)
+    permissoes_padrao(temporario)
+    try:
+        with EscritorCorpus(temporario, chave) as escritor:
+            total = escritor.gravar_varios(registros)
+        os.replace(temporario, caminho)
+        os.replace(caminho_indice(temporario), caminho_indice(caminho))
+    finally:
+        for resto in (temporario, caminho_indice(temporario)):
+            if os.path.exists(resto):
+                os.remove(resto)
+    return total
+
+
+def compactar(caminho, destino=None, chave=CHAVE_PADRAO):
+    """Reescreve o corpus só com a versão mais recente de cada registro."""
+    return gravar_corpus(destino or caminho, ler_atuais(caminho, chave), chave)
@@ -0,0 +1,166 @@
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Limites padrão por host: requisições simultâneas e intervalo mínimo entre
+# o início de duas requisições ao mesmo host
+MAX_CONEXOES_POR_HOST = 4
+INTERVALO_MINIMO_POR_HOST = 0.1
+
+# Retentativas com backoff exponencial (0.5s, 1s, 2s...) para falhas transitórias
+TENTATIVAS = 3
+FATOR_BACKOFF = 0.5
+STATUS_RETENTAVEIS = (429, 500, 502, 503, 504)
+TIMEOUT_PADRAO = 30
+
+HEADERS_NAVEGADOR = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'pt-BR,pt;q=0.9,en;q=0.8',
+}
+
+
+class LimitadorHost:
+    """Limita a concorrência e a taxa de requisições por host.
+
+    Seguro para uso a partir de várias threads; cada host tem seu próprio
+    semáforo e seu próprio relógio de intervalo mínimo.
+    """
+
+    def __init__(self, max_conexoes=MAX_CONEXOES_POR_HOST, intervalo_minimo=INTERVALO_MINIMO_POR_HOST):
+        self.max_conexoes = max_conexoes
+        self.intervalo_minimo = intervalo_minimo
+        self._lock = threading.Lock()
+        self._semaforos = {}
+        self._proxima_liberacao = {}
+
+    def _semaforo(self, host):
+        with self._lock:
+            if host not in self._semaforos:
+                self._semaforos[host] = threading.BoundedSemaphore(self.max_conexoes)
+            return self._semaforos[host]
+
+    def _reservar_horario(self, host):
+        """Reserva o próximo horário livre do host e devolve quanto esperar."""
+        with self._lock:
+            agora = time.monotonic()
+            horario = max(agora, self._proxima_liberacao.get(host, agora))
+            self._proxima_liberacao[host] = horario + self.intervalo_minimo
+            return horario - agora
+
+    @contextmanager
+    def aguardar(self, url):
+        """Bloqueia até a requisição para `url` poder ser feita."""
+        host = urlparse(url).netloc
+        semaforo = self._semaforo(host)
+        with semaforo:
+            espera = self._reservar_horario(host)
+            if espera > 0:
+                time.sleep(espera)
+            yield
+
+
+limitador_padrao = LimitadorHost()
+
+
+def criar_sessao(max_conexoes=MAX_CONEXOES_POR_HOST, tentativas=TENTATIVAS, backoff=FATOR_BACKOFF):
+    """Session com pool de conexões keep-alive, gzip e retentativas com backoff."""
+    retry = Retry(
+        total=tentativas,
+        backoff_factor=backoff,
+        status_forcelist=STATUS_RETENTAVEIS,
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adaptador = HTTPAdapter(pool_connections=16, pool_maxsize=max_conexoes, max_retries=retry)
+    sessao = requests.Session()
+    sessao.mount('https://', adaptador)
+    sessao.mount('http://', adaptador)
+    sessao.headers['Accept-Encoding'] = 'gzip, deflate'
+    return sessao
+
+
+class ClienteHTTP:
+    """Camada HTTP compartilhada pelos coletores: uma Session com pool + limite por host.
+
+    Reaproveita as conexões TLS entre páginas e imagens do mesmo host. Com
+    `stream=True` o limite por host cobre só até a chegada dos cabeçalhos.
+    """
+
+    def __init__(self, limitador=None, tentativas=TENTATIVAS, backoff=FATOR_BACKOFF, timeout=TIMEOUT_PADRAO):
+        self.limitador = limitador or limitador_padrao
+        self.timeout = timeout
+        self.sessao = criar_sessao(self.limitador.max_conexoes, tentativas, backoff)
+
+    def get(self, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        with self.limitador.aguardar(url):
+            return self.sessao.get(url, **kwargs)
+
+
+cliente_padrao = ClienteHTTP()
+
+
+def cabecalhos_condicionais(etag='', last_modified=''):
+    """Cabeçalhos If-None-Match/If-Modified-Since a partir da coleta anterior."""
+    cabecalhos = {}
+    if etag:
+        cabecalhos['If-None-Match'] = etag
+    if last_modified:
+        cabecalhos['If-Modified-Since'] = last_modified
+    return cabecalhos
+
+
+def validadores(response):
+    """(etag, last_modified) devolvidos pelo servidor."""
+    return response.headers.get('ETag', ''), response.headers.get('Last-Modified', '')
+
+
+def hash_texto(texto):
+    """SHA-256 do texto extraído, para detectar manuais sem alteração."""
+    return hashlib.sha256((texto or '').encode('utf-8')).hexdigest()
+
+
+def formatar_duracao(segundos):
+    """Formata segundos como mm:ss (ou hh:mm:ss)."""
+    segundos = int(max(segundos, 0))
+    horas, resto = divmod(segundos, 3600)
+    minutos, segundos = divmod(resto, 60)
+    if horas:
+        return f"{horas:d}:{minutos:02d}:{segundos:02d}"
+    return f"{minutos:02d}:{segundos:02d}"
+
+
+class Progresso:
+    """Acompanha itens concluídos e estima o tempo restante."""
+
+    def __init__(self, total):
+        self.total = total
+        self.concluidos = 0
+        self.inicio = time.monotonic()
+
+    def avancar(self):
+        self.concluidos += 1
+
+    @property
+    def decorrido(self):
+        return time.monotonic() - self.inicio
+
+    @property
+    def eta(self):
+        if not self.concluidos:
+            return None
+        return self.decorrido / self.concluidos * (self.total - self.concluidos)
+
+    def __str__(self):
+        eta = self.eta
+        texto_eta = formatar_duracao(eta) if eta is not None else '--:--'
+        return (f"[{self.concluidos}/{self.total}] "
+                f"decorrido {formatar_duracao(self.decorrido)}, ETA {texto_eta}")
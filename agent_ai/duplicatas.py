@@ -0,0 +1,162 @@
+"""Quase duplicatas entre manuais e turnos de atendimento (MinHash + LSH).
+
+Cada documento vira um conjunto de shingles (sequências de palavras) e uma
+assinatura MinHash; documentos com assinaturas parecidas caem no mesmo balde
+de pelo menos uma banda do LSH. Só os candidatos de um balde são comparados,
+então o agrupamento é linear no tamanho do corpus.
+
+O primeiro documento de cada grupo (manuais antes de atendimentos, na ordem
+de ID) é o canônico; os demais ficam marcados com a chave dele em `canonico`
+e deixam de entrar na busca.
+"""
+import re
+import zlib
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from agent_ai.models import ManualProcessado, TurnoTicket
+
+TAMANHO_SHINGLE = 5
+NUM_PERMUTACOES = 128
+# 16 bandas x 8 linhas: ~95% de chance de comparar pares com Jaccard 0.8, ~6% com 0.5
+BANDAS = 16
+# Similaridade de Jaccard estimada a partir da qual um documento é duplicata
+LIMIAR_DUPLICATA = 0.8
+# Canônicos guardados por balde; mantém a busca linear mesmo com textos-padrão repetidos
+MAX_POR_BALDE = 8
+
+TIPO_MANUAL = 'manual'
+TIPO_TURNO = 'turno'
+
+_PRIMO = np.uint64((1 << 61) - 1)
+_MASCARA = np.uint64(0xFFFFFFFF)
+_RE_PALAVRA = re.compile(r'\w+')
+
+# Mesmas permutações em toda execução: assinaturas comparáveis entre processos
+_aleatorio = np.random.RandomState(1)
+_A = _aleatorio.randint(1, 1 << 31, size=NUM_PERMUTACOES).astype(np.uint64)
+_B = _aleatorio.randint(0, 1 << 31, size=NUM_PERMUTACOES).astype(np.uint64)
+
+
+def chave_documento(tipo, documento_id):
+    return f"{tipo}:{documento_id}"
+
+
+def shingles(texto, tamanho=TAMANHO_SHINGLE):
+    """Hashes (32 bits) das sequências de `tamanho` palavras do texto, em minúsculas."""
+    palavras = _RE_PALAVRA.findall((texto or '').lower())
+    if not palavras:
+        return np.zeros(0, dtype=np.uint64)
+    total = max(1, len(palavras) - tamanho + 1)
+    conjunto = {' '.join(palavras[i:i + tamanho]) for i in range(total)}
+    return np.fromiter((zlib.crc32(s.encode('utf-8')) for s in conjunto), dtype=np.uint64, count=len(conjunto))
+
+
+def assinatura(texto):
+    """Assinatura MinHash do texto, ou None se não há palavras."""
+    hashes = shingles(texto)
+    if not len(hashes):
+        return None
+    # h(x) = (a*x + b) mod p, com a, b < 2^31 e x < 2^32: o produto cabe em 64 bits
+    return (((hashes[:, None] * _A + _B) % _PRIMO) & _MASCARA).min(axis=0)
+
+
+def similaridade(assinatura_a, assinatura_b):
+    """Estimativa da similaridade de Jaccard entre dois documentos."""
+    return float(np.mean(assinatura_a == assinatura_b))
+
+
+class IndiceLSH:
+    """Baldes de LSH com as assinaturas dos documentos canônicos."""
+
+    def __init__(self, bandas=BANDAS, max_por_balde=MAX_POR_BALDE):
+        self.bandas = bandas
+        self.max_por_balde = max_por_balde
+        self.baldes = {}
+        self.assinaturas = {}
+
+    def _baldes_de(self, assinatura):
+        linhas = len(assinatura) // self.bandas
+        return [(banda, assinatura[banda * linhas:(banda + 1) * linhas].tobytes()) for banda in range(self.bandas)]
+
+    def adicionar(self, chave, assinatura):
+        self.assinaturas[chave] = assinatura
+        for balde in self._baldes_de(assinatura):
+            chaves = self.baldes.setdefault(balde, [])
+            if len(chaves) < self.max_por_balde:
+                chaves.append(chave)
+
+    def mais_similar(self, assinatura):
+        """(chave, similaridade) do canônico mais parecido entre os candidatos, ou (None, 0.0)."""
+        candidatos = set()
+        for balde in self._baldes_de(assinatura):
+            candidatos.update(self.baldes.get(balde, ()))
+        melhor, melhor_similaridade = None, 0.0
+        for chave in candidatos:
+            valor = similaridade(assinatura, self.assinaturas[chave])
+            if valor > melhor_similaridade:
+                melhor, melhor_similaridade = chave, valor
+        return melhor, melhor_similaridade
+
+
+def agrupar(documentos, limiar=LIMIAR_DUPLICATA):
+    """Agrupa quase duplicatas. `documentos` são pares (chave, texto), do mais ao menos prioritário.
+
+    Retorna {chave da duplicata: (chave do canônico, similaridade)}.
+    """
+    indice = IndiceLSH()
+    duplicatas = {}
+    for chave, texto in documentos:
+        minhash = assinatura(texto)
+        if minhash is None:
+            continue
+        canonico, valor = indice.mais_similar(minhash)
+        if canonico is not None and valor >= limiar:
+            duplicatas[chave] = (canonico, valor)
+        else:
+            indice.adicionar(chave, minhash)
+    return duplicatas
+
+
+def _documentos():
+    """Manuais e turnos na ordem de prioridade para serem canônicos."""
+    manuais = ManualProcessado.objects.order_by('manual_id').values_list('id', 'conteudo_markdown')
+    for manual_id, conteudo in manuais.iterator():
+        yield chave_documento(TIPO_MANUAL, manual_id), conteudo
+    turnos = TurnoTicket.objects.order_by('id_ticket', 'ordem').values_list('id', 'pergunta', 'resposta')
+    for turno_id, pergunta, resposta in turnos.iterator():
+        yield chave_documento(TIPO_TURNO, turno_id), f"{pergunta}\n{resposta}"
+
+
+def _gravar_canonicos(modelo, tipo, duplicatas):
+    """Atualiza `canonico` e `similaridade_canonico` só onde mudou. Retorna quantos mudaram."""
+    agora = timezone.now()
+    alterados = []
+    for registro in modelo.objects.only('id', 'canonico', 'similaridade_canonico').iterator():
+        canonico, valor = duplicatas.get(chave_documento(tipo, registro.id), ('', None))
+        if registro.canonico != canonico or registro.similaridade_canonico != valor:
+            registro.canonico = canonico
+            registro.similaridade_canonico = valor
+            # bulk_update não aplica auto_now; o cache da busca depende do updated_at
+            registro.updated_at = agora
+            alterados.append(registro)
+    modelo.objects.bulk_update(alterados, ['canonico', 'similaridade_canonico', 'updated_at'], batch_size=500)
+    return len(alterados)
+
+
+def deduplicar_documentos(limiar=LIMIAR_DUPLICATA):
+    """Recalcula os grupos de quase duplicatas de manuais e atendimentos.
+
+    Retorna um dict com os totais.
+    """
+    duplicatas = agrupar(_documentos(), limiar)
+    with transaction.atomic():
+        alterados = (_gravar_canonicos(ManualProcessado, TIPO_MANUAL, duplicatas)
+                     + _gravar_canonicos(TurnoTicket, TIPO_TURNO, duplicatas))
+    return {
+        'documentos': ManualProcessado.objects.count() + TurnoTicket.objects.count(),
+        'duplicatas': len(duplicatas),
+        'alterados': alterados,
+    }
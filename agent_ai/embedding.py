@@ -6,10 +6,26 @@ load_dotenv()
 
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
+MODELO_EMBEDDING = "text-embedding-ada-002"
+# A API aceita até 2048 textos por chamada; lotes menores limitam o tamanho da requisição
+TAMANHO_LOTE_EMBEDDINGS = 100
+
 def gerar_embeddings(texto):
     response = client.embeddings.create(
-        model="text-embedding-ada-002",
+        model=MODELO_EMBEDDING,
         input=texto
     )
     return response.data[0].embedding
+
+def gerar_embeddings_lote(textos, tamanho_lote=TAMANHO_LOTE_EMBEDDINGS):
+    """Embeddings de vários textos, uma chamada à API por lote, na mesma ordem dos textos."""
+    textos = list(textos)
+    embeddings = []
+    for inicio in range(0, len(textos), tamanho_lote):
+        response = client.embeddings.create(
+            model=MODELO_EMBEDDING,
+            input=textos[inicio:inicio + tamanho_lote]
+        )
+        embeddings.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+    return embeddings
     
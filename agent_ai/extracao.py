@@ -0,0 +1,141 @@
+import copy
+import re
+
+from bs4 import BeautifulSoup, CData, NavigableString, Tag
+
+from agent_ai.crawler import hash_texto
+
+# lxml é bem mais rápido que o html.parser; sem ele, usa o parser embutido
+try:
+    import lxml  # noqa: F401
+    PARSER_HTML = 'lxml'
+except ImportError:
+    PARSER_HTML = 'html.parser'
+
+TAGS_REMOVIDAS = ("script", "style", "nav", "header", "footer")
+
+# Ao descer de um wrapper para um filho, o filho precisa manter esta fração do texto útil
+FRACAO_MINIMA_FILHO = 0.9
+
+_RE_TERMINAL = re.compile(r'Terminal#\d+-\d+')
+
+
+def analisar_html(html):
+    """Faz o parse do HTML com o parser mais rápido disponível."""
+    return BeautifulSoup(html, PARSER_HTML)
+
+
+def remover_terminais(soup):
+    """Remove os elementos cujo texto contém 'Terminal#<n>-<n>' (navegação do Movidesk)."""
+    for texto in soup.find_all(string=_RE_TERMINAL):
+        if texto.parent is not None:
+            texto.parent.decompose()
+
+
+def _tem_classe(tag, trecho):
+    return any(trecho in classe for classe in tag.get('class') or ())
+
+
+def pontuar_textos(raiz):
+    """Calcula, numa única passada de baixo para cima, o texto útil de cada tag.
+
+    Retorna {id(tag): (caracteres de texto, caracteres dentro de links)}.
+    Cada nó é visitado uma vez, ao contrário de chamar get_text() em todas
+    as divs (custo quadrático na profundidade).
+    """
+    pontuacao = {}
+    pilha = [(raiz, False)]
+    while pilha:
+        no, visitado = pilha.pop()
+        if not visitado:
+            pilha.append((no, True))
+            pilha.extend((filho, False) for filho in no.contents if isinstance(filho, Tag))
+            continue
+
+        texto = links = 0
+        for filho in no.contents:
+            if isinstance(filho, Tag):
+                texto_filho, links_filho = pontuacao[id(filho)]
+                texto += texto_filho
+                links += links_filho
+            elif type(filho) in (NavigableString, CData):
+                # Mesmo critério do get_text(strip=True): ignora scripts, estilos e comentários
+                texto += len(filho.strip())
+        if no.name == 'a':
+            links = texto
+        pontuacao[id(no)] = (texto, links)
+    return pontuacao
+
+
+def _texto_util(pontuacao, tag):
+    texto, links = pontuacao[id(tag)]
+    return texto - links
+
+
+def melhor_bloco_de_texto(soup):
+    """Div com mais texto fora de links, descendo de wrappers para o bloco que concentra o conteúdo."""
+    pontuacao = pontuar_textos(soup)
+    divs = soup.find_all('div')
+    if not divs:
+        return None
+
+    melhor = max(divs, key=lambda div: _texto_util(pontuacao, div))
+    while True:
+        minimo = _texto_util(pontuacao, melhor) * FRACAO_MINIMA_FILHO
+        filhos = [filho for filho in melhor.find_all('div', recursive=False)
+                  if _texto_util(pontuacao, filho) >= minimo]
+        if not filhos:
+            return melhor
+        melhor = max(filhos, key=lambda div: _texto_util(pontuacao, div))
+
+
+def encontrar_conteudo_principal(soup):
+    """Localiza o conteúdo principal da página do manual.
+
+    Prioridade: div com classe 'article-content', depois <article> e, por
+    fim, o bloco com mais texto segundo `melhor_bloco_de_texto`.
+    """
+    conteudo = soup.find(lambda tag: tag.name == 'div' and _tem_classe(tag, 'article-content'))
+    if conteudo is None:
+        conteudo = soup.find('article')
+    if conteudo is None:
+        conteudo = melhor_bloco_de_texto(soup)
+    return conteudo
+
+
+def limpar_conteudo(conteudo, tags=TAGS_REMOVIDAS):
+    """Remove scripts, estilos e elementos de navegação do conteúdo."""
+    for tag in conteudo(list(tags)):
+        tag.decompose()
+    return conteudo
+
+
+def texto_do_conteudo(conteudo):
+    """Texto limpo, um bloco por linha."""
+    return conteudo.get_text(separator='\n', strip=True)
+
+
+def hash_do_conteudo(conteudo):
+    """Hash do texto do conteúdo principal, sem navegação nem elementos 'Terminal#'.
+
+    processar_manuais e manual_converter extraem com opções diferentes; o hash
+    é calculado sobre uma cópia normalizada, então o Manual.hash_conteudo de um
+    vale para o outro.
+    """
+    copia = copy.copy(conteudo)
+    remover_terminais(copia)
+    limpar_conteudo(copia)
+    return hash_texto(texto_do_conteudo(copia))
+
+
+def extrair_conteudo(html, remover_terminal=False, limpar=True):
+    """Parse + conteúdo principal em um passo. Lança Exception se não encontrar conteúdo."""
+    soup = analisar_html(html)
+    if remover_terminal:
+        remover_terminais(soup)
+    conteudo = encontrar_conteudo_principal(soup)
+    if conteudo is None:
+        raise Exception("Não foi possível encontrar o conteúdo principal")
+    if limpar:
+        limpar_conteudo(conteudo)
+    return conteudo
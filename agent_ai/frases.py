@@ -0,0 +1,95 @@
+"""Segmentação incremental de texto em frases, para sintetizar a fala de uma
+resposta enquanto ela ainda está sendo gerada.
+
+O texto chega em tokens; cada token só é examinado uma vez (a busca por fim
+de frase continua de onde parou) e o buffer é cortado a cada frase emitida.
+"""
+import re
+
+# Pontuação final (com aspas/parênteses de fechamento) seguida de espaço, ou quebra de linha
+_RE_FIM_FRASE = re.compile(r'[.!?…]+["\'”)\]]*(?=\s)|\n')
+_RE_LINK_MARKDOWN = re.compile(r'\[([^\]]*)\]\([^)]*\)')
+_RE_URL = re.compile(r'https?://\S+')
+_RE_MARCACAO = re.compile(r'[*_`#|]+')
+_RE_MARCADOR_LINHA = re.compile(r'^\s*(?:[-•>]\s*)+', re.MULTILINE)
+_RE_ALFANUMERICO = re.compile(r'\w')
+
+# Palavras seguidas de ponto que não encerram a frase
+ABREVIACOES = {
+    'sr', 'sra', 'srs', 'dr', 'dra', 'prof', 'ex', 'etc', 'obs', 'pág', 'pag', 'p', 'nº', 'n', 'núm',
+    'art', 'inc', 'cia', 'ltda', 'av', 'tel', 'aprox', 'vs', 'cf', 'fig', 'ref',
+}
+# Frases curtas ("Olá!") são juntadas à seguinte; longas sem pontuação são quebradas num espaço
+MIN_CARACTERES_FRASE = 20
+MAX_CARACTERES_FRASE = 300
+
+
+class SegmentadorFrases:
+    """Recebe o texto aos pedaços e devolve as frases à medida que ficam completas.
+
+    Uso:
+        segmentador = SegmentadorFrases()
+        for token in tokens:
+            for frase in segmentador.adicionar(token):
+                ...
+        resto = segmentador.finalizar()
+    """
+
+    def __init__(self, min_caracteres=MIN_CARACTERES_FRASE, max_caracteres=MAX_CARACTERES_FRASE):
+        self.min_caracteres = min_caracteres
+        self.max_caracteres = max_caracteres
+        self._buffer = ''
+        self._posicao = 0
+
+    def _ponto_nao_encerra(self, indice):
+        """True se o ponto em `indice` é de abreviação ou de item numerado ("1. Acesse...")."""
+        if self._buffer[indice] != '.':
+            return False
+        inicio = max(self._buffer.rfind(' ', 0, indice), self._buffer.rfind('\n', 0, indice)) + 1
+        palavra = self._buffer[inicio:indice].lstrip('(["\'“')
+        if palavra.lower() in ABREVIACOES or (len(palavra) == 1 and palavra.isalpha()):
+            return True
+        return palavra.isdigit() and not self._buffer[:inicio].strip(' \t').rpartition('\n')[2]
+
+    def _cortar(self, fim):
+        frase = self._buffer[:fim].strip()
+        self._buffer = self._buffer[fim:]
+        self._posicao = 0
+        return frase
+
+    def adicionar(self, texto):
+        """Acrescenta texto e devolve a lista de frases completadas por ele."""
+        self._buffer += texto
+        frases = []
+        while True:
+            fim = _RE_FIM_FRASE.search(self._buffer, self._posicao)
+            if fim is None:
+                break
+            self._posicao = fim.end()
+            if fim.group() != '\n' and self._ponto_nao_encerra(fim.start()):
+                continue
+            if len(self._buffer[:fim.end()].strip()) < self.min_caracteres:
+                # Curta demais (ou só espaços): segue acumulando
+                continue
+            frases.append(self._cortar(fim.end()))
+
+        if len(self._buffer) > self.max_caracteres:
+            espaco = self._buffer.rfind(' ', self.min_caracteres, self.max_caracteres)
+            if espaco != -1:
+                frases.append(self._cortar(espaco))
+        return frases
+
+    def finalizar(self):
+        """Devolve o texto restante como última frase (lista vazia se não sobrou nada)."""
+        frase = self._cortar(len(self._buffer))
+        return [frase] if frase else []
+
+
+def texto_falavel(frase):
+    """Texto da frase sem marcação markdown, URLs, marcadores de lista e citações; vazio se não há o que falar."""
+    frase = _RE_LINK_MARKDOWN.sub(r'\1', frase)
+    frase = _RE_URL.sub('', frase)
+    frase = _RE_MARCADOR_LINHA.sub('', frase)
+    frase = _RE_MARCACAO.sub('', frase)
+    frase = ' '.join(frase.split())
+    return frase if _RE_ALFANUMERICO.search(frase) else ''
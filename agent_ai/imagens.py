@@ -0,0 +1,308 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+
+from agent_ai.arquivos import permissoes_padrao
+from agent_ai.crawler import cliente_padrao
+from agent_ai.miniaturas import gerar_variantes
+from agent_ai.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Diretório (relativo ao MEDIA_ROOT) das imagens endereçadas por conteúdo
+DIRETORIO_IMAGENS = 'manuais/imagens'
+TAMANHO_BLOCO = 64 * 1024
+MAX_DOWNLOADS_SIMULTANEOS = 8
+# Imagens maiores que isso são descartadas (screenshots ficam bem abaixo)
+MAX_TAMANHO_IMAGEM = 10 * 1024 * 1024
+
+# Content-Types aceitos e a extensão gravada
+CONTENT_TYPES_PERMITIDOS = {
+    'image/jpeg': '.jpg',
+    'image/jpg': '.jpg',
+    'image/pjpeg': '.jpg',
+    'image/png': '.png',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+}
+# Servidores que não informam o tipo: decide pelos primeiros bytes
+CONTENT_TYPES_GENERICOS = ('', 'application/octet-stream', 'binary/octet-stream')
+ASSINATURAS = (
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'GIF87a', '.gif'),
+    (b'GIF89a', '.gif'),
+)
+
+
+class ImagemRejeitada(Exception):
+    """Imagem recusada pelo armazém (tipo não permitido ou tamanho acima do limite)."""
+
+
+@dataclass
+class ImagemArmazenada:
+    """Imagem presente no armazém: caminho no storage, metadados e variantes WebP."""
+    url: str
+    hash_conteudo: str
+    nome: str
+    tamanho_bytes: int
+    largura: int = None
+    altura: int = None
+    variantes: list = field(default_factory=list)
+
+    @property
+    def nome_arquivo(self):
+        return os.path.basename(self.nome)
+
+
+def extensao_por_content_type(content_type):
+    """Extensão do arquivo a partir do Content-Type; None se o tipo não é permitido."""
+    tipo = (content_type or '').split(';')[0].strip().lower()
+    return CONTENT_TYPES_PERMITIDOS.get(tipo)
+
+
+def extensao_por_assinatura(bloco):
+    """Extensão a partir dos primeiros bytes do arquivo; None se não for imagem conhecida."""
+    for assinatura, ext in ASSINATURAS:
+        if bloco.startswith(assinatura):
+            return ext
+    if bloco[:4] == b'RIFF' and bloco[8:12] == b'WEBP':
+        return '.webp'
+    return None
+
+
+def caminho_por_hash(hash_hex, ext):
+    """Caminho no storage: manuais/imagens/ab/abcdef....ext"""
+    return f"{DIRETORIO_IMAGENS}/{hash_hex[:2]}/{hash_hex}{ext}"
+
+
+class ArmazemImagens:
+    """Armazém de imagens compartilhado entre manuais, endereçado pelo SHA-256 do conteúdo.
+
+    Cada arquivo é gravado uma única vez, não importa quantos manuais o usem.
+    URLs já baixadas são reconhecidas pelo índice (carregado de ImagemManual)
+    e não são baixadas de novo. Seguro para uso a partir de várias threads.
+    """
+
+    def __init__(self, cliente=None, max_downloads=MAX_DOWNLOADS_SIMULTANEOS, max_tamanho=MAX_TAMANHO_IMAGEM):
+        self.cliente = cliente or cliente_padrao
+        self.max_downloads = max_downloads
+        self.max_tamanho = max_tamanho
+        self._lock = threading.Lock()
+        self._por_url = None
+        self._downloads = SingleFlight()
+        # Storages não locais: URLs com o mesmo conteúdo gravam uma de cada vez
+        self._lock_gravacao = threading.Lock()
+        self._executor = None
+
+    def carregar_indice(self):
+        """Carrega as URLs já armazenadas. Deve ser chamado numa thread com acesso ao banco."""
+        from agent_ai.models import ImagemManual
+
+        por_url = {}
+        registros = (ImagemManual.objects
+                     .exclude(arquivo_imagem='')
+                     .values_list('url_original', 'hash_conteudo', 'arquivo_imagem', 'tamanho_bytes',
+                                  'largura', 'altura', 'variantes'))
+        for url, hash_hex, nome, tamanho, largura, altura, variantes in registros.iterator():
+            # Só registros endereçados por conteúdo (SHA-256) entram no índice
+            if len(hash_hex or '') == 64:
+                por_url[url] = ImagemArmazenada(url, hash_hex, nome, tamanho or 0, largura, altura, variantes or [])
+        with self._lock:
+            self._por_url = por_url
+        return len(por_url)
+
+    def garantir_indice(self):
+        """Carrega o índice na primeira utilização."""
+        if self._por_url is None:
+            self.carregar_indice()
+
+    def _conhecida(self, url):
+        with self._lock:
+            if self._por_url is None:
+                return None
+            armazenada = self._por_url.get(url)
+        if armazenada and default_storage.exists(armazenada.nome):
+            return armazenada
+        return None
+
+    def baixar(self, url):
+        """Garante a imagem da URL no armazém e devolve seu ImagemArmazenada (ou None)."""
+        armazenada = self._conhecida(url)
+        if armazenada:
+            if armazenada.largura is None:
+                # Registrada antes das miniaturas existirem
+                armazenada.largura, armazenada.altura, armazenada.variantes = gerar_variantes(armazenada.nome)
+            return armazenada
+        try:
+            # Downloads simultâneos da mesma URL viram um só
+            return self._downloads.executar(url, lambda: self._baixar(url))
+        except ImagemRejeitada as e:
+            logger.warning(f"Imagem ignorada {url}: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"Erro ao baixar imagem {url}: {e}")
+            return None
+
+    def _baixar(self, url):
+        response = self.cliente.get(url, stream=True, verify=False)
+        with response:
+            response.raise_for_status()
+            content_type = response.headers.get('content-type', '')
+            ext = extensao_por_content_type(content_type)
+            if ext is None and content_type.split(';')[0].strip().lower() not in CONTENT_TYPES_GENERICOS:
+                raise ImagemRejeitada(f"tipo não permitido: {content_type}")
+
+            declarado = response.headers.get('content-length')
+            if declarado and declarado.isdigit() and int(declarado) > self.max_tamanho:
+                raise ImagemRejeitada(f"{int(declarado)} bytes (limite {self.max_tamanho})")
+
+            # 🔹 Grava em blocos, calculando o hash, num temporário no próprio diretório
+            # das imagens: memória constante e rename atômico no final
+            diretorio = _diretorio_local(DIRETORIO_IMAGENS) or settings.MEDIA_ROOT
+            os.makedirs(diretorio, exist_ok=True)
+            sha256 = hashlib.sha256()
+            tamanho = 0
+            tmp = tempfile.NamedTemporaryFile(dir=diretorio, prefix='.baixando-', delete=False)
+            try:
+                with tmp:
+                    for bloco in response.iter_content(TAMANHO_BLOCO):
+                        if not bloco:
+                            continue
+                        if tamanho == 0 and ext is None:
+                            ext = extensao_por_assinatura(bloco)
+                            if ext is None:
+                                raise ImagemRejeitada(f"conteúdo não reconhecido como imagem ({content_type or 'sem Content-Type'})")
+                        tamanho += len(bloco)
+                        if tamanho > self.max_tamanho:
+                            raise ImagemRejeitada(f"mais de {self.max_tamanho} bytes")
+                        sha256.update(bloco)
+                        tmp.write(bloco)
+                if tamanho == 0:
+                    raise ImagemRejeitada("resposta vazia")
+
+                hash_hex = sha256.hexdigest()
+                nome = caminho_por_hash(hash_hex, ext)
+                nome = self._mover_para_armazem(tmp.name, nome)
+            finally:
+                if os.path.exists(tmp.name):
+                    os.remove(tmp.name)
+
+        # 🔹 Miniaturas e WebP: geradas uma vez por conteúdo, reaproveitadas se já existem
+        largura, altura, variantes = gerar_variantes(nome)
+        armazenada = ImagemArmazenada(url, hash_hex, nome, tamanho, largura, altura, variantes)
+        with self._lock:
+            if self._por_url is not None:
+                self._por_url[url] = armazenada
+        return armazenada
+
+    def _mover_para_armazem(self, origem, nome):
+        """Coloca o arquivo baixado no caminho final e devolve o nome no storage.
+
+        No storage em disco é um os.replace (atômico: leitores nunca veem um
+        arquivo pela metade). Outros storages recebem uma cópia via save().
+        """
+        destino = _diretorio_local(nome)
+        if destino:
+            if not os.path.exists(destino):
+                os.makedirs(os.path.dirname(destino), exist_ok=True)
+                # Mesmo conteúdo gera o mesmo nome: substituir em corrida é inofensivo
+                permissoes_padrao(origem)
+                os.replace(origem, destino)
+            return nome
+
+        with self._lock_gravacao:
+            if not default_storage.exists(nome):
+                with open(origem, 'rb') as arquivo:
+                    nome = default_storage.save(nome, File(arquivo))
+        return nome
+
+    def baixar_varias(self, urls):
+        """Baixa as URLs em paralelo. Retorna {url: ImagemArmazenada} só com as que deram certo."""
+        urls = list(dict.fromkeys(urls))
+        if not urls:
+            return {}
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_downloads)
+            executor = self._executor
+        resultados = executor.map(self.baixar, urls)
+        return {url: armazenada for url, armazenada in zip(urls, resultados) if armazenada}
+
+
+def _diretorio_local(nome):
+    """Caminho em disco de `nome` no storage padrão, ou None se o storage não é local."""
+    try:
+        return default_storage.path(nome)
+    except NotImplementedError:
+        return None
+
+
+def url_absoluta(src, base_url):
+    """Converte o src de uma <img> em URL absoluta."""
+    if src.startswith('//'):
+        return 'https:' + src
+    if src.startswith('http'):
+        return src
+    return urljoin(base_url, src)
+
+
+def urls_das_imagens(content, base_url):
+    """Lista (url, alt, ordem) das <img> de um conteúdo HTML, na ordem da página."""
+    imagens = []
+    for i, img in enumerate(content.find_all('img')):
+        src = img.get('src')
+        if src:
+            imagens.append((url_absoluta(src, base_url), img.get('alt', 'Imagem'), i + 1))
+    return imagens
+
+
+def nova_imagem(manual_processado, armazenada, ordem, alt_text="Imagem"):
+    """ImagemManual (ainda não salva) apontando para o arquivo compartilhado do armazém."""
+    from agent_ai.models import ImagemManual
+
+    imagem = ImagemManual(
+        manual_processado=manual_processado,
+        url_original=armazenada.url,
+        nome_arquivo=armazenada.nome_arquivo,
+        alt_text=alt_text,
+        ordem=ordem,
+        hash_conteudo=armazenada.hash_conteudo,
+        tamanho_bytes=armazenada.tamanho_bytes,
+        largura=armazenada.largura,
+        altura=armazenada.altura,
+        variantes=armazenada.variantes
+    )
+    # O arquivo já está no storage; só referenciamos o caminho
+    imagem.arquivo_imagem.name = armazenada.nome
+    return imagem
+
+
+def registrar_imagens(manual_processado, itens):
+    """Cria as ImagemManual de um manual num único INSERT.
+
+    `itens` são tuplas (ImagemArmazenada, ordem, alt_text); imagens com o
+    mesmo conteúdo dentro do manual são registradas uma só vez.
+    """
+    from agent_ai.models import ImagemManual
+
+    imagens = []
+    hashes = set()
+    for armazenada, ordem, alt_text in itens:
+        if armazenada.hash_conteudo in hashes:
+            continue
+        hashes.add(armazenada.hash_conteudo)
+        imagens.append(nova_imagem(manual_processado, armazenada, ordem, alt_text))
+    return ImagemManual.objects.bulk_create(imagens)
+
+
+armazem_padrao = ArmazemImagens()
@@ -0,0 +1,166 @@
+import re
+from collections import deque
+
+from bs4 import BeautifulSoup
+from django.db import transaction
+
+from agent_ai.crawler import cliente_padrao, hash_texto
+from agent_ai.embedding import TAMANHO_LOTE_EMBEDDINGS, gerar_embeddings, gerar_embeddings_lote
+from agent_ai.models import Resposta, TurnoTicket
+from agent_ai.transcricoes import turnos_das_conversas
+
+HEADERS_BUSCA = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.36'
+}
+
+# Lista de palavras a serem ignorados
+IGNORAR = [
+    'Spartacus | Sistemas para Gestão Empresarial, Contábil e Logística.',
+    'R. Brasil Pinheiro, 268 - Ponta Grossa - PR',
+    '+55 (42) 3223-6164 | +55 (42) 3223-0774 | +55 (42) 8822-4085',
+    'Todos os direitos reservados. Copyright ©2023 SPARTACUS',
+    'Todos os direitos reservados. Copyright ©2023',
+]
+
+
+# Texto enviado para o embedding de cada turno (o modelo aceita ~8k tokens)
+MAX_CHARS_EMBEDDING_TURNO = 6000
+
+
+class ErroIngestao(Exception):
+    """Falha ao buscar o conteúdo de um manual; `status` é o HTTP devolvido pela view."""
+
+    def __init__(self, mensagem, status=500):
+        super().__init__(mensagem)
+        self.status = status
+
+
+def buscar_conteudo_manual(manual):
+    """Baixa a página do manual, extrai os parágrafos, gera o embedding e salva a Resposta.
+
+    Retorna (conteúdo, embeddings).
+    """
+    print(f"Iniciando a busca do conteúdo para o Manual ID {manual.id}...")
+
+    response = cliente_padrao.get(manual.url, headers=HEADERS_BUSCA, verify=False)
+
+    if response.status_code != 200:
+        print(f"Erro ao acessar a URL {manual.url}: Código de status {response.status_code}")
+        raise ErroIngestao(f'Falha ao acessar a URL do manual: {response.status_code}')
+
+    soup = BeautifulSoup(response.text, 'html.parser')
+
+    # 🔹 Extrair texto e remover textos indesejados
+    paragrafos = [p.get_text().strip() for p in soup.find_all('p')]
+    content = '  \n\n'.join([p for p in paragrafos if not any(ignorado in p for ignorado in IGNORAR)])
+
+    content = re.sub(r'(\. )([A-Z])', r'.\n\n\2', content)
+    full_content = content + " " + " "
+
+    if not full_content.strip():
+        raise ErroIngestao('Nenhum conteúdo encontrado na URL', status=404)
+
+    embeddings = gerar_embeddings(full_content)
+    resposta, created = Resposta.objects.get_or_create(manual=manual)
+    resposta.content = full_content
+    resposta.set_embedding(embeddings)
+    resposta.save()
+
+    return full_content, embeddings
+
+
+def _texto_para_embedding(assunto, turno):
+    texto = f"{assunto}\nCliente: {turno.pergunta}\nSuporte: {turno.resposta}"
+    return texto[:MAX_CHARS_EMBEDDING_TURNO]
+
+
+def _gravar_tickets(pendentes):
+    """Gera os embeddings em lote e substitui os turnos dos tickets numa transação.
+
+    `pendentes` são tuplas (id_ticket, assunto, hash_ticket, turnos). Turnos
+    cujo texto não mudou reaproveitam o embedding já salvo.
+    """
+    ids = [id_ticket for id_ticket, _, _, _ in pendentes]
+    reaproveitaveis = dict(
+        TurnoTicket.objects.filter(id_ticket__in=ids).exclude(embedding__isnull=True)
+        .values_list('hash_conteudo', 'embedding')
+    )
+
+    novos, sem_embedding, textos = [], [], []
+    for id_ticket, assunto, hash_ticket, turnos in pendentes:
+        for ordem, turno in enumerate(turnos, start=1):
+            texto = _texto_para_embedding(assunto, turno)
+            hash_turno = hash_texto(texto)
+            registro = TurnoTicket(
+                id_ticket=id_ticket, assunto=assunto[:255], ordem=ordem,
+                pergunta=turno.pergunta, resposta=turno.resposta,
+                hash_ticket=hash_ticket, hash_conteudo=hash_turno,
+                embedding=reaproveitaveis.get(hash_turno),
+            )
+            # bulk_create não chama save(): o bloco de contexto é montado aqui
+            registro.atualizar_bloco_contexto()
+            novos.append(registro)
+            if not registro.embedding:
+                sem_embedding.append(registro)
+                textos.append(texto)
+
+    # 🔹 Uma chamada à API por lote de turnos, fora da transação
+    for registro, embedding in zip(sem_embedding, gerar_embeddings_lote(textos)):
+        registro.set_embedding(embedding)
+
+    with transaction.atomic():
+        TurnoTicket.objects.filter(id_ticket__in=ids).delete()
+        TurnoTicket.objects.bulk_create(novos, batch_size=500)
+    return len(novos), len(textos)
+
+
+def ingerir_conversas(conversas, tamanho_lote=TAMANHO_LOTE_EMBEDDINGS, escrever=print, processos=1):
+    """Indexa as conversas do Movidesk como turnos pergunta/resposta pesquisáveis.
+
+    Incremental: tickets cujo conteúdo não mudou desde a última ingestão são
+    pulados; os alterados têm os turnos substituídos. Com `processos` > 1 a
+    limpeza dos diálogos roda em paralelo. Retorna um dict com os totais.
+    """
+    ingeridos = dict(TurnoTicket.objects.values_list('id_ticket', 'hash_ticket').distinct())
+    totais = {'tickets': 0, 'inalterados': 0, 'sem_turnos': 0, 'turnos': 0, 'embeddings': 0}
+    # Mesma ordem das conversas devolvidas por turnos_das_conversas
+    hashes = deque()
+    pendentes, turnos_pendentes = [], 0
+
+    def gravar():
+        turnos, embeddings = _gravar_tickets(pendentes)
+        totais['turnos'] += turnos
+        totais['embeddings'] += embeddings
+        escrever(f"  {totais['tickets']} tickets lidos, {totais['turnos']} turnos gravados, "
+                 f"{totais['embeddings']} embeddings gerados")
+
+    def alteradas():
+        # Só conversas novas ou alteradas chegam à limpeza e divisão em turnos
+        for conversa in conversas:
+            totais['tickets'] += 1
+            hash_ticket = hash_texto(f"{conversa.get('assunto') or ''}\n{conversa.get('dialogo_completo') or ''}")
+            if ingeridos.get(conversa['id_ticket']) == hash_ticket:
+                totais['inalterados'] += 1
+                continue
+            hashes.append(hash_ticket)
+            yield conversa
+
+    for conversa, turnos in turnos_das_conversas(alteradas(), processos=processos):
+        id_ticket = conversa['id_ticket']
+        hash_ticket = hashes.popleft()
+        if not turnos:
+            totais['sem_turnos'] += 1
+            if id_ticket in ingeridos:
+                # O atendimento mudou e não tem mais turnos aproveitáveis
+                TurnoTicket.objects.filter(id_ticket=id_ticket).delete()
+            continue
+
+        pendentes.append((id_ticket, conversa.get('assunto') or '', hash_ticket, turnos))
+        turnos_pendentes += len(turnos)
+        if turnos_pendentes >= tamanho_lote:
+            gravar()
+            pendentes, turnos_pendentes = [], 0
+
+    if pendentes:
+        gravar()
+    return totais
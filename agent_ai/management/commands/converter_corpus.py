@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from agent_ai.corpus import CHAVE_PADRAO, ErroCorpus, Indice, gravar_corpus, ler_atuais
+
+
+class Command(BaseCommand):
+    help = 'Converte um corpus de conversas (array JSON legado ou JSON Lines) para JSON Lines, sem duplicatas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('origem', help='Ex.: conversas_movidesk_completo.json')
+        parser.add_argument('destino', help='Ex.: conversas_movidesk.jsonl ou conversas_movidesk.jsonl.gz')
+        parser.add_argument(
+            '--chave',
+            default=CHAVE_PADRAO,
+            help='Campo que identifica cada registro'
+        )
+
+    def handle(self, *args, **options):
+        origem, destino, chave = options['origem'], options['destino'], options['chave']
+        try:
+            total = gravar_corpus(destino, ler_atuais(origem, chave), chave)
+        except (ErroCorpus, OSError, KeyError, ValueError) as e:
+            raise CommandError(f"Erro ao converter {origem}: {e}")
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {total} registros gravados em {destino} (índice com {len(Indice(destino, chave).carregar())} chaves)"
+        ))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from agent_ai.duplicatas import LIMIAR_DUPLICATA, deduplicar_documentos
+
+
+class Command(BaseCommand):
+    help = 'Agrupa quase duplicatas entre manuais e atendimentos (MinHash/LSH) e tira as cópias da busca'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limiar',
+            type=float,
+            default=LIMIAR_DUPLICATA,
+            help='Similaridade de Jaccard estimada a partir da qual dois documentos são duplicatas'
+        )
+
+    def handle(self, *args, **options):
+        totais = deduplicar_documentos(limiar=options['limiar'])
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {totais['duplicatas']} de {totais['documentos']} documentos são quase duplicatas "
+            f"({totais['alterados']} alterados nesta execução)"
+        ))
@@ -0,0 +1,76 @@
+from django.core.management.base import BaseCommand, CommandError
+from agent_ai.crawler import ClienteHTTP, LimitadorHost
+from agent_ai.movidesk import ANO_INICIAL, ARQUIVO_SAIDA, ClienteMovidesk, ErroMovidesk, ExportadorMovidesk
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Exporta as conversas de chat dos tickets do Movidesk (retomável; --incremental para sincronizar)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--saida',
+            default=ARQUIVO_SAIDA,
+            help='Corpus de saída em JSON Lines (.jsonl, .jsonl.gz ou .jsonl.zst)'
+        )
+        parser.add_argument(
+            '--ano-inicial',
+            type=int,
+            default=ANO_INICIAL,
+            help='Primeiro ano a exportar'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Detalhes de tickets buscados em paralelo'
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=0.2,
+            help='Intervalo mínimo (segundos) entre requisições à API'
+        )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Busca só os tickets criados ou alterados desde a última execução e mescla na saída'
+        )
+        parser.add_argument(
+            '--reiniciar',
+            action='store_true',
+            help='Descarta o progresso salvo e exporta tudo de novo'
+        )
+
+    def handle(self, *args, **options):
+        workers = max(1, options.get('workers') or 1)
+        # O limitador garante o ritmo na API, independente do número de workers
+        cliente = ClienteHTTP(
+            limitador=LimitadorHost(max_conexoes=workers, intervalo_minimo=max(0.0, options.get('intervalo') or 0.0)),
+            timeout=45,
+        )
+        try:
+            api = ClienteMovidesk(cliente=cliente)
+        except ErroMovidesk as e:
+            raise CommandError(str(e))
+
+        exportador = ExportadorMovidesk(
+            api=api,
+            saida=options.get('saida'),
+            workers=workers,
+            escrever=self.stdout.write,
+        )
+        try:
+            self.stdout.write("--- INICIANDO EXPORTAÇÃO DE TICKETS DO MOVIDESK ---")
+            if options.get('incremental'):
+                total = exportador.sincronizar(ano_inicial=options.get('ano_inicial'), reiniciar=options.get('reiniciar'))
+            else:
+                total = exportador.exportar(ano_inicial=options.get('ano_inicial'), reiniciar=options.get('reiniciar'))
+        except ErroMovidesk as e:
+            raise CommandError(f"{e}. O progresso foi salvo; execute novamente para continuar.")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {total} conversas de chat salvas em {options.get('saida')}"
+        ))
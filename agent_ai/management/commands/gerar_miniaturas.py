@@ -0,0 +1,68 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from agent_ai.models import ImagemManual, ManualProcessado
+from agent_ai.miniaturas import gerar_variantes
+from agent_ai.crawler import Progresso, formatar_duracao
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Gera miniaturas e versões WebP das imagens de manuais já processados'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--todas',
+            action='store_true',
+            help='Refaz as variantes de todas as imagens, sobrescrevendo os arquivos existentes, não só das que ainda não têm'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Quantidade de imagens processadas em paralelo'
+        )
+
+    def handle(self, *args, **options):
+        imagens = ImagemManual.objects.exclude(arquivo_imagem='')
+        if not options.get('todas'):
+            imagens = imagens.filter(largura__isnull=True)
+
+        # Várias ImagemManual podem apontar para o mesmo arquivo do armazém
+        por_arquivo = defaultdict(list)
+        for imagem in imagens.only('id', 'arquivo_imagem', 'manual_processado_id'):
+            por_arquivo[imagem.arquivo_imagem.name].append(imagem)
+
+        total = len(por_arquivo)
+        self.stdout.write(f'Gerando variantes de {total} arquivos...')
+        progresso = Progresso(total)
+        atualizadas = []
+        manuais_ids = set()
+
+        workers = max(1, options.get('workers') or 1)
+        gerar = partial(gerar_variantes, refazer=bool(options.get('todas')))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for nome, (largura, altura, variantes) in zip(por_arquivo, executor.map(gerar, por_arquivo)):
+                progresso.avancar()
+                if largura is None:
+                    self.stdout.write(self.style.ERROR(f'{progresso} ✗ {nome}'))
+                    continue
+                for imagem in por_arquivo[nome]:
+                    imagem.largura, imagem.altura, imagem.variantes = largura, altura, variantes
+                    atualizadas.append(imagem)
+                    manuais_ids.add(imagem.manual_processado_id)
+
+        # 🔹 Atualiza as imagens e o contexto pré-calculado que vai para o chat
+        with transaction.atomic():
+            ImagemManual.objects.bulk_update(atualizadas, ['largura', 'altura', 'variantes'], batch_size=500)
+            for manual in ManualProcessado.objects.filter(id__in=manuais_ids):
+                manual.atualizar_bloco_contexto()
+                manual.save(update_fields=['bloco_contexto', 'imagens_contexto'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(atualizadas)} imagens atualizadas em {len(manuais_ids)} manuais ({formatar_duracao(progresso.decorrido)})'
+        ))
@@ -0,0 +1,75 @@
+import os
+from django.core.management.base import BaseCommand, CommandError
+from agent_ai.corpus import ErroCorpus, ler_atuais
+from agent_ai.duplicatas import deduplicar_documentos
+from agent_ai.embedding import TAMANHO_LOTE_EMBEDDINGS
+from agent_ai.ingestao import ingerir_conversas
+from agent_ai.movidesk import ARQUIVO_LEGADO, ARQUIVO_SAIDA
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Indexa as conversas exportadas do Movidesk como turnos pergunta/resposta para a busca'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--arquivo',
+            default=None,
+            help=f'Corpus de conversas (padrão: {ARQUIVO_SAIDA}, ou {ARQUIVO_LEGADO} se não existir)'
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=TAMANHO_LOTE_EMBEDDINGS,
+            help='Turnos por chamada de embeddings'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=None,
+            help='Limita o número de conversas lidas'
+        )
+        parser.add_argument(
+            '--processos',
+            type=int,
+            default=1,
+            help='Processos usados na limpeza e divisão dos diálogos em turnos'
+        )
+        parser.add_argument(
+            '--sem-deduplicacao',
+            action='store_true',
+            help='Não recalcula as quase duplicatas entre atendimentos e manuais ao final'
+        )
+
+    def handle(self, *args, **options):
+        arquivo = options.get('arquivo')
+        if not arquivo:
+            arquivo = ARQUIVO_SAIDA if os.path.exists(ARQUIVO_SAIDA) else ARQUIVO_LEGADO
+        if not os.path.exists(arquivo):
+            raise CommandError(f'Arquivo não encontrado: {arquivo}. Execute antes o exportar_movidesk.')
+
+        conversas = ler_atuais(arquivo)
+        if options.get('limit'):
+            conversas = (conversa for _, conversa in zip(range(options['limit']), conversas))
+
+        self.stdout.write(f'Ingerindo conversas de {arquivo}...')
+        try:
+            totais = ingerir_conversas(conversas, tamanho_lote=max(1, options.get('lote') or 1),
+                                       escrever=self.stdout.write,
+                                       processos=max(1, options.get('processos') or 1))
+        except ErroCorpus as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {totais['tickets']} tickets: {totais['inalterados']} inalterados, "
+            f"{totais['sem_turnos']} sem turnos, {totais['turnos']} turnos gravados, "
+            f"{totais['embeddings']} embeddings gerados"
+        ))
+
+        if not options.get('sem_deduplicacao'):
+            duplicatas = deduplicar_documentos()
+            self.stdout.write(
+                f"{duplicatas['duplicatas']} de {duplicatas['documentos']} documentos marcados como quase duplicatas"
+            )
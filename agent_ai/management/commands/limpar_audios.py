@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from agent_ai.retencao import MAX_MEGABYTES_AUDIO, RETENCAO_DIAS_AUDIO, indexar_diretorio, limpar_audios
+
+
+class Command(BaseCommand):
+    help = 'Remove os áudios gerados sem acesso recente e os menos usados acima do limite de espaço'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias',
+            type=int,
+            default=RETENCAO_DIAS_AUDIO,
+            help='Remove os áudios sem acesso há mais que esse número de dias'
+        )
+        parser.add_argument(
+            '--max-mb',
+            type=int,
+            default=MAX_MEGABYTES_AUDIO,
+            help='Espaço máximo dos áudios; acima disso os acessados há mais tempo saem primeiro (0 desliga)'
+        )
+        parser.add_argument(
+            '--varrer-diretorio',
+            action='store_true',
+            help='Antes de limpar, registra no índice os arquivos que não estão nele (ex.: áudios da versão antiga)'
+        )
+
+    def handle(self, *args, **options):
+        if options['varrer_diretorio']:
+            indexados = indexar_diretorio()
+            self.stdout.write(f"{indexados} arquivos de áudio fora do índice foram registrados")
+
+        totais = limpar_audios(dias=options['dias'], max_megabytes=options['max_mb'] or None)
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {totais['expirados']} áudios expirados e {totais['excedentes']} removidos pelo limite de espaço "
+            f"({totais['bytes_liberados'] / 1024 / 1024:.1f} MB liberados)"
+        ))
@@ -1,16 +1,43 @@
-import os
-import requests
-import hashlib
-from django.core.management.base import BaseCommand
-from django.conf import settings
-from django.core.files.base import ContentFile
-from agent_ai.models import Manual, ManualProcessado, ImagemManual
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from agent_ai.models import Manual, ManualProcessado
+from agent_ai.embedding import gerar_embeddings
+from agent_ai.duplicatas import deduplicar_documentos
+from agent_ai.crawler import (HEADERS_NAVEGADOR, ClienteHTTP, LimitadorHost, Progresso, cabecalhos_condicionais,
+                              validadores)
+from agent_ai.extracao import extrair_conteudo, hash_do_conteudo, texto_do_conteudo
+from agent_ai.imagens import ArmazemImagens, ImagemArmazenada, registrar_imagens, urls_das_imagens
 import logging
 
 logger = logging.getLogger(__name__)
 
+
+@dataclass
+class ImagemBaixada:
+    """Imagem já no armazém, aguardando o registro no manual."""
+    armazenada: ImagemArmazenada
+    alt_text: str
+    ordem: int
+
+
+@dataclass
+class ManualBaixado:
+    """Resultado do download e parse de um manual, sem nenhum acesso ao banco."""
+    manual: Manual
+    texto_limpo: str = ''
+    html: str = ''
+    imagens: list = field(default_factory=list)
+    embedding: list = None
+    erro: Exception = None
+    # Validadores da coleta; `inalterado` indica 304 ou texto com o mesmo hash
+    etag: str = ''
+    last_modified: str = ''
+    hash_conteudo: str = ''
+    inalterado: bool = False
+
+
 class Command(BaseCommand):
     help = 'Processa manuais existentes para gerar dados nas novas tabelas'
 
@@ -24,209 +51,252 @@ class Command(BaseCommand):
         parser.add_argument(
             '--force',
             action='store_true',
-            help='Reprocessa manuais já processados'
+            help='Reprocessa manuais já processados (só os que mudaram, salvo com --sem-cache)'
+        )
+        parser.add_argument(
+            '--sem-cache',
+            action='store_true',
+            help='Ignora ETag/Last-Modified e o hash do conteúdo, reprocessando tudo'
+        )
+        parser.add_argument(
+            '--ids',
+            type=int,
+            nargs='+',
+            default=None,
+            help='Processa apenas os manuais com estes IDs'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Quantidade de manuais baixados e processados em paralelo'
+        )
+        parser.add_argument(
+            '--max-por-host',
+            type=int,
+            default=4,
+            help='Máximo de requisições simultâneas ao mesmo host'
+        )
+        parser.add_argument(
+            '--intervalo-host',
+            type=float,
+            default=0.1,
+            help='Intervalo mínimo (segundos) entre requisições ao mesmo host'
+        )
+        parser.add_argument(
+            '--sem-deduplicacao',
+            action='store_true',
+            help='Não refaz a marcação de quase duplicatas no final (fica para o deduplicar_documentos)'
         )
 
     def handle(self, *args, **options):
         limit = options.get('limit')
         force = options.get('force')
+        self.usar_cache = not options.get('sem_cache')
+        workers = max(1, options.get('workers') or 1)
+        self.limitador = LimitadorHost(
+            max_conexoes=max(1, options.get('max_por_host') or 1),
+            intervalo_minimo=max(0.0, options.get('intervalo_host') or 0.0),
+        )
+        self.cliente = ClienteHTTP(limitador=self.limitador)
+        # Imagens compartilhadas entre manuais são baixadas e gravadas uma única vez
+        self.armazem = ArmazemImagens(cliente=self.cliente)
+        self.stdout.write(f'{self.armazem.carregar_indice()} imagens já presentes no armazém')
+        
+        processados_ids = set(ManualProcessado.objects.values_list('manual_id', flat=True))
+        # Só manuais já processados por este comando podem ser pulados por requisição condicional
+        # (o conteúdo gravado pelo manual_converter é markdown do docling, não reaproveitável aqui)
+        self.reaproveitaveis_ids = set(
+            ManualProcessado.objects.filter(origem=ManualProcessado.ORIGEM_TEXTO).values_list('manual_id', flat=True)
+        )
         
         # Busca manuais que ainda não foram processados
         if force:
             manuais = Manual.objects.all()
             self.stdout.write(self.style.WARNING('Modo force ativado - reprocessando todos os manuais'))
         else:
-            manuais_processados_ids = ManualProcessado.objects.values_list('manual_id', flat=True)
-            manuais = Manual.objects.exclude(id__in=manuais_processados_ids)
+            manuais = Manual.objects.exclude(id__in=processados_ids)
+        
+        if options.get('ids'):
+            manuais = manuais.filter(id__in=options['ids'])
         
         if limit:
             manuais = manuais[:limit]
         
-        total = manuais.count()
-        self.stdout.write(f'Processando {total} manuais...')
+        manuais = list(manuais)
+        total = len(manuais)
+        self.stdout.write(f'Processando {total} manuais com {workers} worker(s)...')
         
-        for i, manual in enumerate(manuais, 1):
-            try:
-                self.stdout.write(f'[{i}/{total}] Processando: {manual.title}')
-                
-                # Remove manual processado existente se force=True
-                if force:
-                    ManualProcessado.objects.filter(manual=manual).delete()
-                
-                # Busca o conteúdo HTML da URL do manual
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                    'Accept-Language': 'pt-BR,pt;q=0.9,en;q=0.8',
-                }
-                
-                response = requests.get(manual.url, headers=headers, verify=False, timeout=30)
-                response.raise_for_status()
-                
-                # Processa o HTML para extrair conteúdo principal
-                soup = BeautifulSoup(response.text, 'html.parser')
-                
-                # Encontrar o conteúdo principal (usando lógica do manual_converter.py)
-                main_content = soup.find('div', class_=lambda x: x and 'article-content' in x)
-                
-                if not main_content:
-                    main_content = soup.find('article')
-                
-                if not main_content:
-                    main_content = soup.find('div', class_=lambda x: x and 'content' in ' '.join(x).lower())
-                
-                if not main_content:
-                    # Procurar pela div com mais texto
-                    all_divs = soup.find_all('div')
-                    if all_divs:
-                        text_lengths = [(div, len(div.get_text(strip=True))) for div in all_divs]
-                        text_lengths.sort(key=lambda x: x[1], reverse=True)
-                        main_content = text_lengths[0][0]
-                
-                if not main_content:
-                    raise Exception("Não foi possível encontrar o conteúdo principal")
-                
-                # Remove elementos desnecessários
-                for script in main_content(["script", "style", "nav", "header", "footer"]):
-                    script.decompose()
-                
-                # Extrai texto limpo
-                texto_limpo = main_content.get_text(separator='\n', strip=True)
-                
-                # Cria ou atualiza o ManualProcessado
-                manual_processado, created = ManualProcessado.objects.get_or_create(
-                    manual_id=manual.id,
-                    defaults={
-                        'titulo': manual.title,
-                        'url_original': manual.url,
-                        'conteudo_markdown': texto_limpo,
-                        'conteudo_html_original': str(main_content)
-                    }
-                )
-                
-                if not created:
-                    # Atualiza se já existe
-                    manual_processado.titulo = manual.title
-                    manual_processado.url_original = manual.url
-                    manual_processado.conteudo_markdown = texto_limpo
-                    manual_processado.conteudo_html_original = str(main_content)
-                    # Limpar imagens antigas
-                    manual_processado.imagens.all().delete()
-                
-                # Processa imagens usando lógica do manual_converter.py
-                base_url = '/'.join(manual.url.split('/')[:3])  # https://spartacus.movidesk.com
-                imagens_salvas = self.processar_imagens(main_content, base_url, manual_processado)
-                
-                # Atualiza total de imagens
-                manual_processado.total_imagens = len(imagens_salvas)
-                manual_processado.save()  # Isso gerará o embedding automaticamente
-                
-                self.stdout.write(
-                    self.style.SUCCESS(f'  ✓ Manual processado com {len(imagens_salvas)} imagens')
-                )
-                
-            except Exception as e:
-                logger.error(f'Erro ao processar manual {manual.title}: {e}')
-                self.stdout.write(
-                    self.style.ERROR(f'  ✗ Erro: {e}')
-                )
-                continue
+        # 🔹 Workers só baixam e processam; toda escrita no banco acontece nesta thread
+        progresso = Progresso(total)
+        processados = 0
+        inalterados = 0
+        falhas = 0
+        pendentes = iter(manuais)
+        em_andamento = set()
+        # Limita os resultados em memória (com as imagens já baixadas) a 2x os workers
+        max_em_andamento = workers * 2
+        
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            def agendar():
+                while len(em_andamento) < max_em_andamento:
+                    manual = next(pendentes, None)
+                    if manual is None:
+                        return
+                    em_andamento.add(executor.submit(self.baixar_manual, manual))
+            
+            agendar()
+            while em_andamento:
+                concluidos, _ = wait(em_andamento, return_when=FIRST_COMPLETED)
+                for futuro in concluidos:
+                    em_andamento.discard(futuro)
+                    baixado = futuro.result()
+                    progresso.avancar()
+                    self.stdout.write(f'{progresso} {baixado.manual.title}')
+                    situacao = self.persistir_manual(baixado)
+                    if situacao == 'processado':
+                        processados += 1
+                    elif situacao == 'inalterado':
+                        inalterados += 1
+                    else:
+                        falhas += 1
+                agendar()
         
         self.stdout.write(
-            self.style.SUCCESS(f'Processamento concluído! {total} manuais processados.')
+            self.style.SUCCESS(
+                f'Processamento concluído! {processados}/{total} manuais processados, '
+                f'{inalterados} sem alterações, em {progresso.decorrido:.1f}s.'
+            )
         )
-    
-    def processar_imagens(self, content, base_url, manual_processado):
-        """Processa imagens no conteúdo HTML e salva no banco de dados."""
-        imagens_salvas = []
-        
-        # Encontrar todas as imagens
-        img_tags = content.find_all('img')
-        self.stdout.write(f'  - Encontradas {len(img_tags)} imagens para processar')
-        
-        for i, img in enumerate(img_tags):
-            src = img.get('src')
-            if not src:
-                continue
-                
-            # Converter URL relativa para absoluta
-            if src.startswith('//'):
-                absolute_url = 'https:' + src
-            elif src.startswith('/'):
-                absolute_url = urljoin(base_url, src)
-            elif src.startswith('http'):
-                absolute_url = src
-            else:
-                absolute_url = urljoin(base_url, src)
-            
-            # Baixar e salvar a imagem no banco
-            alt_text = img.get('alt', 'Imagem')
-            imagem_obj = self.baixar_e_salvar_imagem(
-                absolute_url, 
-                manual_processado, 
-                ordem=i+1, 
-                alt_text=alt_text
+        # 🔹 Conteúdo novo pode ter virado (ou deixado de ser) cópia de outro manual ou atendimento
+        if processados and not options.get('sem_deduplicacao'):
+            duplicatas = deduplicar_documentos()
+            self.stdout.write(
+                f"{duplicatas['duplicatas']} de {duplicatas['documentos']} documentos marcados como quase duplicatas"
             )
-            
-            if imagem_obj:
-                imagens_salvas.append(imagem_obj)
-        
-        return imagens_salvas
+        # Chamado para manuais específicos (ex.: pela fila de tarefas), a falha precisa aparecer
+        if options.get('ids') and falhas:
+            raise CommandError(f'{falhas} manual(is) com erro')
+    
+    def baixar(self, url, **kwargs):
+        """GET pela sessão compartilhada, respeitando o limite de requisições por host."""
+        response = self.cliente.get(url, verify=False, **kwargs)
+        response.raise_for_status()
+        return response
     
-    def baixar_e_salvar_imagem(self, url, manual_processado, ordem, alt_text="Imagem"):
-        """Baixa uma imagem e salva no banco de dados."""
+    def baixar_manual(self, manual):
+        """Baixa e processa um manual. Executado nos workers, não acessa o banco."""
+        baixado = ManualBaixado(manual=manual)
+        pode_pular = self.usar_cache and manual.id in self.reaproveitaveis_ids
         try:
-            response = requests.get(url, stream=True, verify=False, timeout=30)
-            response.raise_for_status()
+            # Busca o conteúdo HTML da URL do manual
+            headers = dict(HEADERS_NAVEGADOR)
+            if pode_pular:
+                headers.update(cabecalhos_condicionais(manual.etag, manual.last_modified))
+            response = self.baixar(manual.url, headers=headers)
+            baixado.etag, baixado.last_modified = validadores(response)
             
-            # Gerar hash do conteúdo
-            content = response.content
-            hash_obj = hashlib.md5(content)
-            hash_hex = hash_obj.hexdigest()
+            # 🔹 304: página não mudou desde a última coleta
+            if response.status_code == 304:
+                baixado.inalterado = True
+                return baixado
             
-            # Verificar se já existe uma imagem com este hash para este manual
-            existing_image = ImagemManual.objects.filter(
-                manual_processado=manual_processado,
-                hash_conteudo=hash_hex
-            ).first()
+            # Processa o HTML para extrair conteúdo principal (já sem scripts e navegação)
+            main_content = extrair_conteudo(response.text)
             
-            if existing_image:
-                self.stdout.write(f'    - Imagem já existe: {existing_image.nome_arquivo}')
-                return existing_image
+            # Extrai texto limpo
+            baixado.texto_limpo = texto_do_conteudo(main_content)
+            baixado.html = str(main_content)
+            baixado.hash_conteudo = hash_do_conteudo(main_content)
             
-            # Determinar extensão do arquivo
-            content_type = response.headers.get('content-type', '')
-            if 'jpeg' in content_type or 'jpg' in content_type:
-                ext = '.jpg'
-            elif 'png' in content_type:
-                ext = '.png'
-            elif 'gif' in content_type:
-                ext = '.gif'
-            else:
-                ext = '.jpg'  # default
+            # Mesmo texto da última coleta: dispensa imagens e embedding
+            if pode_pular and baixado.hash_conteudo == manual.hash_conteudo:
+                baixado.inalterado = True
+                return baixado
             
-            filename = f"manual_{manual_processado.manual_id}_img_{hash_hex[:8]}{ext}"
+            base_url = '/'.join(manual.url.split('/')[:3])  # https://spartacus.movidesk.com
+            baixado.imagens = self.baixar_imagens(main_content, base_url)
             
-            # Criar objeto ContentFile
-            content_file = ContentFile(content, name=filename)
+            # O embedding também é uma chamada de rede, então sai da thread de escrita
+            if baixado.texto_limpo:
+                try:
+                    baixado.embedding = gerar_embeddings(baixado.texto_limpo)
+                except Exception as e:
+                    logger.error(f'Erro ao gerar embedding do manual {manual.title}: {e}')
+        except Exception as e:
+            baixado.erro = e
+        return baixado
+    
+    def baixar_imagens(self, content, base_url):
+        """Baixa as imagens do conteúdo HTML pelo armazém, ignorando repetidas na mesma página."""
+        imagens_pagina = urls_das_imagens(content, base_url)
+        armazenadas = self.armazem.baixar_varias(url for url, _, _ in imagens_pagina)
+        
+        imagens = []
+        hashes = set()
+        for url, alt_text, ordem in imagens_pagina:
+            armazenada = armazenadas.get(url)
+            if not armazenada or armazenada.hash_conteudo in hashes:
+                continue
+            hashes.add(armazenada.hash_conteudo)
+            imagens.append(ImagemBaixada(armazenada=armazenada, alt_text=alt_text, ordem=ordem))
+        
+        return imagens
+    
+    def persistir_manual(self, baixado):
+        """Grava um manual baixado. Chamado apenas pela thread principal."""
+        manual = baixado.manual
+        if baixado.erro is not None:
+            logger.error(f'Erro ao processar manual {manual.title}: {baixado.erro}')
+            self.stdout.write(self.style.ERROR(f'  ✗ Erro: {baixado.erro}'))
+            return None
+        
+        if baixado.inalterado:
+            # Um 304 pode omitir os validadores: mantém os já guardados
+            manual.registrar_coleta(baixado.etag or manual.etag, baixado.last_modified or manual.last_modified)
+            self.stdout.write('  = Sem alterações')
+            return 'inalterado'
+        
+        try:
+            # 🔹 Um manual = uma transação: manual, imagens (num único INSERT) e validadores
+            with transaction.atomic():
+                manual_processado = ManualProcessado.objects.filter(manual_id=manual.id).first()
+                if manual_processado is None:
+                    manual_processado = ManualProcessado(manual_id=manual.id)
+                else:
+                    # Limpar imagens antigas
+                    manual_processado.imagens.all().delete()
+                
+                manual_processado.titulo = manual.title
+                manual_processado.url_original = manual.url
+                manual_processado.conteudo_markdown = baixado.texto_limpo
+                manual_processado.conteudo_html_original = baixado.html
+                manual_processado.origem = ManualProcessado.ORIGEM_TEXTO
+                # Embedding já calculado pelo worker; sem ele, o save() gera novamente
+                manual_processado.embedding = None
+                manual_processado.set_embedding(baixado.embedding)
+                
+                if manual_processado.pk is None:
+                    # As imagens precisam da chave do manual
+                    manual_processado.save()
+                
+                imagens_salvas = registrar_imagens(manual_processado, [
+                    (b.armazenada, b.ordem, b.alt_text) for b in baixado.imagens
+                ])
+                
+                # Atualiza total de imagens (e o bloco de contexto, já com as imagens)
+                manual_processado.total_imagens = len(imagens_salvas)
+                manual_processado.save()
+                manual.registrar_coleta(baixado.etag, baixado.last_modified, baixado.hash_conteudo)
             
-            # Criar e salvar a imagem no banco
-            imagem = ImagemManual.objects.create(
-                manual_processado=manual_processado,
-                url_original=url,
-                nome_arquivo=filename,
-                alt_text=alt_text,
-                ordem=ordem,
-                hash_conteudo=hash_hex,
-                tamanho_bytes=len(content)
+            self.stdout.write(
+                self.style.SUCCESS(f'  ✓ Manual processado com {len(imagens_salvas)} imagens')
             )
-            
-            # Salvar o arquivo
-            imagem.arquivo_imagem.save(filename, content_file, save=True)
-            
-            self.stdout.write(f'    - Imagem salva: {filename}')
-            return imagem
+            return 'processado'
             
         except Exception as e:
-            logger.error(f'Erro ao baixar e salvar imagem {url}: {e}')
-            return None
\ No newline at end of file
+            logger.error(f'Erro ao processar manual {manual.title}: {e}')
+            self.stdout.write(
+                self.style.ERROR(f'  ✗ Erro: {e}')
+            )
+            return None
@@ -0,0 +1,100 @@
+import subprocess
+import sys
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from agent_ai.tarefas import executar_proxima, liberar_abandonadas, nome_worker
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Segundos entre as verificações de tarefas abandonadas por workers que morreram
+INTERVALO_LIBERACAO = 60
+
+
+class Command(BaseCommand):
+    help = 'Executa as tarefas em segundo plano (busca e processamento de manuais)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processos',
+            type=int,
+            default=1,
+            help='Quantidade de processos worker'
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=2.0,
+            help='Segundos de espera quando a fila está vazia'
+        )
+        parser.add_argument(
+            '--uma-vez',
+            action='store_true',
+            help='Executa as tarefas pendentes e termina'
+        )
+
+    def handle(self, *args, **options):
+        processos = max(1, options.get('processos') or 1)
+        if processos > 1:
+            return self.supervisionar(processos, options)
+        self.executar_loop(options.get('intervalo'), options.get('uma_vez'))
+
+    def supervisionar(self, processos, options):
+        """Sobe N processos worker independentes (um manage.py cada) e aguarda."""
+        comando = [sys.executable, sys.argv[0], 'worker_tarefas', '--processos', '1',
+                   '--intervalo', str(options.get('intervalo'))]
+        if options.get('uma_vez'):
+            comando.append('--uma-vez')
+
+        filhos = [subprocess.Popen(comando) for _ in range(processos)]
+        self.stdout.write(f'{processos} processos worker iniciados: {[f.pid for f in filhos]}')
+        try:
+            for filho in filhos:
+                filho.wait()
+        except KeyboardInterrupt:
+            for filho in filhos:
+                filho.terminate()
+            for filho in filhos:
+                filho.wait()
+
+    def liberar_abandonadas(self):
+        try:
+            liberadas = liberar_abandonadas()
+        except Exception as e:
+            logger.error(f'Erro ao liberar tarefas abandonadas: {e}')
+            return
+        if liberadas:
+            self.stdout.write(self.style.WARNING(f'{liberadas} tarefas abandonadas devolvidas à fila'))
+
+    def executar_loop(self, intervalo, uma_vez):
+        worker = nome_worker()
+        self.liberar_abandonadas()
+        proxima_liberacao = time.monotonic() + INTERVALO_LIBERACAO
+        self.stdout.write(f'Worker {worker} aguardando tarefas...')
+
+        try:
+            while True:
+                close_old_connections()
+                # 🔹 Outro worker pode ter morrido com este rodando: verifica de tempos em tempos
+                if time.monotonic() >= proxima_liberacao:
+                    self.liberar_abandonadas()
+                    proxima_liberacao = time.monotonic() + INTERVALO_LIBERACAO
+                try:
+                    resultado = executar_proxima(worker)
+                except Exception as e:
+                    # Erro de banco ao reservar: espera e tenta de novo
+                    logger.error(f'Erro no worker {worker}: {e}')
+                    resultado = None
+
+                if resultado is None:
+                    if uma_vez:
+                        break
+                    time.sleep(intervalo)
+                elif resultado:
+                    self.stdout.write(self.style.SUCCESS('  ✓ Tarefa concluída'))
+                else:
+                    self.stdout.write(self.style.ERROR('  ✗ Tarefa com erro'))
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f'Worker {worker} finalizado.')
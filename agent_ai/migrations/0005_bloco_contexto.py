@@ -0,0 +1,88 @@
+# Generated by Django 5.1.7 on 2026-10-19 16:09
+
+import re
+
+from django.db import migrations, models
+
+# Cópia congelada de agent_ai.contexto no momento desta migração: mudanças
+# posteriores no módulo não alteram o que ela faz
+
+MAX_CHARS_CONTEXTO = 1500
+MAX_IMAGENS_CONTEXTO = 10
+
+_RE_SECAO_IMAGENS = re.compile(r'\n+## Imagens do Manual\n.*\Z', re.S)
+_RE_IMAGEM_MARKDOWN = re.compile(r'!\[([^\]]*)\]\([^)]*\)')
+_RE_ESPACOS = re.compile(r'[ \t\r\f\v]+')
+_RE_QUEBRAS = re.compile(r'\s*\n\s*\n\s*')
+
+
+def limpar_texto_contexto(texto, max_chars=MAX_CHARS_CONTEXTO):
+    texto = _RE_SECAO_IMAGENS.sub('', texto or '')
+    texto = _RE_IMAGEM_MARKDOWN.sub(lambda m: f"[imagem: {m.group(1) or 'Imagem'}]", texto)
+    texto = _RE_ESPACOS.sub(' ', texto)
+    texto = _RE_QUEBRAS.sub('\n\n', texto).strip()
+    if len(texto) > max_chars:
+        texto = texto[:max_chars].rsplit(' ', 1)[0]
+    return texto
+
+
+def montar_bloco_contexto(fonte, texto):
+    return f"CONTEXTO DO SISTEMA ({fonte}): {limpar_texto_contexto(texto)}"
+
+
+def descrever_imagem(imagem):
+    return {
+        'url': imagem.arquivo_imagem.url if imagem.arquivo_imagem else None,
+        'alt_text': imagem.alt_text,
+        'nome_arquivo': imagem.nome_arquivo,
+        'ordem': imagem.ordem
+    }
+
+
+def preencher_blocos_contexto(apps, schema_editor):
+    ManualProcessado = apps.get_model('agent_ai', 'ManualProcessado')
+    Resposta = apps.get_model('agent_ai', 'Resposta')
+
+    imagens_por_manual = {}
+    for manual in ManualProcessado.objects.prefetch_related('imagens'):
+        imagens = [descrever_imagem(imagem) for imagem in list(manual.imagens.all())[:MAX_IMAGENS_CONTEXTO]]
+        imagens_por_manual[manual.manual_id] = imagens
+        manual.bloco_contexto = montar_bloco_contexto(f"Manual: {manual.titulo}", manual.conteudo_markdown)
+        manual.imagens_contexto = imagens
+        manual.save(update_fields=['bloco_contexto', 'imagens_contexto'])
+
+    for resposta in Resposta.objects.select_related('manual'):
+        resposta.bloco_contexto = montar_bloco_contexto(f"Manual: {resposta.manual.title}", resposta.content)
+        resposta.imagens_contexto = imagens_por_manual.get(resposta.manual_id, [])
+        resposta.save(update_fields=['bloco_contexto', 'imagens_contexto'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agent_ai', '0004_manualprocessado_imagemmanual'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='manualprocessado',
+            name='bloco_contexto',
+            field=models.TextField(blank=True, help_text='Contexto pronto para o prompt, gerado ao salvar'),
+        ),
+        migrations.AddField(
+            model_name='manualprocessado',
+            name='imagens_contexto',
+            field=models.JSONField(blank=True, default=list, help_text='Imagens enviadas junto com a resposta'),
+        ),
+        migrations.AddField(
+            model_name='resposta',
+            name='bloco_contexto',
+            field=models.TextField(blank=True, help_text='Contexto pronto para o prompt, gerado ao salvar'),
+        ),
+        migrations.AddField(
+            model_name='resposta',
+            name='imagens_contexto',
+            field=models.JSONField(blank=True, default=list, help_text='Imagens do manual enviadas junto com a resposta'),
+        ),
+        migrations.RunPython(preencher_blocos_contexto, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.7 on 2026-10-19 16:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agent_ai', '0005_bloco_contexto'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='manual',
+            name='etag',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='manual',
+            name='hash_conteudo',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='manual',
+            name='last_modified',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
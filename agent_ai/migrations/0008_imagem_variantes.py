@@ -0,0 +1,28 @@
+# Generated by Django 5.1.7 on 2026-10-19 16:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agent_ai', '0007_tarefa'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagemmanual',
+            name='altura',
+            field=models.IntegerField(blank=True, help_text='Altura da imagem original em pixels', null=True),
+        ),
+        migrations.AddField(
+            model_name='imagemmanual',
+            name='largura',
+            field=models.IntegerField(blank=True, help_text='Largura da imagem original em pixels', null=True),
+        ),
+        migrations.AddField(
+            model_name='imagemmanual',
+            name='variantes',
+            field=models.JSONField(blank=True, default=list, help_text='Miniaturas e versão WebP: [{nome, largura, altura}], da menor para a maior'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.7 on 2026-10-19 16:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agent_ai', '0008_imagem_variantes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TurnoTicket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('id_ticket', models.IntegerField(db_index=True, help_text='ID do ticket no Movidesk')),
+                ('assunto', models.CharField(blank=True, max_length=255)),
+                ('ordem', models.IntegerField(help_text='Posição do turno no atendimento')),
+                ('pergunta', models.TextField()),
+                ('resposta', models.TextField()),
+                ('hash_ticket', models.CharField(help_text='Hash do atendimento inteiro, para reingestão incremental', max_length=64)),
+                ('hash_conteudo', models.CharField(help_text='Hash do texto do turno, para reaproveitar o embedding', max_length=64)),
+                ('embedding', models.TextField(blank=True, null=True)),
+                ('bloco_contexto', models.TextField(blank=True, help_text='Contexto pronto para o prompt, gerado ao salvar')),
+                ('imagens_contexto', models.JSONField(blank=True, default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Turno de Atendimento',
+                'verbose_name_plural': 'Turnos de Atendimento',
+                'ordering': ['id_ticket', 'ordem'],
+                'unique_together': {('id_ticket', 'ordem')},
+            },
+        ),
+    ]
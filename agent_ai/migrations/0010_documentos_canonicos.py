@@ -0,0 +1,33 @@
+# Generated by Django 5.1.7 on 2026-10-19 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agent_ai', '0009_turnoticket'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='manualprocessado',
+            name='canonico',
+            field=models.CharField(blank=True, db_index=True, help_text="Documento canônico ('manual:12', 'turno:345') quando este é uma quase duplicata; fica fora da busca", max_length=40),
+        ),
+        migrations.AddField(
+            model_name='manualprocessado',
+            name='similaridade_canonico',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='turnoticket',
+            name='canonico',
+            field=models.CharField(blank=True, db_index=True, help_text="Documento canônico ('manual:12', 'turno:345') quando este é uma quase duplicata; fica fora da busca", max_length=40),
+        ),
+        migrations.AddField(
+            model_name='turnoticket',
+            name='similaridade_canonico',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
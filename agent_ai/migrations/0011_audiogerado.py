@@ -0,0 +1,31 @@
+# Generated by Django 5.1.7 on 2026-10-19 16:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agent_ai', '0010_documentos_canonicos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AudioGerado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash_texto', models.CharField(max_length=64, unique=True)),
+                ('nome_arquivo', models.CharField(help_text='Caminho relativo ao MEDIA_ROOT', max_length=255)),
+                ('idioma', models.CharField(max_length=10)),
+                ('lento', models.BooleanField(default=False)),
+                ('caracteres', models.IntegerField(default=0)),
+                ('tamanho_bytes', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Áudio Gerado',
+                'verbose_name_plural': 'Áudios Gerados',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-19 16:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agent_ai', '0011_audiogerado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mensagem',
+            name='audio_status',
+            field=models.CharField(blank=True, choices=[('', 'Sem áudio'), ('pendente', 'Na fila'), ('gerando', 'Gerando'), ('pronto', 'Pronto'), ('falhou', 'Falhou'), ('indisponivel', 'Indisponível')], default='', max_length=12),
+        ),
+        migrations.AddField(
+            model_name='mensagem',
+            name='audio_url',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
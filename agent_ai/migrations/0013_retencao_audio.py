@@ -0,0 +1,24 @@
+# Generated by Django 5.1.7 on 2026-10-19 17:00
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agent_ai', '0012_mensagem_audio'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='audiogerado',
+            name='ultimo_acesso',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='mensagem',
+            name='audio_url',
+            field=models.CharField(blank=True, db_index=True, max_length=255),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 17:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agent_ai', '0013_retencao_audio'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='manualprocessado',
+            name='origem',
+            field=models.CharField(blank=True, choices=[('', 'Desconhecida'), ('texto', 'Texto extraído (processar_manuais)'), ('docling', 'Markdown do docling (manual_converter)')], default='', max_length=10),
+        ),
+    ]
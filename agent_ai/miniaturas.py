@@ -0,0 +1,98 @@
+import logging
+import os
+import tempfile
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from agent_ai.arquivos import permissoes_padrao
+
+logger = logging.getLogger(__name__)
+
+# Larguras das miniaturas (1x e 2x do card de 150px do chat) e qualidade do WebP
+LARGURAS_MINIATURA = (320, 640)
+QUALIDADE_WEBP = 80
+
+
+def nome_variante(nome, largura=None):
+    """manuais/imagens/ab/<sha>.png -> manuais/imagens/ab/<sha>_320.webp (ou <sha>.webp)"""
+    base = os.path.splitext(nome)[0]
+    return f"{base}_{largura}.webp" if largura else f"{base}.webp"
+
+
+def _para_webp(imagem):
+    """Converte para um modo aceito pelo WebP e devolve os bytes codificados."""
+    if imagem.mode not in ('RGB', 'RGBA'):
+        imagem = imagem.convert('RGBA' if 'transparency' in imagem.info or imagem.mode in ('LA', 'PA') else 'RGB')
+    buffer = BytesIO()
+    imagem.save(buffer, 'WEBP', quality=QUALIDADE_WEBP, method=4)
+    return buffer.getvalue()
+
+
+def _gravar(nome, conteudo):
+    """Grava a variante no storage (rename atômico quando o storage é em disco)."""
+    try:
+        destino = default_storage.path(nome)
+    except NotImplementedError:
+        if not default_storage.exists(nome):
+            default_storage.save(nome, ContentFile(conteudo))
+        return
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(destino), prefix='.gerando-', delete=False) as tmp:
+        tmp.write(conteudo)
+    permissoes_padrao(tmp.name)
+    os.replace(tmp.name, destino)
+
+
+def gerar_variantes(nome, larguras=LARGURAS_MINIATURA, refazer=False):
+    """Gera as miniaturas WebP e a versão WebP em tamanho original de uma imagem do storage.
+
+    Retorna (largura, altura, variantes), com variantes = [{'nome', 'largura',
+    'altura'}] em ordem crescente de largura. Variantes que já existem não são
+    refeitas (o nome deriva do hash do conteúdo), a menos que `refazer` seja
+    True (ex.: depois de mudar a qualidade ou o redimensionamento). Em caso
+    de erro, devolve (None, None, []) e a imagem segue sendo servida no
+    formato original.
+    """
+    try:
+        with default_storage.open(nome, 'rb') as arquivo:
+            with Image.open(arquivo) as original:
+                original.load()
+                imagem = ImageOps.exif_transpose(original)
+    except Exception as e:
+        logger.warning(f"Não foi possível abrir {nome} para gerar miniaturas: {e}")
+        return None, None, []
+
+    largura, altura = imagem.size
+    variantes = []
+    try:
+        for alvo in sorted(larguras):
+            if alvo >= largura:
+                # Não amplia: a versão WebP em tamanho original cobre este caso
+                break
+            nome_miniatura = nome_variante(nome, alvo)
+            altura_miniatura = max(1, round(altura * alvo / largura))
+            if refazer or not default_storage.exists(nome_miniatura):
+                miniatura = imagem.resize((alvo, altura_miniatura), Image.LANCZOS, reducing_gap=3.0)
+                _gravar(nome_miniatura, _para_webp(miniatura))
+            variantes.append({'nome': nome_miniatura, 'largura': alvo, 'altura': altura_miniatura})
+
+        nome_webp = nome_variante(nome)
+        if nome_webp != nome and (refazer or not default_storage.exists(nome_webp)):
+            _gravar(nome_webp, _para_webp(imagem))
+        variantes.append({'nome': nome_webp, 'largura': largura, 'altura': altura})
+    except Exception as e:
+        logger.warning(f"Erro ao gerar miniaturas de {nome}: {e}")
+        return largura, altura, []
+    return largura, altura, variantes
+
+
+def url_variante(variante):
+    return default_storage.url(variante['nome'])
+
+
+def srcset(variantes):
+    """Atributo srcset do <img> a partir das variantes."""
+    return ', '.join(f"{url_variante(v)} {v['largura']}w" for v in variantes)
@@ -1,21 +1,38 @@
 from django.db import models
 import json
 import numpy as np
+import threading
 import uuid
+from django.db.models import Count, Max
 from django.utils import timezone
 from agent_ai.embedding import gerar_embeddings
+from agent_ai.contexto import MAX_IMAGENS_CONTEXTO, descrever_imagem, montar_bloco_contexto
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
 
 class Manual(models.Model):
     title = models.CharField(max_length=255)
     url = models.URLField(unique=True)
+    # Validadores HTTP e hash do texto extraído na última coleta, usados para
+    # pular manuais que não mudaram
+    etag = models.CharField(max_length=255, blank=True)
+    last_modified = models.CharField(max_length=64, blank=True)
+    hash_conteudo = models.CharField(max_length=64, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.title
 
+    def registrar_coleta(self, etag='', last_modified='', hash_conteudo=None):
+        """Guarda os validadores da última coleta sem disparar save() e o sinal post_save."""
+        self.etag = etag or ''
+        self.last_modified = last_modified or ''
+        campos = {'etag': self.etag, 'last_modified': self.last_modified}
+        if hash_conteudo is not None:
+            self.hash_conteudo = campos['hash_conteudo'] = hash_conteudo
+        Manual.objects.filter(pk=self.pk).update(**campos)
+
     def save(self, *args, **kwargs):
         print(f"Salvando manual: {self.title}")
         super().save(*args, **kwargs)
@@ -30,7 +47,8 @@ class Manual(models.Model):
 class RespostaManager(models.Manager):
     def buscar_por_similaridade(self, pergunta_embedding, limite_similaridade=0.4, top_k=5):
         """Busca as respostas mais similares usando cálculo vetorial otimizado."""
-        respostas = self.exclude(embedding__isnull=True).exclude(embedding__exact='')
+        # select_related evita uma consulta extra ao usar a resposta como contexto
+        respostas = self.exclude(embedding__isnull=True).exclude(embedding__exact='').select_related('manual')
         
         if not respostas.exists():
             return [], []
@@ -77,6 +95,8 @@ class Resposta(models.Model):
     manual = models.ForeignKey(Manual, on_delete=models.CASCADE, related_name="respostas")
     content = models.TextField()
     embedding = models.TextField(blank=True, null=True)
+    bloco_contexto = models.TextField(blank=True, help_text="Contexto pronto para o prompt, gerado ao salvar")
+    imagens_contexto = models.JSONField(default=list, blank=True, help_text="Imagens do manual enviadas junto com a resposta")
     created_at = models.DateTimeField(auto_now_add=True)
     
     objects = RespostaManager()
@@ -113,11 +133,19 @@ class Resposta(models.Model):
         
         return float(np.dot(meu_norm, outro_norm))
 
+    def atualizar_bloco_contexto(self):
+        """Pré-calcula o bloco de contexto e as imagens usados no prompt."""
+        self.bloco_contexto = montar_bloco_contexto(f"Manual: {self.manual.title}", self.content)
+        manual_processado = ManualProcessado.objects.filter(manual_id=self.manual_id).first()
+        self.imagens_contexto = manual_processado.imagens_contexto if manual_processado else []
+
     def save(self, *args, **kwargs):
-        """Gera embeddings automaticamente ao salvar, se necessário."""
+        """Gera embeddings e o bloco de contexto automaticamente ao salvar, se necessário."""
         if not self.embedding and self.content:
             embedding_data = gerar_embeddings(self.content)
             self.set_embedding(embedding_data)
+        if self.content and 'update_fields' not in kwargs:
+            self.atualizar_bloco_contexto()
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -169,12 +197,28 @@ class Mensagem(models.Model):
         ('pergunta', 'Pergunta do Usuário'),
         ('resposta', 'Resposta do Assistente'),
     ]
+    AUDIO_PENDENTE = 'pendente'
+    AUDIO_GERANDO = 'gerando'
+    AUDIO_PRONTO = 'pronto'
+    AUDIO_FALHOU = 'falhou'
+    AUDIO_INDISPONIVEL = 'indisponivel'
+    STATUS_AUDIO = [
+        ('', 'Sem áudio'),
+        (AUDIO_PENDENTE, 'Na fila'),
+        (AUDIO_GERANDO, 'Gerando'),
+        (AUDIO_PRONTO, 'Pronto'),
+        (AUDIO_FALHOU, 'Falhou'),
+        (AUDIO_INDISPONIVEL, 'Indisponível'),
+    ]
     
     conversa = models.ForeignKey(Conversa, on_delete=models.CASCADE, related_name='mensagens')
     tipo = models.CharField(max_length=10, choices=TIPOS_MENSAGEM)
     conteudo = models.TextField()
     resposta_relacionada = models.ForeignKey(Resposta, on_delete=models.SET_NULL, null=True, blank=True)
     similaridade = models.FloatField(null=True, blank=True)
+    audio_status = models.CharField(max_length=12, choices=STATUS_AUDIO, default='', blank=True)
+    # Indexado para a limpeza dos áudios encontrar as mensagens que apontam para um arquivo removido
+    audio_url = models.CharField(max_length=255, blank=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
@@ -191,7 +235,8 @@ class ManualProcessadoManager(models.Manager):
         """Busca manuais por similaridade semântica."""
         resultados = []
         
-        for manual in self.filter(embedding__isnull=False).exclude(embedding=''):
+        # Quase duplicatas ficam de fora: o canônico do grupo já representa o conteúdo
+        for manual in self.filter(embedding__isnull=False, canonico='').exclude(embedding=''):
             try:
                 manual_embedding = manual.get_embedding()
                 if not manual_embedding:
@@ -228,13 +273,26 @@ class ManualProcessadoManager(models.Manager):
 
 class ManualProcessado(models.Model):
     """Modelo para armazenar manuais processados com conteúdo markdown."""
+    ORIGEM_TEXTO = 'texto'
+    ORIGEM_DOCLING = 'docling'
+    ORIGENS = [
+        ('', 'Desconhecida'),
+        (ORIGEM_TEXTO, 'Texto extraído (processar_manuais)'),
+        (ORIGEM_DOCLING, 'Markdown do docling (manual_converter)'),
+    ]
     manual_id = models.IntegerField(unique=True, help_text="ID original do manual")
     titulo = models.CharField(max_length=255)
     url_original = models.URLField()
     conteudo_markdown = models.TextField(help_text="Conteúdo do manual em formato markdown")
     conteudo_html_original = models.TextField(blank=True, help_text="HTML original para referência")
     embedding = models.TextField(blank=True, null=True, help_text="Embedding do conteúdo para busca semântica")
+    bloco_contexto = models.TextField(blank=True, help_text="Contexto pronto para o prompt, gerado ao salvar")
+    imagens_contexto = models.JSONField(default=list, blank=True, help_text="Imagens enviadas junto com a resposta")
     total_imagens = models.IntegerField(default=0)
+    # Pipeline que gerou o conteúdo: uma coleta sem alterações só reaproveita o da mesma origem
+    origem = models.CharField(max_length=10, choices=ORIGENS, default='', blank=True)
+    canonico = models.CharField(max_length=40, blank=True, db_index=True, help_text="Documento canônico ('manual:12', 'turno:345') quando este é uma quase duplicata; fica fora da busca")
+    similaridade_canonico = models.FloatField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -273,11 +331,27 @@ class ManualProcessado(models.Model):
         
         return float(np.dot(meu_norm, outro_norm))
     
+    def atualizar_bloco_contexto(self):
+        """Pré-calcula o bloco de contexto e as imagens usados no prompt."""
+        self.bloco_contexto = montar_bloco_contexto(f"Manual: {self.titulo}", self.conteudo_markdown)
+        if self.pk:
+            self.imagens_contexto = [
+                descrever_imagem(imagem) for imagem in self.imagens.all()[:MAX_IMAGENS_CONTEXTO]
+            ]
+        else:
+            self.imagens_contexto = []
+
     def save(self, *args, **kwargs):
         # Gerar embedding automaticamente se não existir
         if not self.embedding and self.conteudo_markdown:
             self.gerar_embedding()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            self.atualizar_bloco_contexto()
         super().save(*args, **kwargs)
+        # Respostas do mesmo manual usam as mesmas imagens (só quando elas foram recalculadas)
+        if update_fields is None or 'imagens_contexto' in update_fields:
+            Resposta.objects.filter(manual_id=self.manual_id).update(imagens_contexto=self.imagens_contexto)
     
     def __str__(self):
         return f"Manual {self.manual_id}: {self.titulo}"
@@ -298,6 +372,9 @@ class ImagemManual(models.Model):
     ordem = models.IntegerField(help_text="Ordem da imagem no manual")
     hash_conteudo = models.CharField(max_length=64, help_text="Hash do conteúdo da imagem para evitar duplicatas")
     tamanho_bytes = models.IntegerField(null=True, blank=True)
+    largura = models.IntegerField(null=True, blank=True, help_text="Largura da imagem original em pixels")
+    altura = models.IntegerField(null=True, blank=True, help_text="Altura da imagem original em pixels")
+    variantes = models.JSONField(default=list, blank=True, help_text="Miniaturas e versão WebP: [{nome, largura, altura}], da menor para a maior")
     created_at = models.DateTimeField(auto_now_add=True)
     
     def get_url_servida(self):
@@ -306,6 +383,13 @@ class ImagemManual(models.Model):
             return self.arquivo_imagem.url
         return None
     
+    def get_url_miniatura(self):
+        """URL da menor variante WebP (ou da imagem original, se não houver)."""
+        if self.variantes:
+            from agent_ai.miniaturas import url_variante
+            return url_variante(self.variantes[0])
+        return self.get_url_servida()
+    
     def __str__(self):
         return f"Imagem {self.ordem} - {self.nome_arquivo}"
     
@@ -314,3 +398,175 @@ class ImagemManual(models.Model):
         unique_together = ['manual_processado', 'ordem']
         verbose_name = "Imagem do Manual"
         verbose_name_plural = "Imagens dos Manuais"
+
+
+class TurnoTicketManager(models.Manager):
+    """Busca nos turnos de atendimento com uma matriz de embeddings em memória.
+
+    A matriz (já normalizada) é montada uma vez e só é refeita quando a
+    tabela muda (total de linhas ou último updated_at), então cada busca é
+    um único produto matriz-vetor em vez de decodificar milhares de JSONs.
+    """
+    _lock_cache = threading.Lock()
+    _cache = {'versao': None, 'ids': None, 'matriz': None}
+
+    def _versao(self):
+        resumo = self.get_queryset().aggregate(total=Count('id'), ultima=Max('updated_at'))
+        return resumo['total'], resumo['ultima']
+
+    def _matriz(self):
+        versao = self._versao()
+        with self._lock_cache:
+            if self._cache['versao'] != versao:
+                ids, vetores = [], []
+                registros = (self.get_queryset().filter(canonico='').exclude(embedding__isnull=True)
+                             .exclude(embedding='').values_list('id', 'embedding'))
+                for turno_id, embedding in registros.iterator():
+                    try:
+                        vetores.append(json.loads(embedding))
+                        ids.append(turno_id)
+                    except (ValueError, TypeError):
+                        # Pula embeddings corrompidos
+                        continue
+                matriz = np.array(vetores, dtype=np.float32) if vetores else np.zeros((0, 0), dtype=np.float32)
+                if len(matriz):
+                    matriz /= np.linalg.norm(matriz, axis=1, keepdims=True)
+                self._cache.update(versao=versao, ids=np.array(ids), matriz=matriz)
+            return self._cache['ids'], self._cache['matriz']
+
+    def buscar_por_similaridade(self, pergunta_embedding, limite_similaridade=0.4, top_k=5):
+        """Turnos mais similares à pergunta, com as similaridades."""
+        ids, matriz = self._matriz()
+        if not len(ids):
+            return [], []
+
+        pergunta = np.asarray(pergunta_embedding, dtype=np.float32)
+        similaridades = matriz @ (pergunta / np.linalg.norm(pergunta))
+        candidatos = np.flatnonzero(similaridades > limite_similaridade)
+        if not len(candidatos):
+            return [], []
+        melhores = candidatos[np.argsort(-similaridades[candidatos])[:top_k]]
+
+        por_id = self.in_bulk([int(ids[i]) for i in melhores])
+        resultados = [(por_id[int(ids[i])], float(similaridades[i])) for i in melhores if int(ids[i]) in por_id]
+        if not resultados:
+            return [], []
+        turnos, valores = zip(*resultados)
+        return list(turnos), list(valores)
+
+    def buscar_melhor_turno(self, pergunta_embedding, limite_similaridade=0.4):
+        """Retorna apenas o turno mais similar à pergunta."""
+        turnos, similaridades = self.buscar_por_similaridade(pergunta_embedding, limite_similaridade, top_k=1)
+        if turnos:
+            return turnos[0], similaridades[0]
+        return None, 0.0
+
+
+class TurnoTicket(models.Model):
+    """Pergunta do cliente e resposta do suporte extraídas de um chat do Movidesk."""
+    id_ticket = models.IntegerField(db_index=True, help_text="ID do ticket no Movidesk")
+    assunto = models.CharField(max_length=255, blank=True)
+    ordem = models.IntegerField(help_text="Posição do turno no atendimento")
+    pergunta = models.TextField()
+    resposta = models.TextField()
+    hash_ticket = models.CharField(max_length=64, help_text="Hash do atendimento inteiro, para reingestão incremental")
+    hash_conteudo = models.CharField(max_length=64, help_text="Hash do texto do turno, para reaproveitar o embedding")
+    embedding = models.TextField(blank=True, null=True)
+    bloco_contexto = models.TextField(blank=True, help_text="Contexto pronto para o prompt, gerado ao salvar")
+    # Atendimentos não têm imagens; o campo mantém a mesma interface dos outros contextos
+    imagens_contexto = models.JSONField(default=list, blank=True)
+    canonico = models.CharField(max_length=40, blank=True, db_index=True, help_text="Documento canônico ('manual:12', 'turno:345') quando este é uma quase duplicata; fica fora da busca")
+    similaridade_canonico = models.FloatField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = TurnoTicketManager()
+
+    @property
+    def texto(self):
+        return f"Cliente: {self.pergunta}\n\nSuporte: {self.resposta}"
+
+    def set_embedding(self, embedding):
+        self.embedding = json.dumps(list(embedding))
+
+    def get_embedding(self):
+        if not self.embedding:
+            return None
+        try:
+            return json.loads(self.embedding)
+        except json.JSONDecodeError:
+            return None
+
+    def atualizar_bloco_contexto(self):
+        """Pré-calcula o bloco de contexto usado no prompt."""
+        self.bloco_contexto = montar_bloco_contexto(f"Atendimento #{self.id_ticket}: {self.assunto}", self.texto)
+        self.imagens_contexto = []
+
+    def save(self, *args, **kwargs):
+        if 'update_fields' not in kwargs:
+            self.atualizar_bloco_contexto()
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"Ticket {self.id_ticket} #{self.ordem}: {self.pergunta[:50]}"
+
+    class Meta:
+        ordering = ['id_ticket', 'ordem']
+        unique_together = ['id_ticket', 'ordem']
+        verbose_name = "Turno de Atendimento"
+        verbose_name_plural = "Turnos de Atendimento"
+
+
+class Tarefa(models.Model):
+    """Tarefa em segundo plano (busca/processamento de manuais), executada pelo worker_tarefas."""
+    STATUS = [
+        ('pendente', 'Pendente'),
+        ('executando', 'Executando'),
+        ('concluida', 'Concluída'),
+        ('falhou', 'Falhou'),
+    ]
+    
+    tipo = models.CharField(max_length=50)
+    manual = models.ForeignKey(Manual, on_delete=models.CASCADE, null=True, blank=True, related_name='tarefas')
+    parametros = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=12, choices=STATUS, default='pendente')
+    tentativas = models.IntegerField(default=0)
+    max_tentativas = models.IntegerField(default=3)
+    executar_apos = models.DateTimeField(default=timezone.now, help_text="Não executa antes deste horário (backoff entre tentativas)")
+    worker = models.CharField(max_length=100, blank=True)
+    resultado = models.JSONField(null=True, blank=True)
+    erro = models.TextField(blank=True)
+    iniciada_em = models.DateTimeField(null=True, blank=True)
+    concluida_em = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Tarefa {self.id} - {self.tipo} ({self.status})"
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'executar_apos'])]
+        verbose_name = "Tarefa"
+        verbose_name_plural = "Tarefas"
+
+
+class AudioGerado(models.Model):
+    """Áudio sintetizado de uma resposta, endereçado pelo hash de (idioma, velocidade, texto)."""
+    hash_texto = models.CharField(max_length=64, unique=True)
+    nome_arquivo = models.CharField(max_length=255, help_text="Caminho relativo ao MEDIA_ROOT")
+    idioma = models.CharField(max_length=10)
+    lento = models.BooleanField(default=False)
+    caracteres = models.IntegerField(default=0)
+    tamanho_bytes = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Base da expiração e da remoção LRU (agent_ai.retencao); gravado em lote, não a cada acesso
+    ultimo_acesso = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return self.nome_arquivo
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "Áudio Gerado"
+        verbose_name_plural = "Áudios Gerados"
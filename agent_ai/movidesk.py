@@ -0,0 +1,410 @@
+import calendar
+import datetime
+import json
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+
+from agent_ai.corpus import EscritorCorpus, gravar_corpus, ler_atuais
+from agent_ai.crawler import ClienteHTTP, LimitadorHost
+
+logger = logging.getLogger(__name__)
+
+TAMANHO_PAGINA = 100
+ANO_INICIAL = 2020
+STATUS_TICKETS = ('Novo', 'Em atendimento', 'Pausado', 'Resolvido', 'Fechado', 'Cancelado')
+# Ações vindas de chat (origin) e tipo de pessoa do cliente (personType)
+ORIGENS_CHAT = (3, 5, 6)
+PESSOA_CLIENTE = 3
+
+# Corpus em JSON Lines (agent_ai.corpus); use .jsonl.gz ou .jsonl.zst para comprimir
+ARQUIVO_SAIDA = 'conversas_movidesk.jsonl'
+# Formato antigo (array JSON), ainda legível por agent_ai.corpus.ler
+ARQUIVO_LEGADO = 'conversas_movidesk_completo.json'
+# A sincronização incremental volta este tanto antes da marca (relógios diferentes)
+MARGEM_SINCRONIZACAO = datetime.timedelta(minutes=10)
+# Além das retentativas da sessão HTTP: uma página que continua falhando
+# interrompe a exportação (o progresso fica salvo) em vez de tentar para sempre
+TENTATIVAS_PAGINA = 5
+ESPERA_PAGINA = 10
+# Tentativas dos detalhes de um ticket (somadas entre execuções) antes de desistir dele
+TENTATIVAS_TICKET = 3
+
+
+class ErroMovidesk(Exception):
+    """Falha persistente na API do Movidesk; a exportação pode ser retomada depois."""
+
+
+def erro_permanente(erro):
+    """True para respostas 4xx (exceto 429): ticket apagado ou inacessível, não adianta tentar de novo."""
+    response = getattr(erro, 'response', None)
+    if not isinstance(erro, requests.exceptions.HTTPError) or response is None:
+        return False
+    return 400 <= response.status_code < 500 and response.status_code != 429
+
+
+def meses_desde(ano_inicial, hoje=None):
+    """(ano, mes) de janeiro do ano inicial até o mês atual."""
+    hoje = hoje or datetime.date.today()
+    for ano in range(ano_inicial, hoje.year + 1):
+        limite_mes = hoje.month if ano == hoje.year else 12
+        for mes in range(1, limite_mes + 1):
+            yield ano, mes
+
+
+def chave_mes(ano, mes):
+    return f"{ano}-{mes:02d}"
+
+
+def _filtro_status():
+    return ' or '.join(f"status eq '{s}'" for s in STATUS_TICKETS)
+
+
+def filtro_do_mes(ano, mes):
+    """Filtro OData dos tickets criados no mês."""
+    primeiro_dia = f"{ano}-{mes:02d}-01T00:00:00.00z"
+    ultimo_dia = f"{ano}-{mes:02d}-{calendar.monthrange(ano, mes)[1]}T23:59:59.00z"
+    return f"(createdDate ge {primeiro_dia} and createdDate le {ultimo_dia}) and ({_filtro_status()})"
+
+
+def formatar_data_odata(momento):
+    """datetime (UTC) no formato aceito pelos filtros da API."""
+    return f"{momento:%Y-%m-%dT%H:%M:%S}.00z"
+
+
+def filtro_atualizados_desde(momento):
+    """Filtro OData dos tickets criados ou alterados a partir de `momento` (UTC)."""
+    return f"(lastUpdate ge {formatar_data_odata(momento)}) and ({_filtro_status()})"
+
+
+def agora_utc():
+    return datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+
+
+def formatar_conversa(dados_tkt):
+    """Registro {'id_ticket', 'assunto', 'dialogo_completo'} de um ticket com chat, ou None."""
+    linhas = []
+    for acao in dados_tkt.get('actions') or []:
+        if acao.get('origin') not in ORIGENS_CHAT:
+            continue
+        mensagem = acao.get('description', '')
+        if mensagem:
+            autor = "Cliente" if (acao.get('createdBy') or {}).get('personType') == PESSOA_CLIENTE else "Agente"
+            linhas.append(f"{autor}: {mensagem}\n")
+    if not linhas:
+        return None
+    return {
+        'id_ticket': dados_tkt.get('id'),
+        'assunto': dados_tkt.get('subject', 'Sem Assunto'),
+        'dialogo_completo': ''.join(linhas).strip(),
+    }
+
+
+def gravar_json_atomico(caminho, dados, **kwargs):
+    """Grava JSON num temporário e troca pelo arquivo final (nunca deixa um arquivo pela metade)."""
+    diretorio = os.path.dirname(os.path.abspath(caminho))
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=diretorio, delete=False, suffix='.tmp') as tmp:
+        json.dump(dados, tmp, ensure_ascii=False, **kwargs)
+    os.replace(tmp.name, caminho)
+
+
+class ClienteMovidesk:
+    """Acesso à API de tickets do Movidesk pela sessão HTTP compartilhada."""
+
+    def __init__(self, api_url=None, token=None, cliente=None):
+        self.api_url = api_url or settings.MOVIDESK_API_URL
+        self.token = token or settings.MOVIDESK_API_KEY
+        if not self.api_url or not self.token:
+            raise ErroMovidesk("Defina MOVIDESK_API_URL e MOVIDESK_API_KEY no .env")
+        self.cliente = cliente or ClienteHTTP(
+            limitador=LimitadorHost(max_conexoes=2, intervalo_minimo=0.2), timeout=45
+        )
+
+    def _get(self, **parametros):
+        return self.cliente.get(f"{self.api_url}tickets", params={'token': self.token, **parametros})
+
+    def listar(self, filtro, skip=0, top=TAMANHO_PAGINA):
+        """Uma página de tickets (id e assunto), em ordem estável de id."""
+        response = self._get(**{'$select': 'id,subject', '$top': top, '$skip': skip,
+                                '$filter': filtro, '$orderby': 'id'})
+        response.raise_for_status()
+        return response.json()
+
+    def detalhes(self, id_ticket):
+        """Ticket completo, com as ações. Lança exceção se a API não responder 200."""
+        response = self._get(id=id_ticket)
+        response.raise_for_status()
+        return response.json()
+
+
+class Checkpoint:
+    """Progresso da exportação: períodos concluídos, período/skip em andamento e tickets com falha
+    (id → tentativas feitas).
+
+    `modo` ('completa' ou 'incremental'), `desde` e `inicio` identificam a
+    execução interrompida, para que a retomada use os mesmos filtros.
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.modo = None
+        self.desde = None
+        self.inicio = None
+        self.periodos_concluidos = set()
+        self.periodo = None
+        self.skip = 0
+        self.falhas = {}
+
+    @property
+    def em_andamento(self):
+        return self.modo is not None
+
+    def carregar(self):
+        if os.path.exists(self.caminho):
+            with open(self.caminho, encoding='utf-8') as f:
+                estado = json.load(f)
+            self.modo = estado.get('modo', 'completa')
+            self.desde = estado.get('desde')
+            self.inicio = estado.get('inicio')
+            self.periodos_concluidos = set(estado.get('periodos_concluidos', estado.get('meses_concluidos', [])))
+            self.periodo = estado.get('periodo', estado.get('mes'))
+            self.skip = estado.get('skip', 0)
+            # Checkpoints antigos guardavam só a lista de ids
+            self.falhas = {
+                falha[0]: falha[1] if isinstance(falha, list) else 1 for falha in estado.get('falhas', [])
+            }
+        return self
+
+    def salvar(self):
+        gravar_json_atomico(self.caminho, {
+            'modo': self.modo,
+            'desde': self.desde,
+            'inicio': self.inicio,
+            'periodos_concluidos': sorted(self.periodos_concluidos),
+            'periodo': self.periodo,
+            'skip': self.skip,
+            'falhas': sorted([id_ticket, tentativas] for id_ticket, tentativas in self.falhas.items()),
+        })
+
+    def skip_do_periodo(self, chave):
+        return self.skip if self.periodo == chave else 0
+
+    def avancar(self, chave, skip):
+        self.periodo, self.skip = chave, skip
+        self.salvar()
+
+    def concluir_periodo(self, chave):
+        self.periodos_concluidos.add(chave)
+        self.periodo, self.skip = None, 0
+        self.salvar()
+
+    def remover(self):
+        if os.path.exists(self.caminho):
+            os.remove(self.caminho)
+
+
+class ExportadorMovidesk:
+    """Exporta as conversas de chat dos tickets de forma retomável.
+
+    A exportação completa percorre os meses desde o ano inicial; a
+    incremental pede só os tickets com lastUpdate a partir da marca da última
+    execução e os mescla no arquivo existente pelo id_ticket. Os detalhes dos
+    tickets de cada página são buscados em paralelo (limitados pelo
+    LimitadorHost do cliente). Cada página processada é anexada ao arquivo
+    parcial e registrada no checkpoint; se a execução parar, a próxima
+    continua do mesmo período e skip.
+    """
+
+    def __init__(self, api=None, saida=ARQUIVO_SAIDA, workers=4, escrever=None):
+        self.api = api or ClienteMovidesk()
+        self.saida = saida
+        self.caminho_parcial = f"{saida}.parcial.jsonl"
+        self.caminho_marca = f"{saida}.sincronizacao.json"
+        self.checkpoint = Checkpoint(f"{saida}.estado.json")
+        self.workers = max(1, workers)
+        self.escrever = escrever or logger.info
+        self.exportadas = 0
+
+    def _reparar_parcial(self):
+        """Descarta uma última linha incompleta (interrupção no meio da escrita)."""
+        if not os.path.exists(self.caminho_parcial):
+            return
+        with open(self.caminho_parcial, 'rb+') as f:
+            fim = f.seek(0, os.SEEK_END)
+            posicao = fim
+            # Lê de trás para frente só até achar a última quebra de linha
+            while posicao > 0:
+                inicio = max(0, posicao - 4096)
+                f.seek(inicio)
+                bloco = f.read(posicao - inicio)
+                if posicao == fim and bloco.endswith(b'\n'):
+                    return
+                quebra = bloco.rfind(b'\n')
+                if quebra >= 0:
+                    f.truncate(inicio + quebra + 1)
+                    return
+                posicao = inicio
+            f.truncate(0)
+
+    def _pagina(self, filtro, skip):
+        for tentativa in range(1, TENTATIVAS_PAGINA + 1):
+            try:
+                return self.api.listar(filtro, skip)
+            except (requests.exceptions.RequestException, ValueError) as e:
+                if tentativa == TENTATIVAS_PAGINA:
+                    raise ErroMovidesk(f"Página com skip {skip} falhou {TENTATIVAS_PAGINA} vezes: {e}") from e
+                espera = ESPERA_PAGINA * tentativa
+                self.escrever(f"      ❌ Erro ao buscar página: {e}. Tentando novamente em {espera}s...")
+                time.sleep(espera)
+
+    def _detalhar(self, id_ticket):
+        """(id, conversa ou None, erro ou None) — roda nas threads do pool."""
+        try:
+            return id_ticket, formatar_conversa(self.api.detalhes(id_ticket)), None
+        except Exception as e:
+            return id_ticket, None, e
+
+    def _gravar(self, arquivo, executor, ids):
+        """Busca os detalhes dos ids em paralelo e anexa as conversas ao arquivo parcial."""
+        for id_ticket, conversa, erro in executor.map(self._detalhar, ids):
+            if erro is not None:
+                tentativas = self.checkpoint.falhas.pop(id_ticket, 0) + 1
+                if erro_permanente(erro):
+                    # Ex.: ticket apagado entre a listagem e os detalhes
+                    logger.warning(f"Ticket {id_ticket} ignorado: {erro}")
+                elif tentativas >= TENTATIVAS_TICKET:
+                    logger.error(f"Ticket {id_ticket} ignorado após {tentativas} tentativas: {erro}")
+                else:
+                    logger.warning(f"Ticket {id_ticket}: {erro}")
+                    self.checkpoint.falhas[id_ticket] = tentativas
+                continue
+            self.checkpoint.falhas.pop(id_ticket, None)
+            if conversa:
+                arquivo.write(json.dumps(conversa, ensure_ascii=False) + '\n')
+                self.exportadas += 1
+        # Garante no disco o que o checkpoint vai dizer que foi feito
+        arquivo.flush()
+        os.fsync(arquivo.fileno())
+
+    def ultima_sincronizacao(self):
+        """Marca (datetime UTC) da última execução concluída, ou None."""
+        if not os.path.exists(self.caminho_marca):
+            return None
+        with open(self.caminho_marca, encoding='utf-8') as f:
+            return datetime.datetime.fromisoformat(json.load(f)['ultima_atualizacao'])
+
+    def _registrar_marca(self, inicio):
+        gravar_json_atomico(self.caminho_marca, {'ultima_atualizacao': inicio})
+
+    def _preparar(self, modo, reiniciar, desde=None):
+        """Carrega o checkpoint da execução interrompida (do mesmo modo) ou começa uma nova."""
+        if reiniciar:
+            self.checkpoint.remover()
+            if os.path.exists(self.caminho_parcial):
+                os.remove(self.caminho_parcial)
+        self.checkpoint.carregar()
+        if self.checkpoint.em_andamento:
+            if self.checkpoint.modo != modo:
+                raise ErroMovidesk(
+                    f"Há uma exportação {self.checkpoint.modo} interrompida; "
+                    f"conclua-a ou use --reiniciar para descartá-la"
+                )
+            self.escrever(f"Retomando a exportação {modo} iniciada em {self.checkpoint.inicio}")
+        else:
+            self.checkpoint.modo = modo
+            self.checkpoint.desde = desde.isoformat() if desde else None
+            # Marca gravada no fim: a próxima incremental parte do início desta execução
+            self.checkpoint.inicio = agora_utc().isoformat()
+            self.checkpoint.salvar()
+        self._reparar_parcial()
+
+    def _exportar_periodos(self, periodos):
+        """Percorre os períodos [(chave, filtro)] gravando as conversas no arquivo parcial."""
+        with ThreadPoolExecutor(max_workers=self.workers) as executor, \
+                open(self.caminho_parcial, 'a', encoding='utf-8') as arquivo:
+            for chave, filtro in periodos:
+                if chave in self.checkpoint.periodos_concluidos:
+                    continue
+                self.escrever(f"\nBuscando tickets do período {chave}...")
+                skip = self.checkpoint.skip_do_periodo(chave)
+
+                while True:
+                    lista_tkts = self._pagina(filtro, skip)
+                    if not lista_tkts:
+                        break
+                    self.escrever(f"   -> Página com {len(lista_tkts)} tickets (pulando {skip})")
+                    self._gravar(arquivo, executor, [tkt['id'] for tkt in lista_tkts])
+                    skip += len(lista_tkts)
+                    self.checkpoint.avancar(chave, skip)
+                    if len(lista_tkts) < TAMANHO_PAGINA:
+                        break
+
+                self.checkpoint.concluir_periodo(chave)
+                self.escrever(f"   -> {self.exportadas} conversas de chat exportadas nesta execução")
+
+            # 🔹 Tickets cujos detalhes falharam ganham uma nova chance no fim
+            if self.checkpoint.falhas:
+                self.escrever(f"Tentando novamente {len(self.checkpoint.falhas)} tickets com falha...")
+                self._gravar(arquivo, executor, sorted(self.checkpoint.falhas))
+                self.checkpoint.salvar()
+
+        if self.checkpoint.falhas:
+            raise ErroMovidesk(
+                f"{len(self.checkpoint.falhas)} tickets sem detalhes; execute novamente para tentar de novo"
+            )
+
+    def _finalizar(self, mesclar):
+        total = self.consolidar(mesclar=mesclar)
+        self._registrar_marca(self.checkpoint.inicio)
+        self.checkpoint.remover()
+        os.remove(self.caminho_parcial)
+        return total
+
+    def exportar(self, ano_inicial=ANO_INICIAL, reiniciar=False):
+        """Executa (ou retoma) a exportação completa e devolve o total de conversas no arquivo final."""
+        self._preparar('completa', reiniciar)
+        self._exportar_periodos(
+            (chave_mes(ano, mes), filtro_do_mes(ano, mes)) for ano, mes in meses_desde(ano_inicial)
+        )
+        return self._finalizar(mesclar=False)
+
+    def sincronizar(self, reiniciar=False, ano_inicial=ANO_INICIAL):
+        """Busca só os tickets criados ou alterados desde a última execução e os mescla na saída.
+
+        Sem marca anterior (ou sem arquivo de saída), faz a exportação completa.
+        """
+        marca = self.ultima_sincronizacao()
+        interrompida = Checkpoint(self.checkpoint.caminho).carregar()
+        if not reiniciar and interrompida.modo == 'completa':
+            self.escrever("Concluindo antes a exportação completa interrompida")
+            return self.exportar(ano_inicial=ano_inicial)
+        # Reiniciar descarta a incremental interrompida, que então não serve de ponto de partida
+        retomar = interrompida.modo == 'incremental' and interrompida.desde is not None and not reiniciar
+        if not retomar and (marca is None or not os.path.exists(self.saida)):
+            self.escrever("Nenhuma sincronização anterior; fazendo a exportação completa")
+            return self.exportar(ano_inicial=ano_inicial, reiniciar=reiniciar)
+
+        self._preparar('incremental', reiniciar, desde=None if retomar else marca - MARGEM_SINCRONIZACAO)
+        desde = datetime.datetime.fromisoformat(self.checkpoint.desde)
+        self.escrever(f"Sincronizando tickets alterados desde {desde:%d/%m/%Y %H:%M} (UTC)")
+        self._exportar_periodos([(f"desde {desde.isoformat()}", filtro_atualizados_desde(desde))])
+        return self._finalizar(mesclar=True)
+
+    def consolidar(self, mesclar=False):
+        """Leva as conversas do parcial para o corpus de saída; um registro por ticket (o mais recente).
+
+        Na exportação completa o corpus é regravado; na incremental os tickets
+        novos ou alterados são só acrescentados (a última versão vale).
+        Retorna o total de tickets no corpus.
+        """
+        conversas = ler_atuais(self.caminho_parcial)
+        if not mesclar:
+            return gravar_corpus(self.saida, conversas)
+        with EscritorCorpus(self.saida) as escritor:
+            escritor.gravar_varios(conversas)
+            return len(escritor.indice)
@@ -0,0 +1,381 @@
+import logging
+import time
+from dataclasses import dataclass, field
+
+from django.core.exceptions import ValidationError
+
+from .audio import AudioEmFrases, fila_audio
+from .contexto import MAX_IMAGENS_CONTEXTO, instrucao_imagens
+from .embedding import client, gerar_embeddings
+from .models import Conversa, Mensagem, ManualProcessado, Resposta, TurnoTicket
+from .singleflight import (
+    buscas_em_voo, chave_pergunta, normalizar_pergunta, respostas_em_voo, streams_em_voo
+)
+from .sse import CanalSSE, streams_retomaveis
+
+logger = logging.getLogger(__name__)
+
+CENTRAL_AJUDA = 'https://spartacus.movidesk.com/kb/'
+
+MENSAGEM_SISTEMA = "Você é um assistente especializado em ERP Spartacus. Seja sempre conciso, claro e evite repetições."
+
+
+def buscar_contexto_relevante(pergunta, limite_similaridade=0.4, top_k=3):
+    """Busca o contexto mais relevante para a pergunta em manuais processados, respostas
+    antigas e atendimentos do Movidesk.
+
+    Buscas concorrentes pela mesma pergunta compartilham o embedding e as varreduras.
+    """
+    chave = ('contexto', normalizar_pergunta(pergunta), limite_similaridade, top_k)
+    return buscas_em_voo.executar(
+        chave, lambda: _buscar_contexto_relevante(pergunta, limite_similaridade, top_k)
+    )
+
+
+def _buscar_contexto_relevante(pergunta, limite_similaridade=0.4, top_k=3):
+    pergunta_embedding = gerar_embeddings(pergunta)
+
+    if pergunta_embedding is None:
+        return None, 0.0
+
+    # Em empate, vale a ordem: manuais processados, respostas e, por fim, atendimentos
+    candidatos = [
+        ManualProcessado.objects.buscar_melhor_manual(pergunta_embedding, limite_similaridade),
+        Resposta.objects.buscar_melhor_resposta(pergunta_embedding, limite_similaridade),
+        TurnoTicket.objects.buscar_melhor_turno(pergunta_embedding, limite_similaridade),
+    ]
+
+    melhor, similaridade = None, 0.0
+    for contexto, similaridade_contexto in candidatos:
+        if contexto is not None and (melhor is None or similaridade_contexto > similaridade):
+            melhor, similaridade = contexto, similaridade_contexto
+    return melhor, similaridade
+
+
+def obter_ou_criar_conversa(session_id=None):
+    """Obtém uma conversa existente ou cria uma nova."""
+    if session_id:
+        try:
+            conversa = Conversa.objects.get(session_id=session_id, ativa=True)
+            return conversa
+        except (Conversa.DoesNotExist, ValidationError, ValueError):
+            pass
+
+    # Cria nova conversa
+    conversa = Conversa.objects.create()
+    return conversa
+
+
+def salvar_mensagem(conversa, tipo, conteudo, resposta_relacionada=None, similaridade=None):
+    """Salva uma mensagem na conversa."""
+    # O contexto pode ser um ManualProcessado; só Respostas são relacionáveis
+    if not isinstance(resposta_relacionada, Resposta):
+        resposta_relacionada = None
+    return Mensagem.objects.create(
+        conversa=conversa,
+        tipo=tipo,
+        conteudo=conteudo,
+        resposta_relacionada=resposta_relacionada,
+        similaridade=similaridade
+    )
+
+
+@dataclass
+class EstadoPergunta:
+    """Estado de uma pergunta ao longo das etapas do pipeline."""
+    pergunta: str
+    session_id: str = None
+    conversa: Conversa = None
+    contexto_memoria: str = ''
+    contexto: object = None
+    similaridade: float = 0.0
+    bloco_contexto: str = ''
+    url_manual: str = None
+    imagens: list = field(default_factory=list)
+    prompt: str = ''
+    resposta: str = ''
+    mensagem_resposta: Mensagem = None
+    audio_url: str = None
+    audio_status: str = ''
+    # Frases com áudio pedido durante o streaming (0: resposta sem áudio em frases)
+    audio_em_frases: int = 0
+    tempos: dict = field(default_factory=dict)
+
+    @property
+    def tem_contexto(self):
+        return self.contexto is not None and bool(self.bloco_contexto)
+
+
+# 🔹 Etapas de preparo: recebem (pipeline, estado) e preenchem o estado
+
+def etapa_conversa(pipeline, estado):
+    """Obtém a conversa, lê a memória (antes da pergunta atual) e salva a pergunta."""
+    estado.conversa = obter_ou_criar_conversa(estado.session_id)
+    estado.contexto_memoria = estado.conversa.get_contexto_memoria(limite=pipeline.limite_memoria)
+    salvar_mensagem(estado.conversa, 'pergunta', estado.pergunta)
+
+
+def etapa_recuperacao(pipeline, estado):
+    """Busca o contexto mais relevante para a pergunta."""
+    estado.contexto, estado.similaridade = buscar_contexto_relevante(
+        estado.pergunta, pipeline.limite_similaridade
+    )
+
+
+def etapa_contexto(pipeline, estado):
+    """Usa o bloco de contexto e as imagens pré-calculados na ingestão."""
+    contexto = estado.contexto
+    if contexto is None or estado.similaridade <= pipeline.limite_similaridade:
+        return
+
+    # Registros anteriores ao pré-cálculo são montados e salvos uma única vez
+    if not contexto.bloco_contexto:
+        contexto.atualizar_bloco_contexto()
+        contexto.save(update_fields=['bloco_contexto', 'imagens_contexto'])
+
+    estado.bloco_contexto = contexto.bloco_contexto
+    estado.imagens = contexto.imagens_contexto[:pipeline.max_imagens]
+    if isinstance(contexto, ManualProcessado):
+        estado.url_manual = contexto.url_original
+    elif isinstance(contexto, Resposta):
+        estado.url_manual = contexto.manual.url
+
+
+def etapa_prompt(pipeline, estado):
+    """Monta o prompt a partir do contexto e do histórico."""
+    if estado.tem_contexto:
+        estado.prompt = f"""Você é o Spartacus AI, assistente especializado no sistema Spartacus ERP.
+
+INSTRUÇÕES:
+- Use APENAS as informações do contexto fornecido
+- Seja claro, objetivo e didático
+- Organize a resposta em passos numerados quando apropriado
+- Não repita informações desnecessariamente
+- Mantenha um tom profissional e amigável
+- Considere o histórico da conversa para dar continuidade
+{instrucao_imagens(estado.imagens)}
+
+{estado.bloco_contexto}
+
+HISTÓRICO DA CONVERSA:
+{estado.contexto_memoria}
+
+PERGUNTA ATUAL: {estado.pergunta}
+
+RESPOSTA (seja conciso e direto):"""
+    else:
+        # Resposta genérica quando não há contexto suficiente
+        estado.prompt = f"""Você é o Spartacus AI, assistente do sistema Spartacus ERP.
+
+HISTÓRICO DA CONVERSA:
+{estado.contexto_memoria}
+
+O usuário perguntou: "{estado.pergunta}"
+
+Responda de forma educada que você não encontrou informações específicas sobre essa pergunta na base de conhecimento atual. Sugira que consulte a central de ajuda oficial do Spartacus.
+
+Seja breve e direto. No fim da resposta, sempre indique a central de ajuda oficial do Spartacus: {CENTRAL_AJUDA}"""
+
+
+# 🔹 Etapas finais: executadas depois que a resposta completa está disponível
+
+def etapa_persistencia(pipeline, estado):
+    """Salva a resposta na conversa."""
+    if estado.resposta.strip():
+        estado.mensagem_resposta = salvar_mensagem(
+            estado.conversa,
+            'resposta',
+            estado.resposta,
+            resposta_relacionada=estado.contexto,
+            similaridade=estado.similaridade
+        )
+
+
+def etapa_audio(pipeline, estado):
+    """Pede o áudio da resposta ao pool de síntese, sem esperar por ele.
+
+    Respostas já faladas antes saem com `audio_url`; as demais com
+    `audio_status` pendente, acompanhado pelo endpoint de áudio da mensagem.
+    No streaming a resposta já foi falada frase a frase e o áudio inteiro
+    só é gerado se for pedido pelo endpoint.
+    """
+    mensagem = estado.mensagem_resposta
+    if not pipeline.gerar_audio or mensagem is None or estado.audio_em_frases:
+        return
+    fila_audio.pedir_para_mensagem(mensagem)
+    estado.audio_status = mensagem.audio_status
+    estado.audio_url = mensagem.audio_url or None
+
+
+ETAPAS_PREPARO = [etapa_conversa, etapa_recuperacao, etapa_contexto, etapa_prompt]
+ETAPAS_FINAIS = [etapa_persistencia, etapa_audio]
+
+
+class PipelinePergunta:
+    """Fluxo único recuperar → prompt → completar → persistir.
+
+    As etapas são funções `(pipeline, estado)` e podem ser substituídas ou
+    estendidas na construção. Todos os endpoints de pergunta usam este fluxo.
+    """
+    modelo = "gpt-4o-mini"
+    max_tokens = 600
+    temperatura = 0.3
+    limite_similaridade = 0.4
+    limite_memoria = 6
+    max_imagens = MAX_IMAGENS_CONTEXTO
+    gerar_audio = True
+
+    def __init__(self, etapas_preparo=None, etapas_finais=None, **config):
+        self.etapas_preparo = list(etapas_preparo if etapas_preparo is not None else ETAPAS_PREPARO)
+        self.etapas_finais = list(etapas_finais if etapas_finais is not None else ETAPAS_FINAIS)
+        for nome, valor in config.items():
+            if not hasattr(self, nome):
+                raise TypeError(f"Configuração desconhecida do pipeline: {nome}")
+            setattr(self, nome, valor)
+
+    def _executar_etapas(self, etapas, estado):
+        for etapa in etapas:
+            inicio = time.perf_counter()
+            etapa(self, estado)
+            estado.tempos[etapa.__name__] = time.perf_counter() - inicio
+        logger.debug(f"Tempos do pipeline: {estado.tempos}")
+
+    def _mensagens(self, estado):
+        return [
+            {"role": "system", "content": MENSAGEM_SISTEMA},
+            {"role": "user", "content": estado.prompt}
+        ]
+
+    def _chave(self, estado, variante):
+        return chave_pergunta(
+            estado.pergunta, estado.contexto, estado.contexto_memoria,
+            variante=f"{variante}:{self.modelo}:{self.max_tokens}"
+        )
+
+    def preparar(self, pergunta, session_id=None):
+        """Executa as etapas de preparo e devolve o estado pronto para completar."""
+        estado = EstadoPergunta(pergunta=pergunta, session_id=session_id)
+        self._executar_etapas(self.etapas_preparo, estado)
+        return estado
+
+    def completar(self, estado):
+        """Chama o modelo sem streaming."""
+        response = client.chat.completions.create(
+            model=self.modelo,
+            messages=self._mensagens(estado),
+            max_tokens=self.max_tokens,
+            temperature=self.temperatura
+        )
+        return response.choices[0].message.content.strip()
+
+    def completar_stream(self, estado):
+        """Chama o modelo com streaming, gerando os tokens."""
+        stream = client.chat.completions.create(
+            model=self.modelo,
+            messages=self._mensagens(estado),
+            stream=True,
+            max_tokens=self.max_tokens,
+            temperature=self.temperatura
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content is not None:
+                yield chunk.choices[0].delta.content
+
+    def payload_final(self, estado):
+        """Dados da resposta enviados ao frontend."""
+        return {
+            'resposta': estado.resposta,
+            'similaridade': float(estado.similaridade),
+            'manual': estado.url_manual,
+            'feedback': 'Resposta gerada com IA baseada no conhecimento do sistema.',
+            'audio_url': estado.audio_url,
+            'audio_status': estado.audio_status,
+            'mensagem_id': estado.mensagem_resposta.id if estado.mensagem_resposta else None,
+            'session_id': str(estado.conversa.session_id),
+            'imagens': estado.imagens
+        }
+
+    def responder(self, pergunta, session_id=None):
+        """Responde a pergunta de forma completa, devolvendo o payload JSON."""
+        estado = self.preparar(pergunta, session_id)
+
+        # Perguntas idênticas em andamento compartilham a mesma chamada ao modelo
+        inicio = time.perf_counter()
+        estado.resposta = respostas_em_voo.executar(
+            self._chave(estado, 'completo'), lambda: self.completar(estado)
+        )
+        estado.tempos['completar'] = time.perf_counter() - inicio
+
+        self._executar_etapas(self.etapas_finais, estado)
+        return self.payload_final(estado)
+
+    def responder_stream(self, pergunta, session_id=None, audio_em_frases=False):
+        """Inicia a resposta em streaming e devolve o CanalSSE a ser lido.
+
+        A geração roda em background e o canal fica registrado para retomada
+        pela sessão. Perguntas idênticas em andamento recebem o mesmo stream
+        do modelo, cada uma no seu próprio canal. Com `audio_em_frases` (pedido
+        pelo cliente), cada frase completa já vai para a síntese e o canal
+        recebe eventos `audio` à medida que ficam prontos; ele só fecha depois
+        do último. Sem ele, o canal fecha junto com o texto e o áudio da
+        resposta inteira segue pelo endpoint de áudio da mensagem.
+        """
+        # Reenvio da mesma pergunta enquanto a resposta ainda está sendo gerada:
+        # reaproveita o stream existente em vez de chamar o modelo de novo
+        if session_id:
+            canal, pergunta_em_andamento = streams_retomaveis.obter(session_id)
+            if canal is not None and not canal.finalizado and pergunta_em_andamento == pergunta:
+                return canal
+
+        estado = self.preparar(pergunta, session_id)
+        session = str(estado.conversa.session_id)
+
+        canal = CanalSSE()
+        streams_retomaveis.registrar(session, canal, pergunta)
+        # Envia a sessão logo no início para permitir a reconexão
+        canal.publicar({'session_id': session})
+
+        partes_resposta = []
+        audio = AudioEmFrases(canal.publicar) if self.gerar_audio and audio_em_frases else None
+
+        def ao_item(item):
+            if isinstance(item, str):
+                partes_resposta.append(item)
+                canal.publicar_token(item)
+                if audio is not None:
+                    audio.adicionar(item)
+            elif item.get('done'):
+                estado.resposta = ''.join(partes_resposta)
+                if audio is not None:
+                    estado.audio_em_frases = audio.encerrar_texto()
+                try:
+                    self._executar_etapas(self.etapas_finais, estado)
+                except Exception as e:
+                    logger.error(f"Erro nas etapas finais do pipeline: {e}")
+                payload = self.payload_final(estado)
+                payload.pop('resposta')
+                canal.publicar({'done': True, 'audio_frases': estado.audio_em_frases, **payload})
+            else:
+                canal.publicar(item)
+
+        def ao_fim():
+            # Chamado na thread do stream: não espera a síntese, só agenda o fechamento
+            if audio is None:
+                canal.finalizar()
+            else:
+                audio.quando_concluir(canal.finalizar)
+
+        def gerar():
+            yield from self.completar_stream(estado)
+            yield {'done': True}
+
+        streams_em_voo.assinar(self._chave(estado, 'stream'), gerar, ao_item, ao_fim)
+        return canal
+
+    def retomar(self, session_id):
+        """Canal de uma resposta da sessão ainda retomável, ou None."""
+        canal, _ = streams_retomaveis.obter(session_id)
+        return canal
+
+
+pipeline_padrao = PipelinePergunta()
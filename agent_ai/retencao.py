@@ -0,0 +1,195 @@
+"""Retenção dos áudios gerados: expiração por tempo sem acesso e limite de espaço (LRU).
+
+A limpeza trabalha sobre o índice AudioGerado (`ultimo_acesso` indexado) e
+só toca nos arquivos que vão sair: o diretório não é listado, então o custo
+acompanha o número de arquivos removidos, não o tamanho do diretório.
+`indexar_diretorio` é a exceção, para uso eventual (arquivos anteriores ao
+índice).
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import connections
+from django.db.models import Sum
+from django.utils import timezone
+
+from agent_ai.audio import DIRETORIO_AUDIO, acessos_audio, caminho_audio, nome_audio, url_audio
+from agent_ai.models import AudioGerado, Mensagem
+
+logger = logging.getLogger(__name__)
+
+# Áudios sem acesso há mais que isso são removidos
+RETENCAO_DIAS_AUDIO = 7
+# Acima desse total os áudios acessados há mais tempo saem primeiro
+MAX_MEGABYTES_AUDIO = 500
+# Intervalo da limpeza automática nos processos que servem áudio
+INTERVALO_LIMPEZA_AUDIO = 60 * 60
+TAMANHO_LOTE_LIMPEZA = 500
+# Temporários de sínteses interrompidas (".gerando-*") mais velhos que isso são lixo
+MAX_SEGUNDOS_TEMPORARIO = 60 * 60
+
+
+def registrar_acessos():
+    """Grava no índice, em lote, os acessos acumulados em `acessos_audio`.
+
+    Arquivos que existem mas não têm registro (gravação que falhou na
+    síntese) são registrados aqui. Retorna o número de áudios acessados.
+    """
+    chaves = list(acessos_audio.retirar())
+    agora = timezone.now()
+    for inicio in range(0, len(chaves), TAMANHO_LOTE_LIMPEZA):
+        lote = chaves[inicio:inicio + TAMANHO_LOTE_LIMPEZA]
+        AudioGerado.objects.filter(hash_texto__in=lote).update(ultimo_acesso=agora)
+        registradas = set(AudioGerado.objects.filter(hash_texto__in=lote).values_list('hash_texto', flat=True))
+
+        novos = []
+        for chave in set(lote) - registradas:
+            nome = nome_audio(chave)
+            try:
+                info = os.stat(caminho_audio(nome))
+            except FileNotFoundError:
+                continue
+            novos.append(AudioGerado(hash_texto=chave, nome_arquivo=nome, tamanho_bytes=info.st_size,
+                                     ultimo_acesso=agora))
+        AudioGerado.objects.bulk_create(novos, ignore_conflicts=True)
+    return len(chaves)
+
+
+def _remover(registros):
+    """Apaga os arquivos e os registros (id, nome_arquivo, tamanho_bytes). Retorna os bytes liberados.
+
+    Mensagens que apontavam para esses arquivos voltam a não ter áudio; o
+    endpoint de áudio da mensagem gera de novo sob demanda.
+    """
+    liberados = 0
+    for _, nome, tamanho in registros:
+        try:
+            os.remove(caminho_audio(nome))
+            liberados += tamanho
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            # O registro sai mesmo assim: o arquivo volta ao índice por indexar_diretorio
+            logger.error(f"Erro ao remover o áudio {nome}: {e}")
+
+    AudioGerado.objects.filter(id__in=[id_audio for id_audio, _, _ in registros]).delete()
+    Mensagem.objects.filter(audio_url__in=[url_audio(nome) for _, nome, _ in registros]).update(
+        audio_status='', audio_url=''
+    )
+    return liberados
+
+
+def limpar_audios(dias=RETENCAO_DIAS_AUDIO, max_megabytes=MAX_MEGABYTES_AUDIO):
+    """Remove os áudios sem acesso há `dias` dias e, se o total passar de
+    `max_megabytes`, os acessados há mais tempo até voltar ao limite.
+
+    `dias` ou `max_megabytes` None desliga o critério correspondente. Retorna
+    um dict com os totais.
+    """
+    registrar_acessos()
+    totais = {'expirados': 0, 'excedentes': 0, 'bytes_liberados': 0}
+    campos = ('id', 'nome_arquivo', 'tamanho_bytes')
+
+    if dias is not None:
+        corte = timezone.now() - timedelta(days=dias)
+        while True:
+            lote = list(AudioGerado.objects.filter(ultimo_acesso__lt=corte).values_list(*campos)[:TAMANHO_LOTE_LIMPEZA])
+            if not lote:
+                break
+            totais['expirados'] += len(lote)
+            totais['bytes_liberados'] += _remover(lote)
+
+    if max_megabytes is not None:
+        excedente = (AudioGerado.objects.aggregate(total=Sum('tamanho_bytes'))['total'] or 0) - max_megabytes * 1024 * 1024
+        while excedente > 0:
+            # 🔹 LRU: percorre o índice de ultimo_acesso do mais antigo para o mais recente
+            lote = []
+            for registro in AudioGerado.objects.order_by('ultimo_acesso', 'id').values_list(*campos)[:TAMANHO_LOTE_LIMPEZA]:
+                if excedente <= 0:
+                    break
+                lote.append(registro)
+                excedente -= registro[2]
+            if not lote:
+                break
+            totais['excedentes'] += len(lote)
+            totais['bytes_liberados'] += _remover(lote)
+
+    if totais['expirados'] or totais['excedentes']:
+        logger.info(f"Limpeza de áudios: {totais['expirados']} expirados, {totais['excedentes']} removidos "
+                    f"pelo limite de espaço, {totais['bytes_liberados'] / 1024 / 1024:.1f} MB liberados")
+    return totais
+
+
+def indexar_diretorio():
+    """Registra os arquivos do diretório de áudio que não estão no índice.
+
+    Cobre os `audio_<uuid>.mp3` anteriores ao índice e arquivos cuja gravação
+    falhou; o último acesso deles é a data de modificação, então os antigos
+    já saem na limpeza seguinte. Também apaga temporários de sínteses
+    interrompidas. Lista o diretório inteiro: para uso eventual. Retorna o
+    número de arquivos registrados.
+    """
+    diretorio = caminho_audio(DIRETORIO_AUDIO)
+    if not os.path.isdir(diretorio):
+        return 0
+
+    conhecidos = set(AudioGerado.objects.values_list('nome_arquivo', flat=True))
+    limite_temporarios = time.time() - MAX_SEGUNDOS_TEMPORARIO
+    novos = []
+    with os.scandir(diretorio) as entradas:
+        for entrada in entradas:
+            if not entrada.is_file():
+                continue
+            if entrada.name.startswith('.gerando-'):
+                if entrada.stat().st_mtime < limite_temporarios:
+                    os.remove(entrada.path)
+                continue
+            nome = f"{DIRETORIO_AUDIO}/{entrada.name}"
+            if not entrada.name.endswith('.mp3') or nome in conhecidos:
+                continue
+            info = entrada.stat()
+            novos.append(AudioGerado(
+                hash_texto=entrada.name[:-len('.mp3')][:64], nome_arquivo=nome,
+                tamanho_bytes=info.st_size, ultimo_acesso=datetime.fromtimestamp(info.st_mtime, tz=dt_timezone.utc),
+            ))
+    AudioGerado.objects.bulk_create(novos, batch_size=TAMANHO_LOTE_LIMPEZA, ignore_conflicts=True)
+    return len(novos)
+
+
+class AgendadorLimpeza:
+    """Executa `limpar_audios` periodicamente numa thread do próprio processo.
+
+    Iniciado pelo primeiro uso de áudio do processo (agent_ai.audio), então
+    comandos e processos que não servem áudio não limpam nada sozinhos.
+    """
+
+    def __init__(self, intervalo=INTERVALO_LIMPEZA_AUDIO):
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def iniciar(self):
+        with self._lock:
+            if self._timer is None:
+                self._agendar()
+
+    def _agendar(self):
+        self._timer = threading.Timer(self.intervalo, self._executar)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _executar(self):
+        try:
+            limpar_audios()
+        except Exception as e:
+            logger.error(f"Erro na limpeza periódica de áudios: {e}")
+        finally:
+            connections.close_all()
+            with self._lock:
+                self._agendar()
+
+
+agendador_limpeza = AgendadorLimpeza()
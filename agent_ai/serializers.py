@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Manual, Resposta
+from .models import Manual, Resposta, Tarefa
 
 class ManualSerializer(serializers.ModelSerializer):
     """Serializer para o modelo Manual."""
@@ -28,6 +28,17 @@ class PerguntaSerializer(serializers.Serializer):
         help_text="Pergunta a ser enviada ao agente AI",
         style={'placeholder': 'Digite sua pergunta aqui...'}
     )
+    session_id = serializers.CharField(
+        required=False,
+        allow_null=True,
+        allow_blank=True,
+        help_text="ID da sessão de conversa, para manter o histórico"
+    )
+    audio_frases = serializers.BooleanField(
+        required=False,
+        default=False,
+        help_text="Só no streaming: envia eventos de áudio frase a frase e mantém o stream aberto até o último"
+    )
     
     def validate_pergunta(self, value):
         if not value.strip():
@@ -53,6 +64,16 @@ class RespostaAgentSerializer(serializers.Serializer):
         allow_null=True,
         help_text="URL do arquivo de áudio da resposta (quando disponível)"
     )
+    audio_status = serializers.CharField(
+        required=False,
+        allow_blank=True,
+        help_text="pendente, gerando, pronto, falhou ou indisponivel"
+    )
+    mensagem_id = serializers.IntegerField(
+        required=False,
+        allow_null=True,
+        help_text="ID da resposta salva, para consultar o áudio em /api/mensagens/{id}/audio/"
+    )
     central = serializers.URLField(
         required=False,
         allow_null=True, 
@@ -94,4 +115,20 @@ class BuscarManualSerializer(serializers.Serializer):
 
 class BuscarRespostaSerializer(serializers.Serializer):
     """Serializer para busca de resposta por query."""
-    response = serializers.CharField(help_text="Resposta encontrada ou mensagem de erro")
\ No newline at end of file
+    response = serializers.CharField(help_text="Resposta encontrada ou mensagem de erro")
+
+
+class TarefaSerializer(serializers.ModelSerializer):
+    """Serializer para acompanhar tarefas em segundo plano."""
+    class Meta:
+        model = Tarefa
+        fields = ['id', 'tipo', 'manual', 'status', 'tentativas', 'max_tentativas',
+                  'executar_apos', 'resultado', 'erro', 'iniciada_em', 'concluida_em',
+                  'created_at', 'updated_at']
+        read_only_fields = fields
+
+class TarefaEnfileiradaSerializer(serializers.Serializer):
+    """Serializer para a resposta de uma tarefa enfileirada."""
+    tarefa_id = serializers.IntegerField(help_text="ID da tarefa criada")
+    status = serializers.CharField(help_text="Status atual da tarefa")
+    status_url = serializers.CharField(help_text="URL para consultar o andamento")
@@ -3,15 +3,15 @@
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from .models import Manual
-from .views import buscar_manual
+from .tarefas import enfileirar
 
 @receiver(post_save, sender=Manual)
 def gerar_resposta_automaticamente(sender, instance, created, **kwargs):
     print(f"Signal recebido para o Manual com ID {instance.id}. Novo manual? {'Sim' if created else 'Não'}")
     
-    # Se o manual foi criado, chama a função para buscar a URL e gerar a resposta
+    # Se o manual foi criado, agenda a busca da URL e a geração da resposta (worker_tarefas)
     if created:
-        print(f"Manual {instance.title} criado. Chamando buscar_manual()...")
-        buscar_manual(None, instance.id)
+        tarefa = enfileirar('buscar_manual', manual=instance)
+        print(f"Manual {instance.title} criado. Tarefa {tarefa.id} de busca enfileirada.")
     else:
         print(f"Manual {instance.title} já existe. Nenhuma ação será tomada.")
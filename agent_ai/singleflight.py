@@ -0,0 +1,155 @@
+import hashlib
+import logging
+import threading
+import unicodedata
+
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+def normalizar_pergunta(pergunta):
+    """Normaliza a pergunta para comparação: caixa, acentos compostos, espaços e pontuação final."""
+    texto = unicodedata.normalize('NFKC', pergunta or '').lower()
+    return ' '.join(texto.split()).rstrip('?!. ')
+
+
+def chave_pergunta(pergunta, contexto=None, historico='', variante=''):
+    """Chave de deduplicação: pergunta normalizada + contexto recuperado + histórico.
+
+    Histórico vazio não entra na chave, de forma que conversas novas com a
+    mesma pergunta compartilham a mesma execução.
+    """
+    partes = [variante, normalizar_pergunta(pergunta)]
+    if contexto is not None:
+        partes.append(f"{type(contexto).__name__}:{contexto.pk}")
+    if historico:
+        partes.append(hashlib.sha256(historico.encode('utf-8')).hexdigest())
+    return hashlib.sha256('|'.join(partes).encode('utf-8')).hexdigest()
+
+
+class _Chamada:
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+        self.erro = None
+
+
+class SingleFlight:
+    """Garante uma única execução em andamento por chave.
+
+    Chamadas concorrentes com a mesma chave aguardam a primeira e recebem o
+    mesmo resultado (ou a mesma exceção).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._em_voo = {}
+
+    def executar(self, chave, funcao):
+        with self._lock:
+            chamada = self._em_voo.get(chave)
+            lider = chamada is None
+            if lider:
+                chamada = self._em_voo[chave] = _Chamada()
+
+        if not lider:
+            chamada.evento.wait()
+            if chamada.erro is not None:
+                raise chamada.erro
+            return chamada.resultado
+
+        try:
+            chamada.resultado = funcao()
+            return chamada.resultado
+        except Exception as e:
+            chamada.erro = e
+            raise
+        finally:
+            with self._lock:
+                del self._em_voo[chave]
+            chamada.evento.set()
+
+
+class _Difusor:
+    """Replica os itens de um gerador para todos os assinantes, inclusive os atrasados."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._itens = []
+        self._assinantes = []
+        self.finalizado = False
+
+    def assinar(self, ao_item, ao_fim):
+        with self._lock:
+            for item in self._itens:
+                ao_item(item)
+            if self.finalizado:
+                ao_fim()
+            else:
+                self._assinantes.append((ao_item, ao_fim))
+
+    def emitir(self, item):
+        with self._lock:
+            self._itens.append(item)
+            for ao_item, _ in self._assinantes:
+                try:
+                    ao_item(item)
+                except Exception as e:
+                    logger.error(f"Erro em assinante do stream compartilhado: {e}")
+
+    def finalizar(self):
+        with self._lock:
+            self.finalizado = True
+            for _, ao_fim in self._assinantes:
+                try:
+                    ao_fim()
+                except Exception as e:
+                    logger.error(f"Erro ao finalizar assinante do stream compartilhado: {e}")
+            self._assinantes = []
+
+
+class SingleFlightStream:
+    """Versão de SingleFlight para geradores: um único stream por chave, difundido a todos."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._em_voo = {}
+
+    def assinar(self, chave, fabrica_gerador, ao_item, ao_fim):
+        """Assina o stream da chave, iniciando-o em background se ainda não existir.
+
+        `ao_item` recebe cada item produzido (desde o início, mesmo para quem
+        chega depois) e `ao_fim` é chamado quando o gerador termina.
+        """
+        with self._lock:
+            difusor = self._em_voo.get(chave)
+            lider = difusor is None
+            if lider:
+                difusor = self._em_voo[chave] = _Difusor()
+        difusor.assinar(ao_item, ao_fim)
+
+        if lider:
+            thread = threading.Thread(target=self._produzir, args=(chave, difusor, fabrica_gerador))
+            thread.daemon = True
+            thread.start()
+        return lider
+
+    def _produzir(self, chave, difusor, fabrica_gerador):
+        try:
+            for item in fabrica_gerador():
+                difusor.emitir(item)
+        except Exception as e:
+            logger.error(f"Erro no stream compartilhado: {e}")
+            difusor.emitir({'error': str(e)})
+        finally:
+            with self._lock:
+                del self._em_voo[chave]
+            difusor.finalizar()
+            connections.close_all()
+
+
+# Instâncias compartilhadas pelo fluxo de perguntas
+buscas_em_voo = SingleFlight()
+respostas_em_voo = SingleFlight()
+streams_em_voo = SingleFlightStream()
@@ -0,0 +1,193 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.http import StreamingHttpResponse
+
+# Janela de agrupamento de tokens: um frame é emitido quando os tokens pendentes
+# ficam mais velhos que JANELA_FLUSH segundos ou ultrapassam MAX_CHARS_FRAME.
+JANELA_FLUSH = 0.05
+MAX_CHARS_FRAME = 120
+
+# Intervalo dos comentários de keep-alive enviados enquanto não há eventos novos
+INTERVALO_HEARTBEAT = 15.0
+
+# Tempo (ms) que o navegador deve esperar antes de reconectar
+RETRY_MS = 3000
+
+# Limites do registro de streams retomáveis: quantidade máxima de canais
+# mantidos em memória e por quanto tempo um canal finalizado pode ser retomado
+MAX_STREAMS_RETOMAVEIS = 256
+TTL_STREAM_FINALIZADO = 300
+
+
+def formatar_evento(dados, event_id=None, evento=None):
+    """Serializa um evento no formato text/event-stream."""
+    linhas = []
+    if event_id is not None:
+        linhas.append(f"id: {event_id}")
+    if evento:
+        linhas.append(f"event: {evento}")
+    linhas.append(f"data: {json.dumps(dados, ensure_ascii=False)}")
+    return "\n".join(linhas) + "\n\n"
+
+
+def formatar_comentario(texto="keep-alive"):
+    """Comentário SSE, ignorado pelo cliente mas mantém a conexão viva em proxies."""
+    return f": {texto}\n\n"
+
+
+class CanalSSE:
+    """Buffer de eventos de uma resposta em streaming.
+
+    O produtor publica tokens e eventos; os tokens são agrupados em frames
+    `{'content': ...}` dentro da janela de flush. Cada frame recebe um id
+    sequencial (1, 2, 3...), de modo que um leitor pode pedir tudo a partir
+    de um id já recebido.
+    """
+
+    def __init__(self, janela_flush=JANELA_FLUSH, max_chars_frame=MAX_CHARS_FRAME):
+        self.janela_flush = janela_flush
+        self.max_chars_frame = max_chars_frame
+        self._cond = threading.Condition()
+        self._eventos = []
+        self._pendente = []
+        self._tamanho_pendente = 0
+        self._pendente_desde = None
+        self.finalizado = False
+        self.finalizado_em = None
+
+    def _descarregar(self):
+        """Transforma os tokens pendentes em um frame. Requer o lock."""
+        if not self._pendente:
+            return
+        self._eventos.append({'content': ''.join(self._pendente)})
+        self._pendente = []
+        self._tamanho_pendente = 0
+        self._pendente_desde = None
+        self._cond.notify_all()
+
+    def _descarregar_se_vencido(self):
+        if self._pendente and time.monotonic() - self._pendente_desde >= self.janela_flush:
+            self._descarregar()
+
+    def publicar_token(self, texto):
+        """Adiciona um token ao frame em construção."""
+        if not texto:
+            return
+        with self._cond:
+            if not self._pendente:
+                self._pendente_desde = time.monotonic()
+            self._pendente.append(texto)
+            self._tamanho_pendente += len(texto)
+            if self._tamanho_pendente >= self.max_chars_frame:
+                self._descarregar()
+            else:
+                self._descarregar_se_vencido()
+                # Acorda leitores para que agendem o flush por tempo
+                self._cond.notify_all()
+
+    def publicar(self, dados):
+        """Publica um evento completo, descarregando antes os tokens pendentes."""
+        with self._cond:
+            self._descarregar()
+            self._eventos.append(dados)
+            self._cond.notify_all()
+
+    def finalizar(self):
+        """Marca o fim do stream."""
+        with self._cond:
+            self._descarregar()
+            self.finalizado = True
+            self.finalizado_em = time.monotonic()
+            self._cond.notify_all()
+
+    def ler(self, desde, timeout):
+        """Retorna (eventos, finalizado) com os eventos de id maior que `desde`.
+
+        Bloqueia até haver eventos novos, o stream terminar ou `timeout` expirar.
+        Cada evento é devolvido como (id, dados).
+        """
+        limite = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                self._descarregar_se_vencido()
+                if len(self._eventos) > desde or self.finalizado:
+                    break
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                if self._pendente:
+                    vence_em = self._pendente_desde + self.janela_flush - time.monotonic()
+                    restante = min(restante, max(vence_em, 0.001))
+                self._cond.wait(restante)
+
+            novos = [(i + 1, dados) for i, dados in enumerate(self._eventos[desde:], start=desde)]
+            return novos, self.finalizado and not self._pendente
+
+    def iterar(self, desde=0, heartbeat=INTERVALO_HEARTBEAT):
+        """Gera os frames SSE a partir do id `desde`, com keep-alive periódico."""
+        yield f"retry: {RETRY_MS}\n\n"
+        proximo = desde
+        while True:
+            eventos, finalizado = self.ler(proximo, timeout=heartbeat)
+            for event_id, dados in eventos:
+                yield formatar_evento(dados, event_id=event_id)
+                proximo = event_id
+            if finalizado and not eventos:
+                return
+            if not eventos:
+                yield formatar_comentario()
+
+
+class RegistroStreams:
+    """Registro limitado de canais por sessão, para retomar respostas em andamento.
+
+    Mantém no máximo `max_streams` canais; canais finalizados expiram após
+    `ttl` segundos e são os primeiros a sair quando o limite é atingido.
+    """
+
+    def __init__(self, max_streams=MAX_STREAMS_RETOMAVEIS, ttl=TTL_STREAM_FINALIZADO):
+        self.max_streams = max_streams
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._canais = OrderedDict()
+
+    def _expirar(self):
+        """Remove canais finalizados vencidos. Requer o lock."""
+        agora = time.monotonic()
+        for chave in [c for c, (canal, _) in self._canais.items()
+                      if canal.finalizado and agora - canal.finalizado_em > self.ttl]:
+            del self._canais[chave]
+
+    def registrar(self, session_id, canal, pergunta=None):
+        """Associa o canal à sessão, substituindo um canal anterior."""
+        with self._lock:
+            self._expirar()
+            chave = str(session_id)
+            self._canais.pop(chave, None)
+            self._canais[chave] = (canal, pergunta)
+            while len(self._canais) > self.max_streams:
+                finalizados = [c for c, (cn, _) in self._canais.items() if cn.finalizado]
+                # Sem canais finalizados, descarta o mais antigo (a geração continua,
+                # mas não poderá mais ser retomada)
+                del self._canais[finalizados[0] if finalizados else next(iter(self._canais))]
+
+    def obter(self, session_id):
+        """Retorna (canal, pergunta) da sessão ou (None, None)."""
+        with self._lock:
+            self._expirar()
+            return self._canais.get(str(session_id), (None, None))
+
+
+streams_retomaveis = RegistroStreams()
+
+
+def resposta_sse(frames):
+    """Monta a StreamingHttpResponse com os headers corretos para SSE."""
+    response = StreamingHttpResponse(frames, content_type='text/event-stream; charset=utf-8')
+    response['Cache-Control'] = 'no-cache, no-transform'
+    # Desativa o buffering do nginx e de proxies compatíveis
+    response['X-Accel-Buffering'] = 'no'
+    return response
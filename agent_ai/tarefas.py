@@ -0,0 +1,135 @@
+import logging
+import os
+import socket
+import traceback
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db.models import F
+from django.utils import timezone
+
+from agent_ai.models import Tarefa
+
+logger = logging.getLogger(__name__)
+
+# Espera antes da próxima tentativa: BACKOFF_BASE * 2^(tentativa - 1)
+BACKOFF_BASE = timedelta(seconds=30)
+# Tarefas em execução há mais que isso são consideradas abandonadas (worker caiu)
+TEMPO_MAXIMO_EXECUCAO = timedelta(minutes=30)
+
+
+def _buscar_manual(tarefa):
+    """Busca a página do manual e atualiza a Resposta (o que o sinal fazia de forma síncrona)."""
+    from agent_ai.ingestao import buscar_conteudo_manual
+
+    conteudo, _ = buscar_conteudo_manual(tarefa.manual)
+    return {'manual_id': tarefa.manual_id, 'caracteres': len(conteudo)}
+
+
+def _processar_manual(tarefa):
+    """Gera o ManualProcessado (conteúdo, imagens e embedding) pelo processar_manuais.
+
+    A deduplicação percorre o corpus inteiro, então não roda a cada tarefa:
+    fica para o comando deduplicar_documentos, agendado à parte.
+    """
+    saida = StringIO()
+    call_command('processar_manuais', ids=[tarefa.manual_id], force=True, sem_deduplicacao=True, stdout=saida)
+    return {'manual_id': tarefa.manual_id, 'saida': saida.getvalue()[-2000:]}
+
+
+# Tipos de tarefa conhecidos pelo worker
+TIPOS = {
+    'buscar_manual': _buscar_manual,
+    'processar_manual': _processar_manual,
+}
+
+
+def enfileirar(tipo, manual=None, max_tentativas=3, **parametros):
+    """Cria uma tarefa pendente e a retorna imediatamente.
+
+    Se já houver uma tarefa igual pendente ou em execução, ela é reaproveitada.
+    """
+    if tipo not in TIPOS:
+        raise ValueError(f"Tipo de tarefa desconhecido: {tipo}")
+    existente = Tarefa.objects.filter(
+        tipo=tipo, manual=manual, parametros=parametros, status__in=['pendente', 'executando']
+    ).first()
+    if existente:
+        return existente
+    return Tarefa.objects.create(tipo=tipo, manual=manual, parametros=parametros, max_tentativas=max_tentativas)
+
+
+def nome_worker():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def reivindicar(worker=None):
+    """Reserva a próxima tarefa pendente para este worker.
+
+    A reserva é um UPDATE condicional (status ainda 'pendente'), então dois
+    workers nunca pegam a mesma tarefa, em qualquer banco.
+    """
+    worker = worker or nome_worker()
+    agora = timezone.now()
+    candidatas = (Tarefa.objects
+                  .filter(status='pendente', executar_apos__lte=agora)
+                  .order_by('executar_apos', 'id')
+                  .values_list('id', flat=True)[:10])
+    for tarefa_id in candidatas:
+        reservada = Tarefa.objects.filter(id=tarefa_id, status='pendente').update(
+            status='executando',
+            worker=worker,
+            iniciada_em=agora,
+            tentativas=F('tentativas') + 1,
+            updated_at=agora,
+        )
+        if reservada:
+            return Tarefa.objects.select_related('manual').get(id=tarefa_id)
+    return None
+
+
+def executar(tarefa):
+    """Executa uma tarefa já reservada e registra sucesso, nova tentativa ou falha."""
+    try:
+        resultado = TIPOS[tarefa.tipo](tarefa)
+    except Exception as e:
+        logger.error(f"Erro na tarefa {tarefa.id} ({tarefa.tipo}): {e}")
+        tarefa.erro = traceback.format_exc()[-4000:]
+        if tarefa.tentativas < tarefa.max_tentativas:
+            tarefa.status = 'pendente'
+            tarefa.executar_apos = timezone.now() + BACKOFF_BASE * (2 ** (tarefa.tentativas - 1))
+        else:
+            tarefa.status = 'falhou'
+            tarefa.concluida_em = timezone.now()
+        tarefa.save(update_fields=['status', 'erro', 'executar_apos', 'concluida_em', 'updated_at'])
+        return False
+
+    tarefa.status = 'concluida'
+    tarefa.resultado = resultado
+    tarefa.erro = ''
+    tarefa.concluida_em = timezone.now()
+    tarefa.save(update_fields=['status', 'resultado', 'erro', 'concluida_em', 'updated_at'])
+    return True
+
+
+def executar_proxima(worker=None):
+    """Reserva e executa uma tarefa. Retorna None quando a fila está vazia."""
+    tarefa = reivindicar(worker)
+    if tarefa is None:
+        return None
+    logger.info(f"Executando tarefa {tarefa.id} ({tarefa.tipo}), tentativa {tarefa.tentativas}")
+    return executar(tarefa)
+
+
+def liberar_abandonadas(tempo_maximo=TEMPO_MAXIMO_EXECUCAO):
+    """Devolve à fila tarefas presas em 'executando' por um worker que morreu.
+
+    As que já esgotaram as tentativas são marcadas como falha.
+    """
+    agora = timezone.now()
+    abandonadas = Tarefa.objects.filter(status='executando', iniciada_em__lt=agora - tempo_maximo)
+    abandonadas.filter(tentativas__gte=F('max_tentativas')).update(
+        status='falhou', erro='Worker interrompido durante a execução', concluida_em=agora, updated_at=agora
+    )
+    return abandonadas.update(status='pendente', executar_apos=agora, updated_at=agora)
@@ -0,0 +1,162 @@
+"""Limpeza dos chats exportados do Movidesk e divisão em turnos pergunta/resposta.
+
+O `dialogo_completo` é limpo inteiro de uma vez (quebras, prefixos de ação,
+URLs e espaços) e depois cortado nos cabeçalhos das mensagens com um único
+`split`; nada é reprocessado por mensagem. `turnos_das_conversas` percorre
+o corpus em streaming, opcionalmente em vários processos.
+"""
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+# Cabeçalho de cada mensagem do chat: "03/07/2024 15:21 - Daiane : texto"
+_RE_MENSAGEM = re.compile(r'(\d\d/\d\d/\d{4} \d\d:\d\d) - ([^:\n]*?) ?:[ \t\xa0]*')
+# Prefixo que o exportador põe em cada ação ("Agente: Fuso horário: America/Sao_Paulo")
+_RE_PREFIXO_ACAO = re.compile(r'\n(?:Agente|Cliente): (?:Fuso horário: \S*?(?=\d\d/\d\d/\d{4}))?')
+_RE_URL = re.compile(r'https?://\S+')
+
+ENTROU_NA_CONVERSA = 'Entrou na conversa'
+PREFIXO_ANEXOS = 'Anexos:'
+# Perguntas menores que isso são cumprimentos ("Boa tarde") e não viram turno
+MIN_CARACTERES_PERGUNTA = 20
+# Respostas curtas ("só um momento") não fecham o turno: o que o cliente
+# disser em seguida ainda faz parte da mesma pergunta
+MIN_CARACTERES_RESPOSTA = 60
+# Conversas enviadas de uma vez para cada processo
+TAMANHO_LOTE_PROCESSAMENTO = 200
+
+
+@dataclass
+class MensagemChat:
+    autor: str
+    texto: str
+    momento: str
+
+
+@dataclass
+class Turno:
+    """Pergunta do cliente e a resposta do atendente que a segue."""
+    pergunta: str
+    resposta: str
+
+
+def limpar_texto(texto):
+    """Remove URLs, espaços repetidos e linhas vazias de um texto."""
+    texto = _RE_URL.sub('', texto)
+    # split()/join() sem argumentos colapsam qualquer espaço (inclusive \r e \xa0) em C
+    return '\n'.join(filter(None, (' '.join(linha.split()) for linha in texto.split('\n'))))
+
+
+def limpar_dialogo(dialogo):
+    """Normaliza o `dialogo_completo` inteiro: quebras, prefixos de ação, URLs e espaços."""
+    dialogo = '\n' + (dialogo or '').replace('\r\n', '\n')
+    return limpar_texto(_RE_PREFIXO_ACAO.sub('\n', dialogo))
+
+
+def _mensagens(dialogo_limpo):
+    """(autor, texto, momento) de cada mensagem de um diálogo já limpo."""
+    partes = _RE_MENSAGEM.split(dialogo_limpo)
+    # split devolve [antes, momento, autor, texto, momento, autor, texto, ...]
+    campos = iter(partes[1:])
+    for momento, autor, texto in zip(campos, campos, campos):
+        texto = texto.strip()
+        if texto and not texto.startswith(PREFIXO_ANEXOS):
+            yield autor.strip(), texto, momento
+
+
+def mensagens_do_dialogo(dialogo):
+    """Mensagens do `dialogo_completo`, sem cabeçalhos, anexos e entradas na conversa."""
+    return [MensagemChat(autor, texto, momento) for autor, texto, momento in _mensagens(limpar_dialogo(dialogo))]
+
+
+def identificar_atendentes(mensagens):
+    """Autores que são atendentes: os que 'entraram na conversa'.
+
+    Sem essa marca, o primeiro autor é o cliente e os demais, atendentes.
+    """
+    atendentes = {m.autor for m in mensagens if m.texto == ENTROU_NA_CONVERSA}
+    if not atendentes:
+        autores = [m.autor for m in mensagens if m.autor]
+        atendentes = set(autores[1:]) - set(autores[:1])
+    return atendentes
+
+
+def dividir_turnos(mensagens, min_caracteres=MIN_CARACTERES_PERGUNTA, min_resposta=MIN_CARACTERES_RESPOSTA):
+    """Agrupa as mensagens (já limpas) em turnos pergunta do cliente → resposta do atendente."""
+    atendentes = identificar_atendentes(mensagens)
+    turnos = []
+    pergunta, resposta = [], []
+    tamanho_resposta = 0
+
+    def fechar():
+        texto_pergunta = '\n'.join(pergunta)
+        if len(texto_pergunta) >= min_caracteres and resposta:
+            turnos.append(Turno(texto_pergunta, '\n'.join(resposta)))
+
+    for mensagem in mensagens:
+        # Mensagens do sistema (autor vazio) e entradas na conversa não contam
+        if not mensagem.autor or mensagem.texto == ENTROU_NA_CONVERSA:
+            continue
+        if mensagem.autor in atendentes:
+            # Falas do atendente antes de qualquer pergunta são saudações
+            if pergunta:
+                resposta.append(mensagem.texto)
+                tamanho_resposta += len(mensagem.texto)
+        else:
+            if tamanho_resposta >= min_resposta:
+                fechar()
+                pergunta, resposta, tamanho_resposta = [], [], 0
+            pergunta.append(mensagem.texto)
+    if resposta:
+        fechar()
+    return turnos
+
+
+def turnos_do_dialogo(dialogo, min_caracteres=MIN_CARACTERES_PERGUNTA):
+    """Turnos pergunta/resposta de um `dialogo_completo` exportado do Movidesk."""
+    # E-mails e tickets sem chat não têm cabeçalho de mensagem: dispensa a limpeza
+    if not dialogo or not _RE_MENSAGEM.search(dialogo):
+        return []
+    return dividir_turnos(mensagens_do_dialogo(dialogo), min_caracteres)
+
+
+def _turnos_do_lote(dialogos):
+    """Executado nos processos: recebe só os textos, não as conversas inteiras."""
+    return [turnos_do_dialogo(dialogo) for dialogo in dialogos]
+
+
+def _lotes(conversas, tamanho_lote):
+    lote = []
+    for conversa in conversas:
+        lote.append(conversa)
+        if len(lote) >= tamanho_lote:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def turnos_das_conversas(conversas, processos=1, tamanho_lote=TAMANHO_LOTE_PROCESSAMENTO):
+    """(conversa, turnos) de cada conversa, na ordem de entrada, em streaming.
+
+    Com `processos` > 1 os lotes são divididos em processos separados; no
+    máximo 2 lotes por processo ficam em andamento, então a memória não
+    cresce com o tamanho do corpus.
+    """
+    if processos <= 1:
+        for conversa in conversas:
+            yield conversa, turnos_do_dialogo(conversa.get('dialogo_completo'))
+        return
+
+    with ProcessPoolExecutor(max_workers=processos) as executor:
+        em_andamento = deque()
+        for lote in _lotes(conversas, tamanho_lote):
+            dialogos = [conversa.get('dialogo_completo') or '' for conversa in lote]
+            em_andamento.append((lote, executor.submit(_turnos_do_lote, dialogos)))
+            if len(em_andamento) >= processos * 2:
+                lote_pronto, futuro = em_andamento.popleft()
+                yield from zip(lote_pronto, futuro.result())
+        while em_andamento:
+            lote_pronto, futuro = em_andamento.popleft()
+            yield from zip(lote_pronto, futuro.result())
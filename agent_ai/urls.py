@@ -9,6 +9,8 @@ urlpatterns = [
     path('', views.spartacus_view, name='spartacus'),
     path('api/perguntar/', views.perguntar_spart, name='perguntar_spart'),
     path('api/perguntar/stream/', views.perguntar_spart_stream, name='perguntar_spart_stream'),
+    path('api/perguntar/stream/retomar/', views.retomar_stream, name='retomar_stream'),
+    path('api/mensagens/<int:mensagem_id>/audio/', views.audio_mensagem, name='audio_mensagem'),
 
 ]
 
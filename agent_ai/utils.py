@@ -1,10 +1,7 @@
-from gtts import gTTS
 import os
+import queue
 from django.conf import settings
 from django.http import JsonResponse, StreamingHttpResponse
-import uuid
-import threading
-import time
 from concurrent.futures import ThreadPoolExecutor
 import logging
 from bs4 import BeautifulSoup
@@ -12,6 +9,9 @@ import re
 from urllib.parse import urljoin, urlparse
 import numpy as np
 from sentence_transformers import SentenceTransformer
+from agent_ai.audio import AudioEmFrases, FilaAudioCheia, fila_audio, obter_audio
+from agent_ai.retencao import limpar_audios
+from agent_ai.sse import formatar_evento
 
 logger = logging.getLogger(__name__)
 
@@ -76,101 +76,55 @@ def extrair_imagens_do_html(html_content):
         return []
 
 def criar_audio(mensagem, lang="pt-br", slow=False):
-    """Cria arquivo de áudio a partir de texto usando gTTS."""
+    """Cria (ou reaproveita) o arquivo de áudio do texto usando gTTS."""
     try:
-        filename = f"audio_{uuid.uuid4().hex}.mp3"
-        audio_path = os.path.join(settings.MEDIA_ROOT, "audio", filename)
-        os.makedirs(os.path.dirname(audio_path), exist_ok=True)
-
-        tts = gTTS(text=mensagem, lang=lang, slow=slow)
-        tts.save(audio_path)
-
-        audio_url = f"{settings.MEDIA_URL}audio/{filename}"
-        return audio_url
+        # O mesmo texto devolve o mesmo arquivo, sem nova síntese
+        return obter_audio(mensagem, lang, slow)
     except Exception as e:
         logger.error(f"Erro ao criar áudio: {str(e)}")
         return None
 
 
 def criar_audio_async(mensagem, callback=None, lang="pt-br", slow=False):
-    """Cria áudio de forma assíncrona para não bloquear a resposta."""
-    def _criar_audio_thread():
-        try:
-            audio_url = criar_audio(mensagem, lang, slow)
-            if callback and audio_url:
-                callback(audio_url)
-            return audio_url
-        except Exception as e:
-            logger.error(f"Erro ao criar áudio assíncrono: {str(e)}")
-            if callback:
-                callback(None)
-            return None
-    
-    thread = threading.Thread(target=_criar_audio_thread)
-    thread.daemon = True
-    thread.start()
-    return thread
+    """Pede o áudio ao pool de síntese sem bloquear a resposta. Retorna o TrabalhoAudio (ou None)."""
+    try:
+        trabalho = fila_audio.enfileirar(mensagem, lang, slow, callback=callback)
+    except FilaAudioCheia as e:
+        logger.warning(f"Áudio não foi pedido: {e}")
+        trabalho = None
+    if trabalho is None and callback:
+        callback(None)
+    return trabalho
 
 
 def criar_audio_streaming(texto_stream, lang="pt-br"):
-    """Cria áudio a partir de um stream de texto em tempo real."""
+    """Gera eventos SSE `audio` para um stream de texto, frase a frase.
+
+    Cada frase vai para a fila de síntese assim que termina de chegar; os
+    eventos prontos são emitidos entre os pedaços de texto, sem esperar a
+    síntese, e os que faltarem são aguardados no fim do stream.
+    """
+    eventos = queue.Queue()
+    fim = object()
+
     def generate_audio():
-        buffer_texto = ""
-        sentence_endings = ['.', '!', '?', '\n']
-        
+        audio = AudioEmFrases(eventos.put, lang=lang)
         for chunk in texto_stream:
-            buffer_texto += chunk
-            
-            # Quando encontrar fim de frase, gera áudio
-            for ending in sentence_endings:
-                if ending in buffer_texto:
-                    sentences = buffer_texto.split(ending)
-                    for sentence in sentences[:-1]:  # Todas exceto a última
-                        if sentence.strip():
-                            try:
-                                audio_url = criar_audio(sentence.strip(), lang)
-                                if audio_url:
-                                    yield f"data: {{\"audio_url\": \"{audio_url}\"}}\n\n"
-                            except Exception as e:
-                                logger.error(f"Erro ao gerar áudio para frase: {str(e)}")
-                    
-                    buffer_texto = sentences[-1]  # Mantém o resto
-                    break
-        
-        # Processa texto restante
-        if buffer_texto.strip():
-            try:
-                audio_url = criar_audio(buffer_texto.strip(), lang)
-                if audio_url:
-                    yield f"data: {{\"audio_url\": \"{audio_url}\"}}\n\n"
-            except Exception as e:
-                logger.error(f"Erro ao gerar áudio final: {str(e)}")
-    
+            audio.adicionar(chunk)
+            while not eventos.empty():
+                yield formatar_evento(eventos.get_nowait())
+
+        audio.quando_concluir(lambda: eventos.put(fim))
+        while (evento := eventos.get()) is not fim:
+            yield formatar_evento(evento)
+
     return generate_audio()
 
 
 def limpar_audios_antigos(dias=7):
-    """Remove arquivos de áudio mais antigos que X dias."""
+    """Remove os áudios sem acesso há mais de X dias (ver agent_ai.retencao)."""
     try:
-        audio_dir = os.path.join(settings.MEDIA_ROOT, "audio")
-        if not os.path.exists(audio_dir):
-            return 0
-        
-        count = 0
-        cutoff_time = time.time() - (dias * 24 * 60 * 60)
-        
-        for filename in os.listdir(audio_dir):
-            if filename.startswith("audio_") and filename.endswith(".mp3"):
-                file_path = os.path.join(audio_dir, filename)
-                if os.path.getctime(file_path) < cutoff_time:
-                    try:
-                        os.remove(file_path)
-                        count += 1
-                    except OSError as e:
-                        logger.error(f"Erro ao remover {file_path}: {str(e)}")
-        
-        logger.info(f"Removidos {count} arquivos de áudio antigos")
-        return count
+        return limpar_audios(dias=dias, max_megabytes=None)['expirados']
     except Exception as e:
         logger.error(f"Erro na limpeza de áudios: {str(e)}")
         return 0
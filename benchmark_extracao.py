@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""Benchmark da extração de conteúdo: estratégia antiga (html.parser + get_text em
+todas as divs) contra agent_ai.extracao (lxml + pontuação em uma passada).
+
+Uso:
+    python benchmark_extracao.py [diretorio] [--salvar N] [--repeticoes R]
+
+Com --salvar, baixa N páginas de manuais cadastrados para o diretório antes
+de medir. Sem arquivos no diretório, usa o conteudo_html_original salvo em
+ManualProcessado.
+"""
+import os
+import sys
+import time
+import django
+
+# Configurar Django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'spart.settings')
+django.setup()
+
+from bs4 import BeautifulSoup
+from agent_ai.models import Manual, ManualProcessado
+from agent_ai.crawler import HEADERS_NAVEGADOR, cliente_padrao
+from agent_ai.extracao import PARSER_HTML, analisar_html, melhor_bloco_de_texto, texto_do_conteudo
+
+DIRETORIO_PADRAO = 'amostras_html'
+
+
+def extracao_antiga(html):
+    """Lógica usada antes em processar_manuais/manual_converter."""
+    soup = BeautifulSoup(html, 'html.parser')
+    all_divs = soup.find_all('div')
+    if not all_divs:
+        return None
+    text_lengths = [(div, len(div.get_text(strip=True))) for div in all_divs]
+    text_lengths.sort(key=lambda x: x[1], reverse=True)
+    return text_lengths[0][0]
+
+
+def extracao_nova(html):
+    return melhor_bloco_de_texto(analisar_html(html))
+
+
+def salvar_amostras(diretorio, quantidade):
+    os.makedirs(diretorio, exist_ok=True)
+    for manual in Manual.objects.all()[:quantidade]:
+        try:
+            response = cliente_padrao.get(manual.url, headers=HEADERS_NAVEGADOR, verify=False)
+            response.raise_for_status()
+        except Exception as e:
+            print(f"Erro ao baixar {manual.url}: {e}")
+            continue
+        with open(os.path.join(diretorio, f"manual_{manual.id}.html"), 'w', encoding='utf-8') as f:
+            f.write(response.text)
+        print(f"Salvo: manual_{manual.id}.html")
+
+
+def carregar_amostras(diretorio):
+    if os.path.isdir(diretorio):
+        arquivos = sorted(a for a in os.listdir(diretorio) if a.endswith('.html'))
+        if arquivos:
+            paginas = []
+            for arquivo in arquivos:
+                with open(os.path.join(diretorio, arquivo), encoding='utf-8') as f:
+                    paginas.append(f.read())
+            return paginas, f"{len(paginas)} arquivos de {diretorio}"
+    paginas = [html for html in ManualProcessado.objects.values_list('conteudo_html_original', flat=True) if html]
+    return paginas, f"{len(paginas)} HTMLs de ManualProcessado"
+
+
+def medir(funcao, paginas, repeticoes):
+    melhor = None
+    resultados = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultados = [funcao(html) for html in paginas]
+        duracao = time.perf_counter() - inicio
+        melhor = duracao if melhor is None else min(melhor, duracao)
+    return melhor, resultados
+
+
+def main():
+    args = sys.argv[1:]
+    repeticoes = 3
+    salvar = 0
+    if '--repeticoes' in args:
+        i = args.index('--repeticoes')
+        repeticoes = int(args[i + 1])
+        del args[i:i + 2]
+    if '--salvar' in args:
+        i = args.index('--salvar')
+        salvar = int(args[i + 1])
+        del args[i:i + 2]
+    diretorio = args[0] if args else DIRETORIO_PADRAO
+
+    if salvar:
+        salvar_amostras(diretorio, salvar)
+
+    paginas, origem = carregar_amostras(diretorio)
+    if not paginas:
+        print("Nenhuma página para medir. Use --salvar N ou aponte um diretório com arquivos .html.")
+        return
+
+    total_kb = sum(len(html) for html in paginas) / 1024
+    print(f"=== BENCHMARK DE EXTRAÇÃO ({origem}, {total_kb:.0f} KB) ===")
+
+    tempo_antigo, antigos = medir(extracao_antiga, paginas, repeticoes)
+    tempo_novo, novos = medir(extracao_nova, paginas, repeticoes)
+
+    mesmo_texto = sum(
+        1 for antigo, novo in zip(antigos, novos)
+        if antigo is not None and novo is not None and texto_do_conteudo(novo) in texto_do_conteudo(antigo)
+    )
+
+    print(f"Antiga (html.parser + get_text por div): {tempo_antigo * 1000 / len(paginas):.2f} ms/página")
+    print(f"Nova ({PARSER_HTML} + pontuação em uma passada): {tempo_novo * 1000 / len(paginas):.2f} ms/página")
+    print(f"Aceleração: {tempo_antigo / tempo_novo:.1f}x")
+    print(f"Conteúdo escolhido contido no da estratégia antiga: {mesmo_texto}/{len(paginas)}")
+
+
+if __name__ == "__main__":
+    main()
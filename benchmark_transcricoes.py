@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+"""Benchmark da limpeza e divisão em turnos dos chats do Movidesk: estratégia
+antiga (regex por mensagem e limpeza por turno) contra agent_ai.transcricoes
+(diálogo limpo de uma vez + split, em streaming, com ou sem processos).
+
+Uso:
+    python benchmark_transcricoes.py [arquivo] [--total N] [--processos P]
+
+As conversas do arquivo (381 no export atual) são repetidas em ciclo até
+N conversas (padrão 100000), geradas sob demanda como no corpus real.
+"""
+import itertools
+import os
+import re
+import sys
+import time
+
+from agent_ai.corpus import ler_atuais
+from agent_ai.movidesk import ARQUIVO_LEGADO, ARQUIVO_SAIDA
+from agent_ai.transcricoes import (ENTROU_NA_CONVERSA, PREFIXO_ANEXOS, MensagemChat, Turno, identificar_atendentes,
+                                   turnos_das_conversas)
+
+TOTAL_PADRAO = 100000
+
+_RE_MENSAGEM_ANTIGA = re.compile(r'(\d{2}/\d{2}/\d{4} \d{2}:\d{2}) - ([^:\r\n]*?)\s*:[ \t\xa0]*')
+_RE_PREFIXO_ANTIGO = re.compile(r'(?:^|\n)(?:Agente|Cliente): (?:Fuso horário: \S*?(?=\d{2}/\d{2}/\d{4}))?')
+_RE_URL_ANTIGA = re.compile(r'https?://\S+')
+_RE_ESPACOS_ANTIGA = re.compile(r'[ \t\xa0\r\f\v]+')
+_RE_QUEBRAS_ANTIGA = re.compile(r'\s*\n\s*')
+
+
+def limpar_texto_antigo(texto):
+    texto = _RE_URL_ANTIGA.sub('', texto)
+    texto = _RE_ESPACOS_ANTIGA.sub(' ', texto)
+    return _RE_QUEBRAS_ANTIGA.sub('\n', texto).strip()
+
+
+def turnos_antigos(dialogo):
+    """Lógica da primeira versão: cabeçalhos com finditer e limpeza a cada turno."""
+    dialogo = _RE_PREFIXO_ANTIGO.sub('\n', dialogo or '')
+    cabecalhos = list(_RE_MENSAGEM_ANTIGA.finditer(dialogo))
+    mensagens = []
+    for i, cabecalho in enumerate(cabecalhos):
+        fim = cabecalhos[i + 1].start() if i + 1 < len(cabecalhos) else len(dialogo)
+        texto = dialogo[cabecalho.end():fim].strip()
+        if texto and not texto.startswith(PREFIXO_ANEXOS):
+            mensagens.append(MensagemChat(cabecalho.group(2).strip(), texto, cabecalho.group(1)))
+
+    atendentes = identificar_atendentes(mensagens)
+    turnos, pergunta, resposta = [], [], []
+
+    def fechar():
+        texto_pergunta = limpar_texto_antigo('\n'.join(pergunta))
+        texto_resposta = limpar_texto_antigo('\n'.join(resposta))
+        if len(texto_pergunta) >= 20 and texto_resposta:
+            turnos.append(Turno(texto_pergunta, texto_resposta))
+
+    for mensagem in mensagens:
+        if not mensagem.autor or mensagem.texto == ENTROU_NA_CONVERSA:
+            continue
+        if mensagem.autor in atendentes:
+            if pergunta:
+                resposta.append(mensagem.texto)
+        else:
+            if sum(len(texto) for texto in resposta) >= 60:
+                fechar()
+                pergunta, resposta = [], []
+            pergunta.append(mensagem.texto)
+    if resposta:
+        fechar()
+    return turnos
+
+
+def replicar(conversas, total):
+    return itertools.islice(itertools.cycle(conversas), total)
+
+
+def medir(nome, executar, conversas, total, megabytes):
+    inicio = time.perf_counter()
+    turnos = executar(replicar(conversas, total))
+    duracao = time.perf_counter() - inicio
+    print(f"{nome}: {duracao:.1f}s, {total / duracao:,.0f} conversas/s, {megabytes / duracao:.1f} MB/s ({turnos} turnos)")
+    return duracao
+
+
+def main():
+    args = sys.argv[1:]
+    total = TOTAL_PADRAO
+    processos = os.cpu_count() or 1
+    if '--total' in args:
+        i = args.index('--total')
+        total = int(args[i + 1])
+        del args[i:i + 2]
+    if '--processos' in args:
+        i = args.index('--processos')
+        processos = int(args[i + 1])
+        del args[i:i + 2]
+    arquivo = args[0] if args else (ARQUIVO_SAIDA if os.path.exists(ARQUIVO_SAIDA) else ARQUIVO_LEGADO)
+
+    conversas = list(ler_atuais(arquivo))
+    if not conversas:
+        print(f"Nenhuma conversa em {arquivo}.")
+        return
+
+    tamanho_medio = sum(len((c.get('dialogo_completo') or '').encode('utf-8')) for c in conversas) / len(conversas)
+    megabytes = tamanho_medio * total / 1024 / 1024
+    print(f"=== BENCHMARK DE TRANSCRIÇÕES ({len(conversas)} conversas de {arquivo} "
+          f"repetidas até {total}, {megabytes:.0f} MB) ===")
+
+    tempo_antigo = medir(
+        "Antiga (regex por mensagem, limpeza por turno)",
+        lambda fluxo: sum(len(turnos_antigos(c.get('dialogo_completo'))) for c in fluxo),
+        conversas, total, megabytes,
+    )
+    tempo_novo = medir(
+        "Nova, 1 processo (diálogo limpo de uma vez + split)",
+        lambda fluxo: sum(len(turnos) for _, turnos in turnos_das_conversas(fluxo)),
+        conversas, total, megabytes,
+    )
+    print(f"Aceleração: {tempo_antigo / tempo_novo:.1f}x")
+    if processos > 1:
+        tempo_paralelo = medir(
+            f"Nova, {processos} processos",
+            lambda fluxo: sum(len(turnos) for _, turnos in turnos_das_conversas(fluxo, processos=processos)),
+            conversas, total, megabytes,
+        )
+        print(f"Aceleração: {tempo_antigo / tempo_paralelo:.1f}x")
+
+    iguais = sum(
+        1 for conversa, turnos in turnos_das_conversas(conversas)
+        if turnos == turnos_antigos(conversa.get('dialogo_completo'))
+    )
+    print(f"Conversas com os mesmos turnos da estratégia antiga: {iguais}/{len(conversas)}")
+
+
+if __name__ == "__main__":
+    main()
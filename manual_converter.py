@@ -1,134 +1,83 @@
 import os
 import sys
 import django
-import requests
-import re
+from io import BytesIO
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import multiprocessing
+from docling.datamodel.base_models import DocumentStream
 from docling.document_converter import DocumentConverter
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
-import hashlib
-from pathlib import Path
-from django.core.files.base import ContentFile
-from django.core.files.storage import default_storage
+from django.db import transaction
 
 # Configurar Django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'spart.settings')
 django.setup()
 
 from agent_ai.models import Manual, ManualProcessado, ImagemManual
+from agent_ai.imagens import armazem_padrao, nova_imagem, urls_das_imagens
+from agent_ai.extracao import extrair_conteudo, hash_do_conteudo
+from agent_ai.crawler import HEADERS_NAVEGADOR, cabecalhos_condicionais, cliente_padrao, validadores
+
+# Conversor único por processo: criar um DocumentConverter carrega modelos e pipeline
+_conversor = None
+
+def obter_conversor():
+    """Retorna o DocumentConverter do processo, criando-o na primeira chamada."""
+    global _conversor
+    if _conversor is None:
+        _conversor = DocumentConverter()
+    return _conversor
 
 def convert_document_to_markdown(source):
     """Converte documento usando docling."""
-    converter = DocumentConverter()
-    return converter.convert(source)
+    return obter_conversor().convert(source)
 
-def download_and_save_image_to_db(url, manual_processado, ordem, alt_text="Imagem"):
-    """Baixa uma imagem e salva no banco de dados."""
-    try:
-        response = requests.get(url, stream=True, verify=False)
-        response.raise_for_status()
-        
-        # Gerar hash do conteúdo
-        content = response.content
-        hash_obj = hashlib.md5(content)
-        hash_hex = hash_obj.hexdigest()
-        
-        # Verificar se já existe uma imagem com este hash para este manual
-        existing_image = ImagemManual.objects.filter(
-            manual_processado=manual_processado,
-            hash_conteudo=hash_hex
-        ).first()
-        
-        if existing_image:
-            print(f"Imagem já existe no banco: {existing_image.nome_arquivo}")
-            return existing_image
-        
-        # Determinar extensão do arquivo
-        content_type = response.headers.get('content-type', '')
-        if 'jpeg' in content_type or 'jpg' in content_type:
-            ext = '.jpg'
-        elif 'png' in content_type:
-            ext = '.png'
-        elif 'gif' in content_type:
-            ext = '.gif'
-        else:
-            ext = '.jpg'  # default
-        
-        filename = f"manual_{manual_processado.manual_id}_img_{hash_hex[:8]}{ext}"
-        
-        # Criar objeto ContentFile
-        content_file = ContentFile(content, name=filename)
-        
-        # Criar e salvar a imagem no banco
-        imagem = ImagemManual.objects.create(
-            manual_processado=manual_processado,
-            url_original=url,
-            nome_arquivo=filename,
-            alt_text=alt_text,
-            ordem=ordem,
-            hash_conteudo=hash_hex,
-            tamanho_bytes=len(content)
-        )
-        
-        # Salvar o arquivo
-        imagem.arquivo_imagem.save(filename, content_file, save=True)
-        
-        print(f"Imagem salva no banco: {filename}")
-        return imagem
-        
-    except Exception as e:
-        print(f"Erro ao baixar e salvar imagem {url}: {e}")
-        return None
+def converter_html_para_markdown(html, nome):
+    """Converte HTML em memória para markdown, sem arquivo temporário."""
+    stream = DocumentStream(name=nome, stream=BytesIO(html.encode('utf-8')))
+    result = convert_document_to_markdown(stream)
+    return result.document.export_to_markdown()
 
-def process_images_in_content(content, base_url, manual_processado):
-    """Processa imagens no conteúdo HTML e salva no banco de dados."""
-    imagens_salvas = []
+def _iniciar_worker_conversao():
+    """Inicializador dos processos do pool: cria o conversor uma vez por processo."""
+    obter_conversor()
+
+def process_images_in_content(content, base_url):
+    """Baixa as imagens do conteúdo HTML e prepara as ImagemManual (ainda não salvas)."""
+    imagens = []
     
     # Encontrar todas as imagens
-    img_tags = content.find_all('img')
+    img_tags = [img for img in content.find_all('img') if img.get('src')]
     print(f"Encontradas {len(img_tags)} imagens para processar")
     
-    for i, img in enumerate(img_tags):
-        src = img.get('src')
-        if not src:
+    # 🔹 Downloads em paralelo; URLs já conhecidas não são baixadas de novo
+    imagens_pagina = urls_das_imagens(content, base_url)
+    armazenadas = armazem_padrao.baixar_varias(url for url, _, _ in imagens_pagina)
+    
+    ordem_por_hash = {}
+    for img, (absolute_url, alt_text, ordem) in zip(img_tags, imagens_pagina):
+        armazenada = armazenadas.get(absolute_url)
+        if not armazenada:
+            print(f"Imagem {ordem} não pôde ser baixada: {absolute_url}")
             continue
-            
-        # Converter URL relativa para absoluta
-        if src.startswith('//'):
-            absolute_url = 'https:' + src
-        elif src.startswith('/'):
-            absolute_url = urljoin(base_url, src)
-        elif src.startswith('http'):
-            absolute_url = src
-        else:
-            absolute_url = urljoin(base_url, src)
-        
-        print(f"Processando imagem {i+1}: {absolute_url}")
         
-        # Baixar e salvar a imagem no banco
-        alt_text = img.get('alt', 'Imagem')
-        imagem_obj = download_and_save_image_to_db(
-            absolute_url, 
-            manual_processado, 
-            ordem=i+1, 
-            alt_text=alt_text
-        )
+        # Imagens repetidas na página apontam para a primeira ocorrência
+        if armazenada.hash_conteudo not in ordem_por_hash:
+            ordem_por_hash[armazenada.hash_conteudo] = ordem
+            imagens.append(nova_imagem(None, armazenada, ordem=ordem, alt_text=alt_text))
         
-        if imagem_obj:
-            imagens_salvas.append(imagem_obj)
-            # Substituir a tag img por um comentário com referência
-            img.replace_with(content.new_string(f'<!-- image:{imagem_obj.id} -->'))
+        # Substituir a tag img por um comentário com referência
+        img.replace_with(content.new_string(f'<!-- image:{ordem_por_hash[armazenada.hash_conteudo]} -->'))
     
-    return imagens_salvas
+    return imagens
 
 def enhance_markdown_with_images(markdown_content, imagens_salvas):
     """Melhora o markdown substituindo comentários de imagem por referências reais."""
     enhanced_markdown = markdown_content
     
-    # Substituir comentários <!-- image:id --> por referências de imagem
+    # Substituir comentários <!-- image:{ordem} --> por referências de imagem
     for imagem in imagens_salvas:
         # Procurar por comentários de imagem específicos e substituir
-        image_comment_pattern = f'<!-- image:{imagem.id} -->'
+        image_comment_pattern = f'<!-- image:{imagem.ordem} -->'
         if image_comment_pattern in enhanced_markdown:
             # Criar referência markdown para a imagem usando URL do Django
             img_url = imagem.get_url_servida() or f'/media/{imagem.arquivo_imagem.name}'
@@ -153,117 +102,130 @@ def convert_html_to_markdown_manual(content, title):
     text = content.get_text(separator='\n', strip=True)
     return f"# {title}\n\n{text}"
 
-def buscar_manual_com_docling(manual_id):
-    """Busca um manual específico e converte para markdown extraindo apenas o conteúdo relevante."""
-    try:
-        manual = Manual.objects.get(id=manual_id)
-        print(f"Processando manual ID {manual_id}: {manual.title}")
-        
-        # Baixar o conteúdo HTML
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'pt-BR,pt;q=0.9,en;q=0.8',
-        }
-        
-        response = requests.get(manual.url, headers=headers, verify=False, timeout=30)
-        response.raise_for_status()
-        
-        # Processar HTML para extrair apenas o conteúdo relevante
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Remover elementos de navegação indesejados
-        # Remover elementos que contenham "Terminal#" seguido de números
-        for element in soup.find_all(text=lambda text: text and re.search(r'Terminal#\d+-\d+', text)):
-            if element.parent:
-                element.parent.decompose()
-        
-        # Encontrar o conteúdo principal
-        # Prioridade 1: div com classe 'article-content'
-        main_content = soup.find('div', class_=lambda x: x and 'article-content' in x)
-        
-        if not main_content:
-            # Prioridade 2: elemento article
-            main_content = soup.find('article')
-        
-        if not main_content:
-            # Prioridade 3: div com classe relacionada a conteúdo
-            main_content = soup.find('div', class_=lambda x: x and 'content' in ' '.join(x).lower())
-        
-        if not main_content:
-            # Prioridade 4: procurar pela div com mais texto
-            all_divs = soup.find_all('div')
-            if all_divs:
-                text_lengths = [(div, len(div.get_text(strip=True))) for div in all_divs]
-                text_lengths.sort(key=lambda x: x[1], reverse=True)
-                main_content = text_lengths[0][0]
-        
-        if not main_content:
-            raise Exception("Não foi possível encontrar o conteúdo principal")
-        
-        # Verificar se já existe um manual processado
-        manual_processado, created = ManualProcessado.objects.get_or_create(
-            manual_id=manual_id,
-            defaults={
-                'titulo': manual.title,
-                'url_original': manual.url,
-                'conteudo_html_original': str(main_content)
-            }
-        )
-        
-        if not created:
-            print(f"Manual {manual_id} já foi processado. Atualizando...")
-            manual_processado.titulo = manual.title
-            manual_processado.url_original = manual.url
-            manual_processado.conteudo_html_original = str(main_content)
+def preparar_manual(manual_id, forcar=False):
+    """Baixa o manual, extrai o conteúdo e as imagens, deixando-o pronto para o docling.
+
+    Retorna um dict com 'html' para conversão, ou com 'markdown' quando o
+    manual não mudou desde a última coleta.
+    """
+    manual = Manual.objects.get(id=manual_id)
+    print(f"Processando manual ID {manual_id}: {manual.title}")
+    existente = ManualProcessado.objects.filter(manual_id=manual_id).first()
+    # O markdown guardado só serve se veio deste pipeline (processar_manuais grava texto puro)
+    pode_pular = existente is not None and existente.origem == ManualProcessado.ORIGEM_DOCLING and not forcar
+    
+    # Baixar o conteúdo HTML
+    headers = dict(HEADERS_NAVEGADOR)
+    if pode_pular:
+        headers.update(cabecalhos_condicionais(manual.etag, manual.last_modified))
+    
+    response = cliente_padrao.get(manual.url, headers=headers, verify=False)
+    response.raise_for_status()
+    etag, last_modified = validadores(response)
+    
+    if pode_pular and response.status_code == 304:
+        print(f"Manual {manual_id} sem alterações (304). Pulando...")
+        # Um 304 pode omitir os validadores: mantém os já guardados
+        manual.registrar_coleta(etag or manual.etag, last_modified or manual.last_modified)
+        return {'manual': manual, 'markdown': existente.conteudo_markdown}
+    
+    # Processar HTML para extrair apenas o conteúdo relevante, removendo
+    # antes os elementos de navegação "Terminal#" do Movidesk
+    main_content = extrair_conteudo(response.text, remover_terminal=True, limpar=False)
+    
+    # Mesmo texto da última coleta: dispensa imagens, docling e embedding
+    hash_conteudo = hash_do_conteudo(main_content)
+    if pode_pular and hash_conteudo == manual.hash_conteudo:
+        print(f"Manual {manual_id} sem alterações no conteúdo. Pulando...")
+        manual.registrar_coleta(etag, last_modified)
+        return {'manual': manual, 'markdown': existente.conteudo_markdown}
+    
+    # Processar imagens: baixar e preparar os registros (gravados em salvar_manual_convertido)
+    base_url = '/'.join(manual.url.split('/')[:3])  # https://spartacus.movidesk.com
+    print(f"Processando imagens do manual...")
+    armazem_padrao.garantir_indice()
+    imagens_salvas = process_images_in_content(main_content, base_url)
+    print(f"Total de imagens processadas: {len(imagens_salvas)}")
+    
+    return {
+        'manual': manual,
+        'existente': existente,
+        'main_content': main_content,
+        # HTML limpo apenas com o conteúdo principal
+        'html': f"<html><head><title>{manual.title}</title></head><body>{main_content}</body></html>",
+        'imagens': imagens_salvas,
+        'etag': etag,
+        'last_modified': last_modified,
+        'hash_conteudo': hash_conteudo,
+    }
+
+def salvar_manual_convertido(preparado, markdown_content):
+    """Completa o markdown com as imagens, gera o embedding e grava tudo numa transação."""
+    manual = preparado['manual']
+    imagens_salvas = preparado['imagens']
+    if markdown_content is None:
+        # Fallback: conversão manual básica
+        markdown_content = convert_html_to_markdown_manual(preparado['main_content'], manual.title)
+    
+    # Melhorar o markdown com informações das imagens
+    enhanced_markdown = enhance_markdown_with_images(markdown_content, imagens_salvas)
+    
+    print("\n=== CONTEÚDO EM MARKDOWN ===")
+    print(enhanced_markdown[:500] + "..." if len(enhanced_markdown) > 500 else enhanced_markdown)
+    
+    existente = preparado['existente']
+    manual_processado = existente or ManualProcessado(manual_id=manual.id)
+    if existente:
+        print(f"Manual {manual.id} já foi processado. Atualizando...")
+    manual_processado.titulo = manual.title
+    manual_processado.url_original = manual.url
+    manual_processado.conteudo_html_original = str(preparado['main_content'])
+    manual_processado.conteudo_markdown = enhanced_markdown
+    manual_processado.origem = ManualProcessado.ORIGEM_DOCLING
+    manual_processado.total_imagens = len(imagens_salvas)
+    # Conteúdo mudou: gera o embedding de novo, antes de abrir a transação
+    manual_processado.embedding = None
+    manual_processado.gerar_embedding()
+    
+    # 🔹 Salvar tudo no banco numa única transação
+    with transaction.atomic():
+        if manual_processado.pk is None:
+            manual_processado.save()
+        else:
             # Limpar imagens antigas
             manual_processado.imagens.all().delete()
-        
-        # Processar imagens: baixar e salvar no banco
-        base_url = '/'.join(manual.url.split('/')[:3])  # https://spartacus.movidesk.com
-        print(f"Processando imagens do manual...")
-        imagens_salvas = process_images_in_content(main_content, base_url, manual_processado)
-        print(f"Total de imagens processadas: {len(imagens_salvas)}")
-        
-        # Criar HTML limpo apenas com o conteúdo principal
-        clean_html = f"<html><head><title>{manual.title}</title></head><body>{main_content}</body></html>"
-        
-        # Salvar em arquivo temporário
-        temp_file = f"temp_manual_{manual_id}.html"
-        with open(temp_file, 'w', encoding='utf-8') as f:
-            f.write(clean_html)
+        for imagem in imagens_salvas:
+            imagem.manual_processado = manual_processado
+        ImagemManual.objects.bulk_create(imagens_salvas)
+        manual_processado.save()
+        manual.registrar_coleta(preparado['etag'], preparado['last_modified'], preparado['hash_conteudo'])
+    
+    print(f"\nManual {manual.id} salvo no banco de dados:")
+    print(f"- Título: {manual_processado.titulo}")
+    print(f"- Total de imagens: {len(imagens_salvas)}")
+    print(f"- Total de caracteres: {len(enhanced_markdown)}")
+    print(f"- Embedding gerado: {'Sim' if manual_processado.embedding else 'Não'}")
+    
+    return enhanced_markdown
+
+def buscar_manual_com_docling(manual_id, forcar=False):
+    """Busca um manual específico e converte para markdown extraindo apenas o conteúdo relevante.
+
+    Sem `forcar`, manuais já processados que não mudaram (304 ou mesmo texto) são pulados.
+    """
+    try:
+        preparado = preparar_manual(manual_id, forcar=forcar)
+        if 'markdown' in preparado:
+            return preparado['markdown']
         
         # Converter com docling
         try:
-            result = convert_document_to_markdown(temp_file)
-            markdown_content = result.document.export_to_markdown()
+            markdown_content = converter_html_para_markdown(preparado['html'], f"manual_{manual_id}.html")
         except Exception as e:
             print(f"Erro na conversão com docling: {e}")
-            # Fallback: conversão manual básica
-            markdown_content = convert_html_to_markdown_manual(main_content, manual.title)
-        
-        # Limpar arquivo temporário
-        if os.path.exists(temp_file):
-            os.remove(temp_file)
-        
-        # Melhorar o markdown com informações das imagens
-        enhanced_markdown = enhance_markdown_with_images(markdown_content, imagens_salvas)
-        
-        print("\n=== CONTEÚDO EM MARKDOWN ===")
-        print(enhanced_markdown[:500] + "..." if len(enhanced_markdown) > 500 else enhanced_markdown)
-        
-        # Salvar o conteúdo markdown no banco
-        manual_processado.conteudo_markdown = enhanced_markdown
-        manual_processado.total_imagens = len(imagens_salvas)
-        manual_processado.save()  # Isso também gerará o embedding automaticamente
+            markdown_content = None
         
-        print(f"\nManual {manual_id} salvo no banco de dados:")
-        print(f"- Título: {manual_processado.titulo}")
-        print(f"- Total de imagens: {len(imagens_salvas)}")
-        print(f"- Total de caracteres: {len(enhanced_markdown)}")
-        print(f"- Embedding gerado: {'Sim' if manual_processado.embedding else 'Não'}")
-        
-        return enhanced_markdown
+        return salvar_manual_convertido(preparado, markdown_content)
         
     except Manual.DoesNotExist:
         print(f"Manual com ID {manual_id} não encontrado.")
@@ -272,15 +234,20 @@ def buscar_manual_com_docling(manual_id):
         print(f"Erro durante a conversão: {e}")
         return None
 
-def converter_todos_manuais():
-    """Converte todos os manuais cadastrados para markdown."""
-    manuais = Manual.objects.all()
-    print(f"Encontrados {manuais.count()} manuais para converter.")
+def converter_todos_manuais(forcar=False, processos=1):
+    """Converte todos os manuais cadastrados para markdown, pulando os que não mudaram.
+
+    Com `processos` > 1, a conversão do docling roda num pool de processos
+    (um DocumentConverter por processo); download e gravação ficam neste processo.
+    No máximo 2 conversões por processo ficam em andamento, e cada manual é
+    gravado assim que a sua conversão termina.
+    """
+    manuais = list(Manual.objects.all())
+    print(f"Encontrados {len(manuais)} manuais para converter.")
     
     resultados = []
-    for manual in manuais:
-        print(f"\n--- Convertendo Manual ID {manual.id}: {manual.title} ---")
-        markdown = buscar_manual_com_docling(manual.id)
+    
+    def registrar(manual, markdown):
         if markdown:
             resultados.append({
                 'id': manual.id,
@@ -289,16 +256,71 @@ def converter_todos_manuais():
                 'markdown': markdown
             })
     
+    if processos <= 1:
+        for manual in manuais:
+            print(f"\n--- Convertendo Manual ID {manual.id}: {manual.title} ---")
+            registrar(manual, buscar_manual_com_docling(manual.id, forcar=forcar))
+    else:
+        # 'spawn' evita herdar conexões do banco e threads do processo principal
+        contexto = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=processos, mp_context=contexto,
+                                 initializer=_iniciar_worker_conversao) as executor:
+            conversoes = {}
+            
+            def salvar_concluidas(bloquear):
+                concluidas, _ = wait(conversoes, timeout=None if bloquear else 0, return_when=FIRST_COMPLETED)
+                for futuro in concluidas:
+                    preparado = conversoes.pop(futuro)
+                    manual = preparado['manual']
+                    print(f"\n--- Salvando Manual ID {manual.id}: {manual.title} ---")
+                    try:
+                        markdown_content = futuro.result()
+                    except Exception as e:
+                        print(f"Erro na conversão com docling: {e}")
+                        markdown_content = None
+                    try:
+                        registrar(manual, salvar_manual_convertido(preparado, markdown_content))
+                    except Exception as e:
+                        print(f"Erro durante a conversão: {e}")
+            
+            for manual in manuais:
+                # 🔹 Janela limitada: página, imagens e HTML preparados não se acumulam na memória
+                while len(conversoes) >= processos * 2:
+                    salvar_concluidas(bloquear=True)
+                print(f"\n--- Preparando Manual ID {manual.id}: {manual.title} ---")
+                try:
+                    preparado = preparar_manual(manual.id, forcar=forcar)
+                except Exception as e:
+                    print(f"Erro durante a conversão: {e}")
+                    continue
+                if 'markdown' in preparado:
+                    registrar(manual, preparado['markdown'])
+                    continue
+                # Só o HTML (texto) vai para o worker; o resto fica aqui para a gravação
+                futuro = executor.submit(converter_html_para_markdown, preparado['html'], f"manual_{manual.id}.html")
+                conversoes[futuro] = preparado
+                # Grava o que já terminou enquanto o próximo manual é preparado
+                salvar_concluidas(bloquear=False)
+            
+            while conversoes:
+                salvar_concluidas(bloquear=True)
+    
     print(f"\nConversão concluída! {len(resultados)} manuais convertidos com sucesso.")
     return resultados
 
 if __name__ == "__main__":
-    import sys
+    forcar = '--forcar' in sys.argv
+    argumentos = [arg for arg in sys.argv[1:] if arg != '--forcar']
+    processos = 1
+    if '--processos' in argumentos:
+        i = argumentos.index('--processos')
+        processos = int(argumentos[i + 1])
+        del argumentos[i:i + 2]
     
-    if len(sys.argv) > 1:
+    if argumentos:
         # Converter manual específico
-        manual_id = int(sys.argv[1])
-        buscar_manual_com_docling(manual_id)
+        manual_id = int(argumentos[0])
+        buscar_manual_com_docling(manual_id, forcar=forcar)
     else:
         # Converter todos os manuais
-        converter_todos_manuais()
\ No newline at end of file
+        converter_todos_manuais(forcar=forcar, processos=processos)
\ No newline at end of file
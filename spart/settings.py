@@ -130,7 +130,7 @@ SPECTACULAR_SETTINGS = {
     ## Funcionalidades Principais
     
     ### 🤖 Agente AI Inteligente
-    - Processamento de linguagem natural com GPT-3.5-turbo
+    - Processamento de linguagem natural com gpt-4o-mini
     - Busca vetorial usando embeddings OpenAI
     - Respostas contextualizadas baseadas em manuais
     - Geração automática de áudio das respostas
@@ -149,7 +149,7 @@ SPECTACULAR_SETTINGS = {
     
     ## Modelos de IA Utilizados
     - **Embeddings**: text-embedding-ada-002 (OpenAI)
-    - **Chat**: gpt-3.5-turbo (OpenAI)
+    - **Chat**: gpt-4o-mini (OpenAI)
     - **Áudio**: gTTS (Google Text-to-Speech)
     
     ## Autenticação
@@ -200,3 +200,7 @@ SPECTACULAR_SETTINGS = {
 # Configuração da OpenAI API
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 
+# API do Movidesk (exportação das conversas de chat)
+MOVIDESK_API_URL = os.getenv('MOVIDESK_API_URL')
+MOVIDESK_API_KEY = os.getenv('MOVIDESK_API_KEY')
+
@@ -2,6 +2,9 @@ let utterance = null; // Variável global para manter o objeto da fala
 let sessionId = null; // Variável para manter o ID da sessão de conversa
 let isTyping = false; // Controla se está digitando
 let typingIndicator = null; // Referência ao indicador de digitação
+const MAX_TENTATIVAS_RETOMADA = 3; // Reconexões ao stream antes de desistir
+const REPRODUZIR_AUDIO_AUTOMATICO = true; // Toca o áudio das frases enquanto a resposta chega
+let playerFrases = null; // Player do áudio frase a frase da resposta atual
 
 // Função para formatar respostas com quebras de linha adequadas
 function formatarResposta(texto) {
@@ -140,7 +143,7 @@ function addBotMessage(message, showActions = true, imagens = []) {
     imagens.forEach(imagem => {
       imagensHtml += `
         <div class="image-container">
-          <img src="${imagem.url}" alt="${imagem.alt_text}" class="manual-image" onclick="expandirImagem('${imagem.url}', '${imagem.alt_text}')">
+          ${imagemMiniaturaHtml(imagem)}
           <div class="image-caption">${imagem.alt_text}</div>
         </div>
       `;
@@ -161,6 +164,80 @@ function addBotMessage(message, showActions = true, imagens = []) {
   return messageDiv;
 }
 
+// Função para interpretar um bloco de evento SSE (linhas id/event/data)
+function parseEventoSSE(bloco) {
+  const evento = { id: null, event: "message", data: "" };
+  const dados = [];
+  bloco.split("\n").forEach((linha) => {
+    // Comentários (keep-alive) começam com ":"
+    if (!linha || linha.startsWith(":")) return;
+    const pos = linha.indexOf(":");
+    const campo = pos === -1 ? linha : linha.slice(0, pos);
+    let valor = pos === -1 ? "" : linha.slice(pos + 1);
+    if (valor.startsWith(" ")) valor = valor.slice(1);
+    if (campo === "data") dados.push(valor);
+    else if (campo === "id") evento.id = valor;
+    else if (campo === "event") evento.event = valor;
+  });
+  evento.data = dados.join("\n");
+  return evento;
+}
+
+// Função para reconectar a uma resposta em andamento a partir do último evento
+async function retomarStream(session, ultimoEventId) {
+  const response = await fetch("api/perguntar/stream/", {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+      "Accept": "text/event-stream",
+      "Last-Event-ID": String(ultimoEventId)
+    },
+    body: JSON.stringify({ session_id: session }),
+  });
+  if (!response.ok) {
+    throw new Error(`HTTP error! status: ${response.status}`);
+  }
+  return response.body.getReader();
+}
+
+// Player dos eventos "audio" do stream: toca as frases pela ordem, mesmo que
+// os áudios fiquem prontos fora de ordem, e pula as que não têm áudio
+function criarPlayerFrases() {
+  const urls = {};
+  let proxima = 0;
+  let tocando = null;
+  let parado = false;
+
+  const tocarProxima = () => {
+    if (parado || tocando) return;
+    while (proxima in urls && !urls[proxima]) proxima++;
+    if (!(proxima in urls)) return;
+    const audio = new Audio(urls[proxima]);
+    proxima++;
+    tocando = audio;
+    const seguir = () => {
+      if (tocando !== audio) return;
+      tocando = null;
+      tocarProxima();
+    };
+    audio.onended = seguir;
+    audio.onerror = seguir;
+    audio.play().catch(seguir); // Autoplay bloqueado pelo navegador
+  };
+
+  return {
+    adicionar(evento) {
+      urls[evento.ordem] = evento.url;
+      tocarProxima();
+    },
+    parar() {
+      parado = true;
+      if (tocando) tocando.pause();
+      tocando = null;
+    },
+  };
+}
+
 // Função para enviar pergunta com streaming
 async function enviarPergunta() {
   const pergunta = document.getElementById("chat-input").value;
@@ -177,6 +254,12 @@ async function enviarPergunta() {
   // Mostrar indicador de digitação
   showTypingIndicator();
 
+  // O áudio da resposta anterior não continua tocando sobre a nova
+  if (playerFrases) playerFrases.parar();
+  playerFrases = REPRODUZIR_AUDIO_AUTOMATICO ? criarPlayerFrases() : null;
+  const player = playerFrases;
+  let liberado = false; // Interface já liberada no "done"
+
   // Preparar o corpo da requisição
   const body = {
     pergunta: pergunta
@@ -187,11 +270,17 @@ async function enviarPergunta() {
     body.session_id = sessionId;
   }
 
+  // Áudio frase a frase só quando vai ser tocado automaticamente
+  if (player) {
+    body.audio_frases = true;
+  }
+
   try {
     const response = await fetch("api/perguntar/stream/", {
       method: "POST",
       headers: {
-        "Content-Type": "application/json"
+        "Content-Type": "application/json",
+        "Accept": "text/event-stream"
       },
       body: JSON.stringify(body),
     });
@@ -216,84 +305,131 @@ async function enviarPergunta() {
     
     const contentDiv = respostaDiv.querySelector('.message-content');
 
-    // Ler o stream
-    const reader = response.body.getReader();
-    const decoder = new TextDecoder();
+    // Ler o stream SSE
     let respostaCompleta = "";
+    let buffer = "";
+    let finalizado = false;
+
+    // Texto completo: botões de áudio e campo liberado, mesmo com o áudio
+    // das últimas frases ainda chegando pelo stream
+    const concluirResposta = () => {
+      const actionsDiv = document.createElement("div");
+      actionsDiv.className = 'message-actions';
+      actionsDiv.innerHTML = `
+        <button class="action-button" onclick="falarTexto('${respostaCompleta.replace(/'/g, "\\'")}')">🔊 Ouvir</button>
+              <button class="action-button" onclick="pararFala()">⏹ Parar</button>
+      `;
+      respostaDiv.appendChild(actionsDiv);
+      liberado = true;
+      isTyping = false;
+      document.getElementById("send-button").disabled = false;
+      document.getElementById("chat-input").focus();
+    };
+
+    const processarEvento = (evento) => {
+      if (!evento.data) return;
+      let parsed;
+      try {
+        parsed = JSON.parse(evento.data);
+      } catch (e) {
+        return; // Ignorar dados que não são JSON válido
+      }
+      if (parsed.content) {
+        respostaCompleta += parsed.content;
+        contentDiv.innerHTML = formatarResposta(respostaCompleta);
+        scrollToBottom();
+      }
+      if (parsed.session_id) {
+        sessionId = parsed.session_id;
+      }
+      if (parsed.error) {
+        throw new Error(parsed.error);
+      }
+      // Áudio de uma frase pronto no servidor
+      if (parsed.audio) {
+        if (player) player.adicionar(parsed.audio);
+      }
+      // Armazenar dados da resposta para uso posterior
+      if (parsed.imagens) {
+        window.lastResponseData = { imagens: parsed.imagens };
+      }
+      // Verificar se é o final do streaming
+      if (parsed.done) {
+        // Processar imagens se disponíveis
+        if (parsed.imagens && parsed.imagens.length > 0) {
+          const imagensDiv = document.createElement("div");
+          imagensDiv.className = 'message-images';
+          parsed.imagens.forEach((imagem) => {
+            const imageContainer = document.createElement("div");
+            imageContainer.className = 'image-container';
+            imageContainer.innerHTML = `
+              ${imagemMiniaturaHtml(imagem)}
+              <div class="image-caption">${imagem.alt_text}</div>
+            `;
+            imagensDiv.appendChild(imageContainer);
+          });
+          respostaDiv.appendChild(imagensDiv);
+        }
+        finalizado = true;
+        concluirResposta();
+      }
+    };
+
+    let reader = response.body.getReader();
+    let decoder = new TextDecoder();
+    let ultimoEventId = 0;
+    let tentativas = 0;
 
+    // Depois do "done" o stream segue aberto até o último evento de áudio
     while (true) {
-      const { done, value } = await reader.read();
-      if (done) break;
-
-      const chunk = decoder.decode(value, { stream: true });
-      const lines = chunk.split("\n");
-
-      for (const line of lines) {
-        if (line.startsWith("data: ")) {
-          const data = line.slice(6);
-          if (data === "[DONE]") {
-            break;
-          }
-          try {
-            const parsed = JSON.parse(data);
-            if (parsed.content) {
-              respostaCompleta += parsed.content;
-              contentDiv.innerHTML = formatarResposta(respostaCompleta);
-              scrollToBottom();
-            }
-            if (parsed.session_id) {
-              sessionId = parsed.session_id;
-            }
-            // Armazenar dados da resposta para uso posterior
-            if (parsed.imagens) {
-              window.lastResponseData = { imagens: parsed.imagens };
-            }
-            // Verificar se é o final do streaming
-            if (parsed.done) {
-              // Processar imagens se disponíveis
-              if (parsed.imagens && parsed.imagens.length > 0) {
-                const imagensDiv = document.createElement("div");
-                imagensDiv.className = 'message-images';
-                parsed.imagens.forEach((imagem) => {
-                  const imageContainer = document.createElement("div");
-                  imageContainer.className = 'image-container';
-                  imageContainer.innerHTML = `
-                    <img src="${imagem.url}" alt="${imagem.alt_text}" class="manual-image" onclick="expandirImagem('${imagem.url}', '${imagem.alt_text}')">
-                    <div class="image-caption">${imagem.alt_text}</div>
-                  `;
-                  imagensDiv.appendChild(imageContainer);
-                });
-                respostaDiv.appendChild(imagensDiv);
-              }
-              break;
-            }
-          } catch (e) {
-            // Ignorar linhas que não são JSON válido
-          }
+      let leitura;
+      try {
+        leitura = await reader.read();
+      } catch (e) {
+        leitura = { done: true }; // Conexão caiu no meio da resposta
+      }
+
+      if (leitura.done) {
+        if (finalizado) break;
+        // Stream encerrado antes do fim: retoma a partir do último evento
+        // recebido, sem disparar uma nova geração no servidor
+        if (!sessionId || tentativas >= MAX_TENTATIVAS_RETOMADA) {
+          throw new Error("Conexão interrompida antes do fim da resposta");
         }
+        tentativas++;
+        await new Promise((resolve) => setTimeout(resolve, 1000 * tentativas));
+        reader = await retomarStream(sessionId, ultimoEventId);
+        decoder = new TextDecoder();
+        buffer = "";
+        continue;
       }
-    }
 
-    // As imagens já foram processadas durante o streaming
-    
-    // Adicionar botões de áudio após a resposta completa
-    const actionsDiv = document.createElement("div");
-    actionsDiv.className = 'message-actions';
-    actionsDiv.innerHTML = `
-      <button class="action-button" onclick="falarTexto('${respostaCompleta.replace(/'/g, "\\'")}')">🔊 Ouvir</button>
-            <button class="action-button" onclick="pararFala()">⏹ Parar</button>
-    `;
-    respostaDiv.appendChild(actionsDiv);
+      buffer += decoder.decode(leitura.value, { stream: true });
+
+      // Eventos SSE são separados por uma linha em branco
+      let separador;
+      while ((separador = buffer.indexOf("\n\n")) !== -1) {
+        const bloco = buffer.slice(0, separador);
+        buffer = buffer.slice(separador + 2);
+        const evento = parseEventoSSE(bloco);
+        if (evento.id) {
+          ultimoEventId = parseInt(evento.id, 10);
+        }
+        processarEvento(evento);
+      }
+    }
 
   } catch (error) {
     console.error("Erro ao enviar pergunta:", error);
     hideTypingIndicator();
     addBotMessage(`Erro: ${error.message}`, false);
   } finally {
-     // Reabilitar interface
-     isTyping = false;
-     document.getElementById("send-button").disabled = false;
-     document.getElementById("chat-input").focus();
+     // Reabilitar interface (se ainda não foi liberada: outra pergunta pode estar em andamento)
+     if (!liberado) {
+       isTyping = false;
+       document.getElementById("send-button").disabled = false;
+       document.getElementById("chat-input").focus();
+     }
    }
 }
 
@@ -320,6 +456,14 @@ function pararFala() {
   if ('speechSynthesis' in window && utterance) {
     speechSynthesis.cancel(); // Cancela a fala em andamento
   }
+  if (playerFrases) playerFrases.parar();
+}
+
+// Miniatura WebP no card; a imagem original só é baixada ao ampliar
+function imagemMiniaturaHtml(imagem) {
+  const srcset = imagem.srcset ? ` srcset="${imagem.srcset}" sizes="(max-width: 600px) 50vw, 320px"` : '';
+  const dimensoes = imagem.largura && imagem.altura ? ` width="${imagem.largura}" height="${imagem.altura}"` : '';
+  return `<img src="${imagem.thumbnail || imagem.url}"${srcset}${dimensoes} loading="lazy" decoding="async" alt="${imagem.alt_text}" class="manual-image" onclick="expandirImagem('${imagem.url}', '${imagem.alt_text}')">`;
 }
 
 // Função para expandir imagem em modal